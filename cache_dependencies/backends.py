@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import time
+import random
+import sqlite3
+import threading
+from cache_dependencies import interfaces, utils
+from cache_dependencies.cache import AbstractCache
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class SqliteCache(AbstractCache, interfaces.ITaggedCache):
+    """Embedded persistent cache backend based on SQLite (WAL mode).
+
+    Keeps tag to key index in separate table, so, tag invalidation
+    deletes all tagged records by one indexed statement.
+    """
+
+    # Max count of SQL variables in a statement for old versions of SQLite is 999.
+    MAX_VARIABLES = 499
+    CULL_PROBABILITY = 0.01
+
+    def __init__(self, path, default_timeout=300, key_prefix='', version=1):
+        """
+        :type path: str
+        :type default_timeout: int
+        :type key_prefix: str
+        :type version: int
+        """
+        self.path = path
+        self.default_timeout = default_timeout
+        self.key_prefix = key_prefix
+        self.version = version
+        self._local = threading.local()
+        self._create_schema()
+
+    def add(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache_entry WHERE key = ? AND expires <= ?", (key, time.time()))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)",
+                (key, self.pack(value), self.get_expiration(timeout))
+            )
+            return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._connection().execute(
+            "SELECT value FROM cache_entry WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return default
+        return self.unpack(row[0], default)
+
+    def get_many(self, keys, version=None):
+        made_keys = {}
+        for key in keys:
+            made_key = self.make_key(key, version=version)
+            self.validate_key(made_key)
+            made_keys[made_key] = key
+        result = {}
+        conn = self._connection()
+        now = time.time()
+        for chunk in self._chunks(list(made_keys)):
+            rows = conn.execute(
+                "SELECT key, value FROM cache_entry WHERE key IN ({0}) AND expires > ?".format(
+                    self._placeholders(chunk)
+                ),
+                chunk + [now]
+            )
+            for made_key, value in rows:
+                value = self.unpack(value)
+                if value is not None:
+                    result[made_keys[made_key]] = value
+        return result
+
+    def set(self, key, value, timeout=None, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=None, version=None):
+        self._set_many(data, (), timeout, version)
+
+    def set_tagged(self, key, value, tags, timeout=None, version=None):
+        self._set_many({key: value}, tags, timeout, version)
+
+    def delete(self, key, version=None):
+        self.delete_many((key,), version)
+
+    def delete_many(self, keys, version=None):
+        """Deletes records and all records tagged by them."""
+        made_keys = [self.make_key(key, version=version) for key in keys]
+        for made_key in made_keys:
+            self.validate_key(made_key)
+        with self._connection() as conn:
+            for chunk in self._chunks(made_keys):
+                placeholders = self._placeholders(chunk)
+                conn.execute(
+                    "DELETE FROM cache_entry WHERE key IN ({0}) "
+                    "OR key IN (SELECT key FROM cache_tag WHERE tag IN ({0}))".format(placeholders),
+                    chunk + chunk
+                )
+                conn.execute(
+                    "DELETE FROM cache_tag WHERE key IN ({0}) "
+                    "OR key IN (SELECT key FROM cache_tag WHERE tag IN ({0}))".format(placeholders),
+                    chunk + chunk
+                )
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._connection().execute(
+            "SELECT 1 FROM cache_entry WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache_entry")
+            conn.execute("DELETE FROM cache_tag")
+
+    def cull(self):
+        """Removes expired records and their tag index."""
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM cache_tag WHERE key IN (SELECT key FROM cache_entry WHERE expires <= ?)",
+                (time.time(),)
+            )
+            conn.execute("DELETE FROM cache_entry WHERE expires <= ?", (time.time(),))
+
+    def close(self, **kwargs):
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            del self._local.connection
+
+    def get_expiration(self, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.time() + timeout
+
+    @staticmethod
+    def pack(value):
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def unpack(pickled, default=None):
+        try:
+            return pickle.loads(bytes(pickled))
+        except pickle.PickleError:
+            return default
+
+    def _set_many(self, data, tags, timeout, version):
+        expires = self.get_expiration(timeout)
+        made_data = {}
+        for key, value in data.items():
+            made_key = self.make_key(key, version=version)
+            self.validate_key(made_key)
+            made_data[made_key] = value
+        made_tags = [self.make_key(utils.make_tag_key(tag), version=version) for tag in tags]
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)",
+                [(made_key, self.pack(value), expires) for made_key, value in made_data.items()]
+            )
+            for chunk in self._chunks(list(made_data)):
+                conn.execute("DELETE FROM cache_tag WHERE key IN ({0})".format(self._placeholders(chunk)), chunk)
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)",
+                [(made_tag, made_key) for made_key in made_data for made_tag in made_tags]
+            )
+        if random.random() < self.CULL_PROBABILITY:
+            self.cull()
+
+    def _connection(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return conn
+
+    def _create_schema(self):
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entry ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_tag ("
+                "tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_tag_key ON cache_tag (key)")
+
+    @classmethod
+    def _chunks(cls, items):
+        for i in range(0, len(items), cls.MAX_VARIABLES):
+            yield items[i:i + cls.MAX_VARIABLES]
+
+    @staticmethod
+    def _placeholders(items):
+        return ', '.join('?' * len(items))
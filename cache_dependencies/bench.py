@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""Standalone benchmarks of cache_dependencies, which do not require Django.
+
+Usage::
+
+    python -m cache_dependencies.bench
+    python -m cache_dependencies.bench -k get_many --backend sqlite --repeat 500
+    python -m cache_dependencies.bench --json > result.json
+    python -m cache_dependencies.bench --compare baseline.json --threshold 20
+
+Each scenario is measured per call. The report contains percentiles of time
+(in microseconds) and allocated memory per call (if tracemalloc is available).
+With --compare the exit status is 1 if median of any scenario is slower
+than in baseline by more than threshold percents.
+"""
+from __future__ import absolute_import, division, unicode_literals
+import gc
+import os
+import sys
+import time
+import json
+import pickle
+import shutil
+import argparse
+import platform
+import tempfile
+from collections import OrderedDict
+
+import cache_dependencies
+from cache_dependencies import locks, relations, transaction, nocache
+from cache_dependencies.cache import AbstractCache
+from cache_dependencies.tagging import CacheTagging
+from cache_dependencies.backends import SqliteCache
+
+try:
+    from time import perf_counter as timer
+except ImportError:  # Python 2.* compatible
+    from time import time as timer
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2.* compatible
+    tracemalloc = None
+
+try:
+    import django
+except ImportError:  # Template scenarios are measured only if Django is installed
+    django = None
+
+ISOLATION_LEVELS = ('READ UNCOMMITTED', 'READ COMMITTED', 'REPEATABLE READ', 'SERIALIZABLE')
+
+
+class MemoryCache(AbstractCache):
+    """In-memory backend, values are pickled like by the most of real backends."""
+
+    def __init__(self, default_timeout=300):
+        self._cache = {}
+        self.default_timeout = default_timeout
+
+    def add(self, key, value, timeout=None, version=None):
+        if self.has_key(key, version):
+            return False
+        self.set(key, value, timeout, version)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        pickled, expires_at = self._cache.get(key, (None, None))
+        if pickled is None or (expires_at is not None and expires_at <= time.time()):
+            return default
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=None, version=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self._cache[self.make_key(key, version=version)] = (
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + timeout
+        )
+
+    def delete(self, key, version=None):
+        self._cache.pop(self.make_key(key, version=version), None)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class StubBackendFactory(object):
+    name = 'stub'
+
+    def __call__(self):
+        return MemoryCache()
+
+    def close(self):
+        pass
+
+
+class SqliteBackendFactory(object):
+    name = 'sqlite'
+
+    def __init__(self):
+        self._path = tempfile.mkdtemp(prefix='cache_dependencies_bench_')
+        self._count = 0
+
+    def __call__(self):
+        self._count += 1
+        return SqliteCache(os.path.join(self._path, 'cache{0}.db'.format(self._count)))
+
+    def close(self):
+        shutil.rmtree(self._path, ignore_errors=True)
+
+
+BACKENDS = {
+    StubBackendFactory.name: StubBackendFactory,
+    SqliteBackendFactory.name: SqliteBackendFactory,
+}
+
+
+def make_cache(backend, isolation_level='READ COMMITTED', **kwargs):
+    """
+    :type backend: cache_dependencies.interfaces.ICache
+    :rtype: cache_dependencies.tagging.CacheTagging
+    """
+    lock = locks.DependencyLock.make(isolation_level, lambda: backend, 0)
+    return CacheTagging(backend, relations.RelationManager(), transaction.TransactionManager(lock), **kwargs)
+
+
+class Scenario(object):
+    """Abstract scenario. setup() is called once, run() is measured."""
+    name = None
+
+    def __init__(self, backend_factory):
+        self.cache = make_cache(backend_factory())
+
+    def setup(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+
+class GetValidScenario(Scenario):
+    name = 'get_valid'
+
+    def setup(self):
+        self.cache.set('name1', 'value1', ('tag1', 'tag2', 'tag3', 'tag4'), 3600)
+
+    def run(self):
+        self.cache.get('name1')
+
+
+class GetInvalidScenario(Scenario):
+    name = 'get_invalid'
+
+    def setup(self):
+        self.cache.set('name1', 'value1' * 1000, ('tag1', 'tag2', 'tag3', 'tag4'), 3600)
+        self.cache.invalidate_tags('tag1')
+
+    def run(self):
+        self.cache.get('name1')
+
+
+class GetManyScenario(Scenario):
+    size = None
+
+    def setup(self):
+        self.keys = ['name{0}'.format(i) for i in range(self.size)]
+        for i, key in enumerate(self.keys):
+            self.cache.set(key, 'value{0}'.format(i), ('tag{0}'.format(i % 10), 'common'), 3600)
+
+    def run(self):
+        self.cache.get_many(self.keys)
+
+
+def _make_get_many_scenario(size):
+    return type(str('GetMany{0}Scenario'.format(size)), (GetManyScenario,), {
+        'name': 'get_many_{0}'.format(size), 'size': size,
+    })
+
+
+class SetEvaluateScenario(Scenario):
+    """Set within transaction, so, dependency is evaluated with lock checks."""
+    isolation_level = None
+
+    def __init__(self, backend_factory):
+        self.cache = make_cache(backend_factory(), self.isolation_level)
+        self.counter = 0
+
+    def run(self):
+        self.counter += 1
+        self.cache.transaction.begin()
+        self.cache.set('name{0}'.format(self.counter % 100), 'value', ('tag1', 'tag2', 'tag3'), 3600)
+        self.cache.transaction.finish()
+
+
+def _make_set_evaluate_scenario(isolation_level):
+    suffix = isolation_level.lower().replace(' ', '_')
+    return type(str('SetEvaluate{0}Scenario'.format(suffix.title().replace('_', ''))), (SetEvaluateScenario,), {
+        'name': 'set_evaluate_{0}'.format(suffix), 'isolation_level': isolation_level,
+    })
+
+
+class NestedRelationsScenario(Scenario):
+    """Outer fragment is rebuilt because of invalidation of inner fragment."""
+    name = 'nested_relations'
+    depth = 5
+
+    def run(self):
+        self.cache.invalidate_tags('tag{0}'.format(self.depth - 1))
+        for i in range(self.depth):
+            self.cache.get('name{0}'.format(i))
+        for i in reversed(range(self.depth)):
+            self.cache.set('name{0}'.format(i), 'value{0}'.format(i), ('tag{0}'.format(i),), 3600)
+
+
+class InvalidationBurstScenario(Scenario):
+    name = 'invalidation_burst'
+    size = 100
+
+    def setup(self):
+        self.tags = ['tag{0}'.format(i) for i in range(self.size)]
+
+    def run(self):
+        self.cache.transaction.begin()
+        for tag in self.tags:
+            self.cache.invalidate_tags(tag)
+        self.cache.transaction.finish()
+
+
+class TransactionNestingScenario(Scenario):
+    name = 'transaction_nesting'
+    depth = 5
+
+    def run(self):
+        for i in range(self.depth):
+            self.cache.transaction.begin()
+            self.cache.invalidate_tags('tag{0}'.format(i))
+        for i in range(self.depth):
+            self.cache.transaction.finish()
+
+
+class NocacheRenderScenario(Scenario):
+    """Post-processing of cached template fragment with nocache blocks."""
+    name = 'nocache_render'
+
+    def setup(self):
+        self.nocache = nocache.NoCache('secret')
+        block = '{0}echo(user, ": ", count){1}'.format(self.nocache.start(count=1), self.nocache.end())
+        self.template = ('<div class="item">text</div>\n' * 20 + block) * 10
+
+    def run(self):
+        self.nocache.handle(self.template, user='user')
+
+
+class TemplateRenderScenario(Scenario):
+    """Rendering of template with valid {% cache_tagging %} fragments.
+
+    Requires Django, which is configured with locmem backend, if it's not configured yet.
+    So, the backend option does not affect this scenario.
+    """
+    name = 'template_render'
+    size = 20
+    source = (
+        '{% load cache_tagging_tags %}'
+        '{% for entry in entries %}'
+        '{% cache_tagging "entry"|concat:entry "blog.entry.pk:"|concat:entry "blog.entry" timeout=3600 %}'
+        '<div class="entry">{{ entry }}</div>'
+        '{% end_cache_tagging %}'
+        '{% endfor %}'
+    )
+
+    def __init__(self, backend_factory):
+        from django.conf import settings
+        if not settings.configured:
+            settings.configure(
+                SECRET_KEY='bench',
+                INSTALLED_APPS=['django_cache_dependencies'],
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates'}],
+            )
+            django.setup()
+        from django.template import engines
+        self.template = engines['django'].from_string(self.source)
+        self.context = {'entries': list(range(self.size))}
+
+    def setup(self):
+        self.template.render(self.context)
+
+    def run(self):
+        self.template.render(self.context)
+
+
+class TemplateRenderBatchScenario(TemplateRenderScenario):
+    """The same fragments are fetched by single query of {% cache_tagging_batch %}."""
+    name = 'template_render_batch'
+    source = TemplateRenderScenario.source.replace(
+        '{% for entry in entries %}', '{% cache_tagging_batch %}{% for entry in entries %}'
+    ).replace(
+        '{% endfor %}', '{% endfor %}{% end_cache_tagging_batch %}'
+    )
+
+
+SCENARIOS = [
+    GetValidScenario,
+    GetInvalidScenario,
+] + [_make_get_many_scenario(size) for size in (10, 100, 1000)] + [
+    _make_set_evaluate_scenario(isolation_level) for isolation_level in ISOLATION_LEVELS
+] + [
+    NestedRelationsScenario,
+    InvalidationBurstScenario,
+    TransactionNestingScenario,
+    NocacheRenderScenario,
+] + ([TemplateRenderScenario, TemplateRenderBatchScenario] if django is not None else [])
+
+
+def percentile(sorted_values, percent):
+    """
+    :type sorted_values: list[float]
+    :type percent: float
+    :rtype: float
+    """
+    if not sorted_values:
+        return 0.0
+    index = (len(sorted_values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+
+def measure(scenario, repeat, warmup=10):
+    """Returns statistics of scenario.
+
+    :type scenario: cache_dependencies.bench.Scenario
+    :type repeat: int
+    :type warmup: int
+    :rtype: collections.OrderedDict
+    """
+    scenario.setup()
+    for i in range(warmup):
+        scenario.run()
+
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start = timer()
+            scenario.run()
+            timings.append((timer() - start) * 1e6)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    timings.sort()
+
+    result = OrderedDict([
+        ('name', scenario.name),
+        ('repeat', repeat),
+        ('min_us', timings[0]),
+        ('mean_us', sum(timings) / len(timings)),
+        ('p50_us', percentile(timings, 50)),
+        ('p90_us', percentile(timings, 90)),
+        ('p99_us', percentile(timings, 99)),
+        ('max_us', timings[-1]),
+    ])
+    if tracemalloc is not None:
+        # Measured separately, because tracing slows down calls.
+        allocations = []
+        tracemalloc.start()
+        try:
+            for i in range(min(repeat, 100)):
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.clear_traces()
+                current = tracemalloc.get_traced_memory()[0]
+                scenario.run()
+                allocations.append(tracemalloc.get_traced_memory()[1] - current)
+        finally:
+            tracemalloc.stop()
+        allocations.sort()
+        result['alloc_peak_p50_bytes'] = percentile(allocations, 50)
+        result['alloc_peak_max_bytes'] = allocations[-1]
+    return result
+
+
+def run(names=None, backend='stub', repeat=200):
+    """Runs scenarios, which names contain any of names.
+
+    :type names: list[str] or None
+    :type backend: str
+    :type repeat: int
+    :rtype: collections.OrderedDict
+    """
+    backend_factory = BACKENDS[backend]()
+    try:
+        results = []
+        for scenario_class in SCENARIOS:
+            if names and not any(name in scenario_class.name for name in names):
+                continue
+            try:
+                results.append(measure(scenario_class(backend_factory), repeat))
+            except Exception as e:  # Failure of one scenario should not hide the others.
+                results.append(OrderedDict([
+                    ('name', scenario_class.name),
+                    ('error', '{0}: {1}'.format(e.__class__.__name__, e)),
+                ]))
+    finally:
+        backend_factory.close()
+    return OrderedDict([
+        ('version', cache_dependencies.__version__),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('backend', backend),
+        ('results', results),
+    ])
+
+
+def compare(report, baseline, threshold):
+    """Returns regressions of median time relative to baseline.
+
+    Failed scenario is a regression too, if it did not fail in baseline.
+
+    :type report: dict
+    :type baseline: dict
+    :type threshold: float
+    :rtype: list[(str, float, float)]
+    """
+    baseline_results = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        base = baseline_results.get(result['name'])
+        if base is None or 'error' in base:
+            continue
+        if 'error' in result:
+            regressions.append((result['name'], base['p50_us'], float('inf')))
+        elif result['p50_us'] > base['p50_us'] * (1 + threshold / 100):
+            regressions.append((result['name'], base['p50_us'], result['p50_us']))
+    return regressions
+
+
+def format_report(report):
+    """
+    :type report: dict
+    :rtype: str
+    """
+    columns = ('p50_us', 'p90_us', 'p99_us', 'mean_us', 'alloc_peak_p50_bytes')
+    lines = ['cache_dependencies {0}, {1} {2}, backend {3}'.format(
+        report['version'], report['implementation'], report['python'], report['backend']
+    )]
+    lines.append('{0:<34}'.format('scenario') + ''.join('{0:>22}'.format(column) for column in columns))
+    for result in report['results']:
+        if 'error' in result:
+            lines.append('{0:<34}{1}'.format(result['name'], result['error']))
+            continue
+        lines.append('{0:<34}'.format(result['name']) + ''.join(
+            '{0:>22.1f}'.format(result[column]) if column in result else '{0:>22}'.format('-')
+            for column in columns
+        ))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of cache_dependencies.')
+    parser.add_argument('-k', dest='names', nargs='*', help='Run scenarios which names contain any of given strings')
+    parser.add_argument('--backend', choices=sorted(BACKENDS.keys()), default='stub')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='Print machine-readable report')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON report to compare median time with')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed slowdown, in percents')
+    args = parser.parse_args(argv)
+
+    report = run(args.names, args.backend, args.repeat)
+    if args.json:
+        sys.stdout.write(json.dumps(report, indent=2) + '\n')
+    else:
+        sys.stdout.write(format_report(report) + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, base, current in regressions:
+            sys.stderr.write('Regression of {0}: {1:.1f}us -> {2:.1f}us\n'.format(name, base, current))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
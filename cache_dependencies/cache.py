@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 import warnings
-from cache_dependencies import interfaces, exceptions, dependencies
+from cache_dependencies import interfaces, exceptions, dependencies, index, utils, writers, serializers
+from cache_dependencies import instrumentation
+from cache_dependencies.utils import Undef
 
 try:
     str = unicode  # Python 2.* compatible
@@ -15,17 +17,47 @@ except NameError:
 class CacheWrapper(object):  # Adapter
     """Supports for Django dependency."""
 
-    def __init__(self, cache, relation_manager, transaction):
+    def __init__(self, cache, relation_manager, transaction, tag_index=None, write_behind=False, writer=None,
+                 compressor=None, compress_threshold=1024, serializer=None, metrics=None,
+                 tracer=None, async_invalidation=False, pickle_dependencies=False):
         """Constructor of cache instance.
 
+        Values are serialized by serializer (pickle by default), except bytes and text.
+        Values, which are serialized to compress_threshold bytes or more,
+        are compressed by compressor, if it's given.
+        Writer executes only writes of records, unless async_invalidation is True.
+        Dependencies of custom types are pickled only if pickle_dependencies is True.
+
         :type cache: cache_dependencies.interfaces.ICache
         :type relation_manager: cache_dependencies.interfaces.IRelationManager
         :type transaction: cache_dependencies.interfaces.ITransactionManager
+        :type tag_index: cache_dependencies.interfaces.ITagIndex or None
+        :type write_behind: bool
+        :type writer: cache_dependencies.interfaces.IWriter or None
+        :type compressor: cache_dependencies.interfaces.ICompressor or None
+        :type compress_threshold: int
+        :type serializer: cache_dependencies.interfaces.ISerializer or None
+        :type metrics: cache_dependencies.interfaces.IOutcomeMetrics or None
+        :type tracer: cache_dependencies.interfaces.ITracer or None
+        :type async_invalidation: bool
+        :type pickle_dependencies: bool
         """
         self.cache = cache
         self.ignore_descendants = False
         self.transaction = transaction
         self.relation_manager = relation_manager
+        self.tag_index = tag_index or index.DummyTagIndex()
+        self.write_behind = write_behind
+        self._pending = []
+        self.writer = writer or writers.DummyWriter(lambda: self.cache)
+        self.async_invalidation = async_invalidation
+        self._prefetched = {}
+        self._recorded_reads = None
+        self.record_serializer = serializers.RecordSerializer(
+            serializer, compressor, compress_threshold, pickle_dependencies
+        )
+        self.metrics = metrics or instrumentation.DummyOutcomeMetrics()
+        self.tracer = tracer or instrumentation.DummyTracer()
 
     def get_or_set_callback(self, key, callback, dependency, timeout=None,
                             version=None, args=None, kwargs=None):
@@ -59,22 +91,40 @@ class CacheWrapper(object):  # Adapter
         :type version: int or None
         :type abort: bool
         """
-        if not abort and not self.ignore_descendants:
-            self.begin(key)
-        data = self.cache.get(key, None, version)
-        if data is None:
-            return default
-
-        value, dependency = self._unpack_data(data)
-
-        deferred = dependency.validate(self.cache, version)
-        try:
-            deferred.get()
-        except exceptions.DependencyInvalid:
-            return default
-
-        self.finish(key, dependency, version=version)
-        return value
+        with self.tracer.span('get', (key,)) as span:
+            if not abort and not self.ignore_descendants:
+                self.begin(key)
+            cache = self._get_reader()
+            data = cache.get(key, None, version)
+            if data is None:
+                self._record_reads((key,), (), version)
+                self.metrics.add(instrumentation.MISS, key)
+                span.set(outcome=instrumentation.MISS)
+                return default
+
+            # Value is decoded only if the record is valid.
+            value, dependency = self._unpack_data_lazy(data)
+            self._record_reads((key,), (dependency,), version)
+
+            deferred = dependency.validate(cache, version)
+            try:
+                deferred.get()
+            except exceptions.DependencyInvalid as e:
+                invalid_tags = self._get_invalid_tags(e)
+                self.metrics.add(instrumentation.INVALID, key, invalid_tags)
+                span.set(outcome=instrumentation.INVALID, tags=invalid_tags)
+                return default
+
+            value = value.get()
+            if value is None:  # Value can't be decoded, see RecordSerializer.loads()
+                self.metrics.add(instrumentation.MISS, key)
+                span.set(outcome=instrumentation.MISS)
+                return default
+
+            self.metrics.add(instrumentation.HIT, key)
+            span.set(outcome=instrumentation.HIT)
+            self.finish(key, dependency, version=version)
+            return value
 
     def get_many(self, keys, version=None, abort=False):
         """
@@ -82,30 +132,48 @@ class CacheWrapper(object):  # Adapter
         :type version: int or None
         :type abort: bool
         """
-        if not abort and not self.ignore_descendants:
-            current_cache_node = self.relation_manager.current()
+        with self.tracer.span('get_many', keys) as span:
+            if not abort and not self.ignore_descendants:
+                current_cache_node = self.relation_manager.current()
+                for key in keys:
+                    self.begin(key)
+                    self.relation_manager.current(current_cache_node)
+
+            cache = self._get_reader()
+            caches = cache.get_many(keys, version)
+
+            cache_values, cache_dependencies = dict(), dict()
+            for key, data in caches.items():
+                cache_values[key], cache_dependencies[key] = self._unpack_data_lazy(data)
+            self._record_reads(keys, cache_dependencies.values(), version)
+
+            dependencies_reversed = {v: k for k, v in cache_dependencies.items()}
+            composite_dependency = dependencies.CompositeDependency(*cache_dependencies.values())
+            deferred = composite_dependency.validate(cache, version)
+            try:
+                deferred.get()
+            except exceptions.DependencyInvalid as composite_error:
+                for dependency_error in composite_error:
+                    key = dependencies_reversed[dependency_error.dependency]
+                    if cache_values.pop(key, None) is not None:
+                        self.metrics.add(instrumentation.INVALID, key, self._get_invalid_tags(dependency_error))
+
+            invalid = len(caches) - len(cache_values)
+            result = dict()
+            for key, value in cache_values.items():  # Looping through filtered result
+                value = value.get()
+                if value is not None:  # Value can't be decoded, see RecordSerializer.loads()
+                    result[key] = value
+            misses = 0
             for key in keys:
-                self.begin(key)
-                self.relation_manager.current(current_cache_node)
-
-        caches = self.cache.get_many(keys, version)
-
-        cache_values, cache_dependencies = dict(), dict()
-        for key, data in caches.items():
-            cache_values[key], cache_dependencies[key] = self._unpack_data(data)
-
-        dependencies_reversed = {v: k for k, v in cache_dependencies.items()}
-        composite_dependency = dependencies.CompositeDependency(*cache_dependencies.values())
-        deferred = composite_dependency.validate(self.cache, version)
-        try:
-            deferred.get()
-        except exceptions.DependencyInvalid as composite_error:
-            for dependency_error in composite_error:
-                cache_values.pop(dependencies_reversed[dependency_error.dependency], None)
-
-        for key in cache_values:  # Looping through filtered result
-            self.finish(key, cache_dependencies[key], version=version)
-        return cache_values
+                if key not in caches or (key in cache_values and key not in result):
+                    misses += 1
+                    self.metrics.add(instrumentation.MISS, key)
+            for key in result:
+                self.metrics.add(instrumentation.HIT, key)
+                self.finish(key, cache_dependencies[key], version=version)
+            span.set(hits=len(result), misses=misses, invalid=invalid)
+            return result
 
     def set(self, key, value, dependency=None, timeout=None, version=None):
         """Sets cache value and dependency.
@@ -116,23 +184,33 @@ class CacheWrapper(object):  # Adapter
         :type timeout: int or None
         :type version: int or None
         """
-        if dependency is None:
-            dependency = dependencies.DummyDependency()
-        combined_dependency_with_descendants = dependencies.CompositeDependency()
-        combined_dependency_with_descendants.extend(dependency)
-        combined_dependency_with_descendants.extend(self.relation_manager.get(key).get_dependency(version))
-
-        try:
-            self.transaction.current().evaluate(combined_dependency_with_descendants, version)
-            # if tags will be invalidated again during this time by concurrent transaction - no problem, we just
-            # save cache with invalid tags, and no one can read this cache.
-        except exceptions.DependencyLocked:
-            pass
-        else:
-            return self.cache.set(key, self._pack_data(value, combined_dependency_with_descendants), timeout, version)
-        finally:
-            self.finish(key, dependency, version=version)
-
+        with self.tracer.span('set', (key,)) as span:
+            if dependency is None:
+                dependency = dependencies.DummyDependency()
+            self._prefetched.get(version, {}).pop(key, None)
+            combined_dependency_with_descendants = dependencies.CompositeDependency()
+            combined_dependency_with_descendants.extend(dependency)
+            combined_dependency_with_descendants.extend(self.relation_manager.get(key).get_dependency(version))
+
+            try:
+                self.transaction.current().evaluate(combined_dependency_with_descendants, version)
+                # if tags will be invalidated again during this time by concurrent transaction - no problem, we just
+                # save cache with invalid tags, and no one can read this cache.
+            except exceptions.DependencyLocked as e:
+                locked_tags = set(e.items)
+                self.metrics.add(instrumentation.LOCKED, key, locked_tags)
+                span.set(outcome=instrumentation.LOCKED, tags=locked_tags)
+            else:
+                data = self._pack_data(value, combined_dependency_with_descendants)
+                tags = self._get_tags(combined_dependency_with_descendants)
+                span.set(tags=tags)
+                if self.write_behind:
+                    # Tag versions are already evaluated, only the write is deferred.
+                    self._pending.append((key, data, tags, timeout, version))
+                else:
+                    self.writer.submit(self._write, ([(key, data, tags)], timeout, version))
+            finally:
+                self.finish(key, dependency, version=version)
 
     def invalidate_dependency(self, dependency, version=None):
         """Invalidate dependency.
@@ -140,8 +218,70 @@ class CacheWrapper(object):  # Adapter
         :type dependency: cache_dependencies.interfaces.IDependency
         :type version: int or None
         """
-        self.transaction.current().add_dependency(dependency, version=version)
-        dependency.invalidate(self.cache, version)
+        with self.tracer.span('invalidate_dependency') as span:
+            self.transaction.current().add_dependency(dependency, version=version)
+            tags = self._get_tags(dependency)
+            span.set(tags=tags)
+            for prefetched in self._prefetched.values():
+                for tag in tags:
+                    prefetched.pop(utils.make_tag_key(tag), None)
+            if tags and self._pending:
+                # Buffered values are built from the invalidated data, writing of them is useless.
+                self._pending = [entry for entry in self._pending if not tags & entry[2]]
+            if self.async_invalidation:
+                # The invalidation becomes visible later, even for the current thread.
+                self.writer.submit(self._invalidate, (dependency, tags, version), barrier=True)
+                return
+            if isinstance(self.cache, interfaces.ITaggedCache):
+                # Validity of tagged records is kept by backend, so, the records submitted
+                # earlier must not be written after the invalidation.
+                self.writer.flush()
+            self._invalidate(self.cache, dependency, tags, version)
+
+    def prefetch(self, keys=(), tags=(), version=None):
+        """Fetches records and tag versions at once, and keeps them until close().
+
+        Subsequent reads of these records are served from memory. If tags of the records
+        are not hinted, they are fetched by the second query.
+        Prefetched tag versions are a snapshot, only invalidations of the current thread are visible.
+
+        :type keys: collections.Iterable[str]
+        :type tags: collections.Iterable[str]
+        :type version: int or None
+        """
+        if isinstance(self.cache, interfaces.ITaggedCache):
+            return  # Reading of tagged record does not fetch tag versions.
+        prefetched = self._prefetched.setdefault(version, {})
+        keys = [key for key in keys if key not in prefetched]
+        tag_keys = [tag_key for tag_key in map(utils.make_tag_key, tags) if tag_key not in prefetched]
+        if not keys and not tag_keys:
+            return
+        caches = self.cache.get_many(keys + tag_keys, version)
+        for key in keys:
+            prefetched[key] = caches.get(key, PrefetchedCacheDecorator.MISSING)
+        # Nonexistent tags are not saved, because they can be created by concurrent transaction.
+        prefetched.update((tag_key, caches[tag_key]) for tag_key in tag_keys if tag_key in caches)
+
+        missed_tag_keys = set()
+        for key in keys:
+            if key in caches:
+                missed_tag_keys.update(map(utils.make_tag_key, self._get_tags(self._unpack_data_lazy(caches[key])[1])))
+        missed_tag_keys -= set(prefetched)
+        if missed_tag_keys:
+            prefetched.update(self.cache.get_many(list(missed_tag_keys), version))
+
+    def start_recording(self):
+        """Starts recording of keys and tags read by get() and get_many()."""
+        self._recorded_reads = set()
+
+    def stop_recording(self):
+        """Stops recording and returns the read items.
+
+        :rtype: set[tuple]
+        :return: set of tuples (version, kind, key), where kind is 'key' or 'tag'
+        """
+        recorded_reads, self._recorded_reads = self._recorded_reads, None
+        return recorded_reads or set()
 
     def begin(self, key):
         """Start cache creating.
@@ -155,6 +295,7 @@ class CacheWrapper(object):  # Adapter
 
         :type key: str
         """
+        self.metrics.add(instrumentation.ABORTED, key)
         self.relation_manager.pop(key)
 
     def finish(self, key, dependency, version=None):
@@ -166,34 +307,164 @@ class CacheWrapper(object):  # Adapter
         """
         self.relation_manager.pop(key).add_dependency(dependency, version)
 
+    def flush_pending(self):
+        """Writes buffered records of write-behind mode.
+
+        Dependencies of records are evaluated by set(), so, a record built before a concurrent
+        invalidation stays invalid. Records are written by single cache.set_many() per timeout.
+        Buffered records are not visible for reading until they are written.
+        """
+        pending, self._pending = self._pending, []
+        latest = {(key, version): i for i, (key, _, _, _, version) in enumerate(pending)}  # The last set wins
+        buckets = {}
+        for i, (key, data, tags, timeout, version) in enumerate(pending):
+            if latest[(key, version)] == i:
+                buckets.setdefault((timeout, version), []).append((key, data, tags))
+        for (timeout, version), records in buckets.items():
+            self.writer.submit(self._write, (records, timeout, version))
+
     def close(self):
+        self.flush_pending()
         self.transaction.flush()
         self.relation_manager.clear()
+        self._prefetched.clear()
+        self._recorded_reads = None
         # self.cache.close()  # should be closed directly or by signal, for example, request_finished in Django.
 
-    @staticmethod
-    def _pack_data(value, dependency):
-        return {
-            '__value': value,
-            '__dependency': dependency,
-        }
+    def _record_reads(self, keys, read_dependencies, version):
+        if self._recorded_reads is None:
+            return
+        self._recorded_reads.update((version, 'key', key) for key in keys)
+        for dependency in read_dependencies:
+            self._recorded_reads.update((version, 'tag', tag) for tag in self._get_tags(dependency))
 
-    @classmethod
-    def _unpack_data(cls, data):
-        if cls._is_packed_data(data):
-            return data['__value'], data['__dependency']
+    def _get_reader(self):
+        if not self._prefetched:
+            return self.cache
+        return PrefetchedCacheDecorator(self.cache, self._prefetched)
+
+    def _write(self, cache, records, timeout, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type records: list[tuple]
+        :type timeout: int or None
+        :type version: int or None
+        """
+        if isinstance(cache, interfaces.ITaggedCache):
+            for key, data, tags in records:
+                cache.set_tagged(key, data, tags, timeout, version)
+            return
+        if len(records) == 1:
+            key, data, tags = records[0]
+            cache.set(key, data, timeout, version)
+        else:
+            cache.set_many({key: data for key, data, tags in records}, timeout, version)
+        for key, data, tags in records:
+            self.tag_index.add(cache, key, tags, version, timeout)
+
+    def _invalidate(self, cache, dependency, tags, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type dependency: cache_dependencies.interfaces.IDependency
+        :type tags: set[str]
+        :type version: int or None
+        """
+        dependency.invalidate(cache, version)
+        self.tag_index.invalidate(cache, tags, version)
+
+    def _pack_data(self, value, dependency):
+        return self.record_serializer.dumps(value, dependency)
+
+    def _unpack_data(self, data):
+        value, dependency = self._unpack_data_lazy(data)
+        return value.get(), dependency
+
+    def _unpack_data_lazy(self, data):
+        if self.record_serializer.is_record(data):
+            return self.record_serializer.loads_lazy(data)
+        elif self._is_packed_data(data):  # Saved by previous versions.
+            return serializers.LazyValue(lambda: data['__value']), data['__dependency']
         else:
-            return data, dependencies.DummyDependency()
+            return serializers.LazyValue(lambda: data), dependencies.DummyDependency()
 
     @staticmethod
     def _is_packed_data(data):
         return isinstance(data, dict) and '__dependency' in data and '__value' in data
 
+    @classmethod
+    def _get_tags(cls, dependency):
+        """Returns all tags of dependency, used by cache backend with tag index.
+
+        :type dependency: cache_dependencies.interfaces.IDependency
+        :rtype: set[str]
+        """
+        if isinstance(dependency, dependencies.CompositeDependency):
+            tags = set()
+            for delegate in dependency.delegates:
+                tags |= cls._get_tags(delegate)
+            return tags
+        elif isinstance(dependency, dependencies.TagsDependency):
+            return set(dependency.get_validated_tags())
+        return set()
+
+    @classmethod
+    def _get_invalid_tags(cls, error):
+        """Returns tags, which caused invalidity of dependency.
+
+        :type error: cache_dependencies.exceptions.DependencyInvalid
+        :rtype: set[str]
+        """
+        if isinstance(error, exceptions.CompositeDependencyInvalid):
+            tags = set()
+            for child in error:
+                tags |= cls._get_invalid_tags(child)
+            return tags
+        elif isinstance(error, exceptions.TagsInvalid):
+            return set(error.errors)
+        return set()
+
     def __getattr__(self, name):
         """Delegate for all native methods."""
         return getattr(self.cache, name)
 
 
+class PrefetchedCacheDecorator(object):
+    """Serves reads from prefetched records, and delegates the rest to cache."""
+
+    MISSING = object()
+
+    def __init__(self, cache, prefetched):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type prefetched: dict
+        """
+        self._cache = cache
+        self._prefetched = prefetched
+
+    def get(self, key, default=None, version=None):
+        value = self._prefetched.get(version, {}).get(key, Undef)
+        if value is Undef:
+            return self._cache.get(key, default, version)
+        if value is self.MISSING:
+            return default
+        return value
+
+    def get_many(self, keys, version=None):
+        prefetched = self._prefetched.get(version, {})
+        result, rest = {}, []
+        for key in keys:
+            if key not in prefetched:
+                rest.append(key)
+            elif prefetched[key] is not self.MISSING:
+                result[key] = prefetched[key]
+        if rest:
+            result.update(self._cache.get_many(rest, version=version))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+
 def default_key_func(key, key_prefix, version):
     """
     Default function to generate keys.
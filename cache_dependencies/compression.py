@@ -0,0 +1,190 @@
+import zlib
+from cache_dependencies import interfaces
+
+
+class ZlibCompressor(interfaces.ICompressor):
+    """Optional preset dictionary improves compression of small similar values,
+    like HTML fragments. Requires Python 3.3+."""
+    name = 'deflate'
+    codec_id = 1
+
+    def __init__(self, level=6, dictionary=None):
+        self.level = level
+        self.dictionary = dictionary
+        self.dictionary_id = get_dictionary_id(dictionary)
+
+    def compress(self, data):
+        if self.dictionary:
+            compressor = zlib.compressobj(
+                self.level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                self.dictionary
+            )
+        else:
+            compressor = zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        if self.dictionary:
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+            return decompressor.decompress(data) + decompressor.flush()
+        return zlib.decompress(data)
+
+
+class GzipCompressor(interfaces.ICompressor):
+    name = 'gzip'
+    codec_id = 2
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class Lz4Compressor(interfaces.ICompressor):
+    """Requires lz4 package."""
+    name = 'lz4'
+    codec_id = 3
+
+    def __init__(self, level=0):
+        import lz4.frame
+        self._lz4 = lz4.frame
+        self.level = level
+
+    def compress(self, data):
+        return self._lz4.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return self._lz4.decompress(data)
+
+
+class ZstdCompressor(interfaces.ICompressor):
+    """Requires zstandard package.
+
+    Optional dictionary (see train_dictionary()) improves compression
+    of small similar values, like HTML fragments.
+    """
+    name = 'zstd'
+    codec_id = 4
+
+    def __init__(self, level=3, dictionary=None):
+        import zstandard
+        self.dictionary_id = get_dictionary_id(dictionary)
+        if dictionary:
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+            self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    @staticmethod
+    def train_dictionary(samples, size=16384):
+        """Returns dictionary trained on samples of values.
+
+        :type samples: list[bytes]
+        :type size: int
+        :rtype: bytes
+        """
+        import zstandard
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+class BrotliCompressor(interfaces.ICompressor):
+    """Requires brotli package."""
+    name = 'br'
+    codec_id = 5
+
+    def __init__(self, level=5):
+        import brotli
+        self._brotli = brotli
+        self.level = level
+
+    def compress(self, data):
+        return self._brotli.compress(data, quality=self.level)
+
+    def decompress(self, data):
+        return self._brotli.decompress(data)
+
+
+def get_dictionary_id(dictionary):
+    """Returns checksum of preset dictionary, or 0 without dictionary.
+
+    :type dictionary: bytes or None
+    :rtype: int
+    """
+    if not dictionary:
+        return 0
+    return zlib.crc32(dictionary) & 0xffffffff
+
+
+COMPRESSORS = {
+    compressor.name: compressor
+    for compressor in (ZlibCompressor, GzipCompressor, Lz4Compressor, ZstdCompressor, BrotliCompressor)
+}
+
+
+def get_compressor(name, **kwargs):
+    """Returns compressor by name, or None if its package is not installed.
+
+    :type name: str
+    :rtype: cache_dependencies.interfaces.ICompressor or None
+    """
+    try:
+        return COMPRESSORS[name](**kwargs)
+    except ImportError:
+        return None
+
+
+def get_compressor_by_id(codec_id):
+    """Returns compressor with default options by codec id, or None if it's unknown or not installed.
+
+    :type codec_id: int
+    :rtype: cache_dependencies.interfaces.ICompressor or None
+    """
+    for name, compressor in COMPRESSORS.items():
+        if compressor.codec_id == codec_id:
+            return get_compressor(name)
+    return None
+
+
+def get_available_compressors(names):
+    """Returns installed compressors in the given order.
+
+    :type names: collections.Iterable[str]
+    :rtype: list[cache_dependencies.interfaces.ICompressor]
+    """
+    return [compressor for compressor in map(get_compressor, names) if compressor is not None]
+
+
+def parse_accept_encoding(value):
+    """Returns set of accepted content-codings, '*' included, without q=0 ones.
+
+    :type value: str
+    :rtype: set[str]
+    """
+    result = set()
+    for item in value.split(','):
+        parts = item.split(';')
+        coding = parts[0].strip().lower()
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, param_value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            result.add(coding)
+    return result
@@ -1,4 +1,6 @@
 import copy
+import time
+import struct
 import operator
 import functools
 from cache_dependencies import interfaces, defer, exceptions, utils
@@ -17,14 +19,53 @@ class CompositeDependency(interfaces.IDependency):
         :type transaction: cache_dependencies.interfaces.ITransaction
         :type version: int or None
         """
-        items = []
-        for delegate in self.delegates:
-            try:
-                delegate.evaluate(cache, transaction, version)
-            except exceptions.DependencyLocked as e:
-                items.append(e)
-        if items:
-            raise exceptions.CompositeDependencyLocked(self, items)
+        self._evaluate(cache, transaction, version).get()
+
+    def _evaluate(self, cache, transaction, version, created_tag_versions=None):
+        """Aggregates queries of all delegates, so, many dependencies are evaluated by single cache.get_many().
+
+        Tag versions created by one delegate are shared with others,
+        since all of them have read the same nonexistent tags.
+
+        :type cache: cache_dependencies.interfaces.ICache
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type version: int or None
+        :type created_tag_versions: dict or None
+        :rtype: cache_dependencies.interfaces.IDeferred
+        """
+        if created_tag_versions is None:
+            created_tag_versions = {}
+        try:
+            deferred = functools.reduce(
+                operator.iadd,
+                [self._evaluate_delegate(delegate, cache, transaction, version, created_tag_versions)
+                 for delegate in self.delegates]
+            )
+        except TypeError:  # self.delegates is empty
+            deferred = defer.Deferred(None, defer.NoneDeferredIterator)
+
+        deferred += defer.Deferred(None, defer.NoneDeferredIterator)
+
+        def callback(node, caches):
+            items = []
+            for _ in range(0, len(self.delegates)):
+                try:
+                    node.get()
+                except exceptions.DependencyLocked as e:
+                    items.append(e)
+            if items:
+                raise exceptions.CompositeDependencyLocked(self, items)
+
+        deferred.add_callback(callback)
+        return deferred
+
+    @staticmethod
+    def _evaluate_delegate(delegate, cache, transaction, version, created_tag_versions):
+        if isinstance(delegate, (CompositeDependency, TagsDependency)):
+            return delegate._evaluate(cache, transaction, version, created_tag_versions)
+        deferred = defer.Deferred(None, defer.NoneDeferredIterator)
+        deferred.add_callback(lambda node, caches: delegate.evaluate(cache, transaction, version))
+        return deferred
 
     def validate(self, cache, version):
         """
@@ -32,19 +73,42 @@ class CompositeDependency(interfaces.IDependency):
         :type version: int or None
         :rtype: cache_dependencies.interfaces.IDeferred
         """
+        # Local dependencies are validated first, without any query to cache.
+        # If any of them is invalid, the composite dependency is invalid too,
+        # so, it's not needed to fetch tag versions at all.
+        errors = []
+        delegates = []
+        for delegate in self.delegates:
+            if isinstance(delegate, interfaces.ILocalDependency):
+                try:
+                    delegate.validate(cache, version).get()
+                except exceptions.DependencyInvalid as e:
+                    errors.append(e)
+            else:
+                delegates.append(delegate)
+
+        if errors:
+            deferred = defer.Deferred(None, defer.NoneDeferredIterator)
+
+            def invalid_callback(node, caches):
+                raise exceptions.CompositeDependencyInvalid(self, errors)
+
+            deferred.add_callback(invalid_callback)
+            return deferred
+
         try:
             deferred = functools.reduce(
                 operator.iadd,
-                [delegate.validate(cache, version) for delegate in self.delegates]
+                [delegate.validate(cache, version) for delegate in delegates]
             )
-        except TypeError:  # self.delegates is empty
+        except TypeError:  # delegates is empty
             deferred = defer.Deferred(None, defer.NoneDeferredIterator)
 
         deferred += defer.Deferred(None, defer.NoneDeferredIterator)
 
         def callback(node, caches):
             errors = []
-            for _ in range(0, len(self.delegates)):
+            for _ in range(0, len(delegates)):
                 try:
                     node.get()
                 except exceptions.DependencyInvalid as e:
@@ -112,6 +176,8 @@ class AbstractTagState(object):
     :type time: float
     """
     time = None
+    CODE = None
+    _struct = None
 
     def __init__(self, transaction):
         """
@@ -119,6 +185,34 @@ class AbstractTagState(object):
         """
         self.session_id = transaction.get_session_id()
 
+    def dumps(self):
+        """Returns compact bytes of state, so, reading of state does not unpickle objects.
+
+        :rtype: bytes
+        """
+        return self.CODE + self._struct.pack(*self._get_fields()) + self.session_id.encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        """Restores state from dumps() result.
+
+        :type data: bytes
+        :rtype: cache_dependencies.dependencies.AbstractTagState
+        """
+        if isinstance(data, AbstractTagState):  # Saved by previous versions.
+            return data
+        cls = {AcquiredTagState.CODE: AcquiredTagState, ReleasedTagState.CODE: ReleasedTagState}[data[:1]]
+        state = cls.__new__(cls)
+        state._set_fields(cls._struct.unpack_from(data, 1))
+        state.session_id = data[1 + cls._struct.size:].decode('utf-8')
+        return state
+
+    def _get_fields(self):
+        raise NotImplementedError
+
+    def _set_fields(self, fields):
+        raise NotImplementedError
+
     @staticmethod
     def make_key(tag):
         raise NotImplementedError
@@ -131,6 +225,8 @@ class AbstractTagState(object):
 
 
 class AcquiredTagState(AbstractTagState):
+    CODE = b'A'
+    _struct = struct.Struct('!d')
 
     def __init__(self, transaction):
         """
@@ -139,6 +235,12 @@ class AcquiredTagState(AbstractTagState):
         super(AcquiredTagState, self).__init__(transaction)
         self.time = transaction.get_start_time()
 
+    def _get_fields(self):
+        return (self.time,)
+
+    def _set_fields(self, fields):
+        self.time, = fields
+
     @staticmethod
     def make_key(tag):
         return 'acquired_{0}'.format(utils.make_tag_key(tag))
@@ -151,6 +253,8 @@ class AcquiredTagState(AbstractTagState):
 
 
 class ReleasedTagState(AbstractTagState):
+    CODE = b'R'
+    _struct = struct.Struct('!dd')
 
     def __init__(self, transaction, delay):
         """
@@ -161,6 +265,12 @@ class ReleasedTagState(AbstractTagState):
         self.time = transaction.get_end_time()
         self.delay = delay
 
+    def _get_fields(self):
+        return self.time, self.delay
+
+    def _set_fields(self, fields):
+        self.time, self.delay = fields
+
     @staticmethod
     def make_key(tag):
         return 'released_{0}'.format(utils.make_tag_key(tag))
@@ -209,18 +319,58 @@ class TagsDependency(interfaces.IDependency):
         :type transaction: cache_dependencies.interfaces.ITransaction
         :type version: int or None
         """
+        self._evaluate(cache, transaction, version).get()
+
+    def _evaluate(self, cache, transaction, version, created_tag_versions=None):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type version: int or None
+        :type created_tag_versions: dict or None
+        :rtype: cache_dependencies.interfaces.IDeferred
+        """
+        if created_tag_versions is None:
+            created_tag_versions = {}
+        if isinstance(cache, interfaces.ITaggedCache):
+            # Tagged records are deleted by backend itself, so, tag versions are not needed.
+            if transaction is None:
+                deferred = defer.Deferred(None, defer.NoneDeferredIterator)
+                deferred.add_callback(lambda *a, **kw: None)
+                return deferred
+            deferred = self._get_locked_tags(cache, transaction, version)
+            deferred += defer.Deferred(None, defer.NoneDeferredIterator)
+
+            def tagged_callback(node, caches):
+                locked_tags = node.get()
+                if locked_tags:
+                    raise exceptions.TagsLocked(self, locked_tags)
+
+            deferred.add_callback(tagged_callback)
+            return deferred
+
         deferred = self._get_tag_versions(cache, version)
-        deferred += self._get_locked_tags(cache, transaction, version)
-        locked_tags = deferred.get()
-        tag_versions = deferred.get()
-        # All deferred operations in this method should be completed
-        # before exception will be raised.
-        if locked_tags:
-            raise exceptions.TagsLocked(self, locked_tags)
-        nonexistent_tags = self.tags - set(tag_versions.keys())
-        created_tag_versions = self._make_tag_versions(cache, nonexistent_tags, version)
-        tag_versions.update(created_tag_versions)
-        self.tag_versions = tag_versions
+        if transaction is not None:
+            deferred += self._get_locked_tags(cache, transaction, version)
+        deferred += defer.Deferred(None, defer.NoneDeferredIterator)
+
+        def callback(node, caches):
+            locked_tags = node.get() if transaction is not None else set()
+            tag_versions = node.get()
+            # All deferred operations in this method should be completed
+            # before exception will be raised.
+            if locked_tags:
+                raise exceptions.TagsLocked(self, locked_tags)
+            nonexistent_tags = self.get_validated_tags() - set(tag_versions.keys())
+            tag_versions.update(
+                (tag, created_tag_versions[tag]) for tag in nonexistent_tags if tag in created_tag_versions
+            )
+            new_tag_versions = self._make_tag_versions(cache, nonexistent_tags - set(created_tag_versions), version)
+            created_tag_versions.update(new_tag_versions)
+            tag_versions.update(new_tag_versions)
+            self.tag_versions = tag_versions
+
+        deferred.add_callback(callback)
+        return deferred
 
     def validate(self, cache, version):
         """
@@ -228,6 +378,11 @@ class TagsDependency(interfaces.IDependency):
         :type version: int or None
         :rtype: cache_dependencies.interfaces.IDeferred
         """
+        if isinstance(cache, interfaces.ITaggedCache):
+            deferred = defer.Deferred(None, defer.NoneDeferredIterator)
+            deferred.add_callback(lambda *a, **kw: None)
+            return deferred
+
         deferred = self._get_tag_versions(cache, version)
 
         def callback(node, caches, keys):
@@ -256,7 +411,7 @@ class TagsDependency(interfaces.IDependency):
         :type transaction: cache_dependencies.interfaces.ITransaction
         :type version: int or None
         """
-        state = AcquiredTagState(transaction)
+        state = AcquiredTagState(transaction).dumps()
         cache.set_many(
             {AcquiredTagState.make_key(tag): state for tag in self.tags}, self.TAG_STATE_TIMEOUT, version
         )
@@ -268,7 +423,7 @@ class TagsDependency(interfaces.IDependency):
         :type delay: int
         :type version: int or None
         """
-        state = ReleasedTagState(transaction, delay)
+        state = ReleasedTagState(transaction, delay).dumps()
         cache.set_many(
             {ReleasedTagState.make_key(tag): state for tag in self.tags},
             self.TAG_STATE_TIMEOUT + max(delay, 1),  # Must have ttl greater than ttl of AcquiredTagState
@@ -280,7 +435,7 @@ class TagsDependency(interfaces.IDependency):
         :type other: cache_dependencies.interfaces.IDependency
         :rtype: bool
         """
-        if isinstance(other, TagsDependency):
+        if isinstance(other, TagsDependency) and type(other) is type(self):
             self.tags |= other.tags
             self.tag_versions.update(other.tag_versions)
             return True
@@ -292,8 +447,15 @@ class TagsDependency(interfaces.IDependency):
         c.tag_versions = c.tag_versions.copy()
         return c
 
+    def get_validated_tags(self):
+        """Returns tags, which versions are validated.
+
+        :rtype: set[str]
+        """
+        return self.tags
+
     def _get_tag_versions(self, cache, version):
-        tag_keys = {tag: utils.make_tag_key(tag) for tag in self.tags}
+        tag_keys = {tag: utils.make_tag_key(tag) for tag in self.get_validated_tags()}
         deferred = defer.Deferred(cache.get_many, defer.GetManyDeferredIterator, version)
         deferred.add_callback(
             lambda _, caches, keys: {tag: caches[tag_key] for tag, tag_key in tag_keys.items() if tag_key in caches},
@@ -302,8 +464,9 @@ class TagsDependency(interfaces.IDependency):
         return deferred
 
     def _get_locked_tags(self, cache, transaction, version):
-        acquired_tag_keys = {AcquiredTagState.make_key(tag): tag for tag in self.tags}
-        released_tag_keys = {ReleasedTagState.make_key(tag): tag for tag in self.tags}
+        tags = self.get_validated_tags()
+        acquired_tag_keys = {AcquiredTagState.make_key(tag): tag for tag in tags}
+        released_tag_keys = {ReleasedTagState.make_key(tag): tag for tag in tags}
         deferred = defer.Deferred(cache.get_many, defer.GetManyDeferredIterator, version)
         bulk_keys = set(acquired_tag_keys.keys()) | set(released_tag_keys.keys())
         deferred.add_callback(self._get_locked_tags_callback, bulk_keys, transaction,
@@ -311,12 +474,12 @@ class TagsDependency(interfaces.IDependency):
         return deferred
 
     def _get_locked_tags_callback(self, node, caches, keys, transaction, acquired_tag_keys, released_tag_keys):
-        acquired_tag_states = {acquired_tag_keys[tag_key]: state for tag_key, state in caches.items()
-                               if tag_key in acquired_tag_keys}
-        released_tag_states = {released_tag_keys[tag_key]: state for tag_key, state in caches.items()
-                               if tag_key in released_tag_keys}
+        acquired_tag_states = {acquired_tag_keys[tag_key]: AbstractTagState.loads(state)
+                               for tag_key, state in caches.items() if tag_key in acquired_tag_keys}
+        released_tag_states = {released_tag_keys[tag_key]: AbstractTagState.loads(state)
+                               for tag_key, state in caches.items() if tag_key in released_tag_keys}
         locked_tags = set()
-        for tag in self.tags:
+        for tag in self.get_validated_tags():
             state = acquired_tag_states.get(tag)
             released_state = released_tag_states.get(tag)
             if released_state is not None:
@@ -335,7 +498,242 @@ class TagsDependency(interfaces.IDependency):
         return new_tag_versions
 
 
-class DummyDependency(interfaces.IDependency):
+class HierarchicalTagsDependency(TagsDependency):
+    """Tags with ancestors.
+
+    Cache record depends on versions of all ancestor prefixes of each tag,
+    so, invalidation of a prefix invalidates the whole subtree,
+    for example, tag 'categories.category.pk:15' invalidates
+    the tag 'categories.category.pk:15.blog.type.pk:3'.
+    """
+    SEPARATOR = '.'
+
+    def get_validated_tags(self):
+        """
+        :rtype: set[str]
+        """
+        tags = set()
+        for tag in self.tags:
+            parts = tag.split(self.SEPARATOR)
+            for i in range(1, len(parts) + 1):
+                tags.add(self.SEPARATOR.join(parts[:i]))
+        return tags
+
+
+class InlineStateTagsDependency(TagsDependency):
+    """Reads tag versions and lock states by single deferred query, and checks lock states
+    by the plain fields of their compact bytes, without building of state objects.
+
+    Lock states are written to separate keys, like TagsDependency does, so, acquire(),
+    release() and invalidate() are blind writes, which never lose concurrent updates.
+    """
+
+    def _evaluate(self, cache, transaction, version, created_tag_versions=None):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type version: int or None
+        :type created_tag_versions: dict or None
+        :rtype: cache_dependencies.interfaces.IDeferred
+        """
+        if transaction is None or isinstance(cache, interfaces.ITaggedCache):
+            return super(InlineStateTagsDependency, self)._evaluate(cache, transaction, version, created_tag_versions)
+        if created_tag_versions is None:
+            created_tag_versions = {}
+
+        tags = self.get_validated_tags()
+        keys = {}
+        for tag in tags:
+            keys[utils.make_tag_key(tag)] = (tag, 0)
+            keys[AcquiredTagState.make_key(tag)] = (tag, 1)
+            keys[ReleasedTagState.make_key(tag)] = (tag, 2)
+        deferred = defer.Deferred(cache.get_many, defer.GetManyDeferredIterator, version)
+        deferred.add_callback(lambda _, caches, bulk_keys: caches, list(keys))
+        deferred += defer.Deferred(None, defer.NoneDeferredIterator)
+
+        def callback(node, caches):
+            records = {}
+            for key, value in node.get().items():
+                tag, field = keys[key]
+                records.setdefault(tag, [None, None, None])[field] = value
+            locked_tags = set(tag for tag, record in records.items() if self._is_locked(record, transaction))
+            if locked_tags:
+                raise exceptions.TagsLocked(self, locked_tags)
+            tag_versions = {
+                tag: self._to_tag_version(record[0]) for tag, record in records.items() if record[0] is not None
+            }
+            nonexistent_tags = tags - set(tag_versions.keys())
+            tag_versions.update(
+                (tag, created_tag_versions[tag]) for tag in nonexistent_tags if tag in created_tag_versions
+            )
+            new_tag_versions = self._make_tag_versions(cache, nonexistent_tags - set(created_tag_versions), version)
+            created_tag_versions.update(new_tag_versions)
+            tag_versions.update(new_tag_versions)
+            self.tag_versions = tag_versions
+
+        deferred.add_callback(callback)
+        return deferred
+
+    def _get_tag_versions(self, cache, version):
+        tag_keys = {tag: utils.make_tag_key(tag) for tag in self.get_validated_tags()}
+        deferred = defer.Deferred(cache.get_many, defer.GetManyDeferredIterator, version)
+        deferred.add_callback(
+            lambda _, caches, keys: {
+                tag: self._to_tag_version(caches[tag_key]) for tag, tag_key in tag_keys.items() if tag_key in caches
+            },
+            tag_keys.values()
+        )
+        return deferred
+
+    @staticmethod
+    def _to_tag_version(value):
+        if isinstance(value, (tuple, list)):  # Record (tag_version, acquired, released) of previous versions.
+            return value[0]
+        return value
+
+    @classmethod
+    def _is_locked(cls, record, transaction):
+        acquired, released = cls._unpack_state(record[1]), cls._unpack_state(record[2])
+        session_id = transaction.get_session_id()
+        # See ReleasedTagState.is_released()
+        if released is not None and (
+                acquired is None or (released[0] == acquired[0] and released[1] > acquired[1])):
+            if session_id == released[0]:
+                return False
+            # We don't create cache in all transactions started earlier
+            # than finished the transaction which has invalidated tag.
+            return transaction.get_start_time() <= released[1] + released[2]
+        if acquired is not None:
+            return session_id != acquired[0]  # Acquired by current thread, ignore it
+        return False
+
+    @staticmethod
+    def _unpack_state(data):
+        """Returns (session_id, time) of acquired state, or (session_id, time, delay) of released state."""
+        if data is None:
+            return None
+        if isinstance(data, AbstractTagState):  # Saved by previous versions.
+            return (data.session_id, data.time) + ((data.delay,) if isinstance(data, ReleasedTagState) else ())
+        state_struct = ReleasedTagState._struct if data[:1] == ReleasedTagState.CODE else AcquiredTagState._struct
+        return (data[1 + state_struct.size:].decode('utf-8'),) + state_struct.unpack_from(data, 1)
+
+
+class ModelVersionDependency(TagsDependency):
+    """Dependency on a single version counter per model.
+
+    Invalidation increments the counter instead of deleting it.
+    """
+    TAG_PREFIX = 'model_version:'
+
+    def __init__(self, *models):
+        """
+        :type models: tuple[str]
+        """
+        if len(models) == 1 and isinstance(models[0], (list, tuple, set, frozenset)):
+            models = models[0]
+        super(ModelVersionDependency, self).__init__(*map(self.make_tag, models))
+
+    def invalidate(self, cache, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type version: int or None
+        """
+        if isinstance(cache, interfaces.ITaggedCache):
+            return super(ModelVersionDependency, self).invalidate(cache, version)
+        for tag in self.tags:
+            try:
+                cache.incr(utils.make_tag_key(tag), version=version)
+            except ValueError:  # Counter does not exist, so, nothing to invalidate.
+                pass
+
+    @classmethod
+    def make_tag(cls, model):
+        """
+        :type model: str
+        :rtype: str
+        """
+        return '{0}{1}'.format(cls.TAG_PREFIX, model)
+
+    def _make_tag_versions(self, cache, tags, version):
+        if not tags:
+            return dict()
+        # Initial value should be unique, because counter can be evicted from cache.
+        new_tag_versions = {tag: utils.randrange(0, utils.MAX_TAG_KEY >> 16) for tag in tags}
+        new_tag_key_versions = {utils.make_tag_key(tag): tag_version for tag, tag_version in new_tag_versions.items()}
+        cache.set_many(new_tag_key_versions, self.TAG_TIMEOUT, version)
+        return new_tag_versions
+
+
+class ExpiresAtDependency(interfaces.ILocalDependency):
+    """Cache record is valid until the given time."""
+
+    def __init__(self, expires_at):
+        """
+        :type expires_at: float
+        """
+        self.expires_at = expires_at
+
+    def evaluate(self, cache, transaction, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type version: int or None
+        """
+
+    def validate(self, cache, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type version: int or None
+        :rtype: cache_dependencies.interfaces.IDeferred
+        """
+        def callback(node, caches):
+            if self._current_time() >= self.expires_at:
+                raise exceptions.ExpiresAtInvalid(self, (self.expires_at,))
+
+        deferred = defer.Deferred(None, defer.NoneDeferredIterator)
+        deferred.add_callback(callback)
+        return deferred
+
+    def invalidate(self, cache, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type version: int or None
+        """
+
+    def acquire(self, cache, transaction, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type version: int or None
+        """
+
+    def release(self, cache, transaction, delay, version):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type delay: int
+        :type version: int or None
+        """
+
+    def extend(self, other):
+        """
+        :type other: cache_dependencies.interfaces.IDependency
+        :rtype: bool
+        """
+        if isinstance(other, ExpiresAtDependency):
+            self.expires_at = min(self.expires_at, other.expires_at)
+            return True
+        return False
+
+    def __copy__(self):
+        return copy.copy(super(ExpiresAtDependency, self))
+
+    @staticmethod
+    def _current_time():
+        return time.time()
+
+
+class DummyDependency(interfaces.ILocalDependency):
 
     def evaluate(self, cache, transaction, version):
         """
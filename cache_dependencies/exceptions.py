@@ -47,6 +47,10 @@ class TagsInvalid(DependencyInvalid):
     pass
 
 
+class ExpiresAtInvalid(DependencyInvalid):
+    pass
+
+
 class CompositeDependencyInvalid(DependencyInvalid):
     def __init__(self, dependency, children):
         """
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import time
+import hashlib
+from cache_dependencies import interfaces, utils
+
+try:
+    str = unicode  # Python 2.* compatible
+except NameError:
+    pass
+
+
+class TagIndex(interfaces.ITagIndex):
+    """Reverse index of tag to cache keys, stored in the cache itself.
+
+    Invalidation is still done by tag versions,
+    the index is used only to reclaim memory of invalidated records eagerly.
+    So, the index is bounded and lossy. Keys pushed out of the index
+    (or lost by concurrent writers) just live until their timeout.
+
+    Each tag has its own index of (key, expires_at) entries, so, adding of key
+    rewrites only indexes of its tags. Tags are registered for sweeping
+    in registry shards only when their index is created.
+    """
+    INDEX_TIMEOUT = 24 * 3600
+    REGISTRY_KEY = 'tagindex_registry'
+
+    def __init__(self, max_keys=1000, max_tags=10000, registry_shards=16):
+        """
+        :type max_keys: int
+        :type max_tags: int
+        :type registry_shards: int
+        """
+        self.max_keys = max_keys
+        self.max_tags = max_tags
+        self.registry_shards = registry_shards
+
+    def add(self, cache, key, tags, version=None, timeout=None):
+        tags = set(tags)
+        if not tags:
+            return
+        expires_at = None if timeout is None else time.time() + timeout
+        index_keys = {self.make_key(tag): tag for tag in tags}
+        indexes = cache.get_many(list(index_keys), version=version)
+        data = {}
+        for index_key in index_keys:
+            entries = [entry for entry in indexes.get(index_key, ()) if entry[0] != key]
+            entries.append((key, expires_at))
+            data[index_key] = entries[-self.max_keys:]  # Pushes out the oldest keys
+        new_tags = set(tag for index_key, tag in index_keys.items() if index_key not in indexes)
+        if new_tags:
+            data.update(self._register(cache, new_tags, version))
+        cache.set_many(data, self.INDEX_TIMEOUT, version)
+
+    def invalidate(self, cache, tags, version=None):
+        index_keys = list(map(self.make_key, tags))
+        if not index_keys:
+            return
+        keys = set()
+        for entries in cache.get_many(index_keys, version=version).values():
+            keys.update(entry[0] for entry in entries)
+        cache.delete_many(list(keys) + index_keys, version=version)
+
+    def compact(self, cache, limit=None, version=None):
+        """Sweeps the registered tags, starting from the oldest ones of each shard.
+
+        Only the indexes are read, keys are expired by their expires_at.
+        Keys saved without timeout are removed only by invalidation or pushed out.
+        Returns count of removed keys.
+        """
+        shard_keys = list(map(self.make_shard_key, range(self.registry_shards)))
+        registry = cache.get_many(shard_keys, version=version)
+        swept, remaining = {}, limit
+        for shard_key in shard_keys:
+            tags = registry.get(shard_key, [])
+            if remaining is not None:
+                tags = tags[:remaining]
+                remaining -= len(tags)
+            if tags:
+                swept[shard_key] = tags
+        if not swept:
+            return 0
+        index_keys = {self.make_key(tag): tag for tags in swept.values() for tag in tags}
+        indexes = cache.get_many(list(index_keys), version=version)
+
+        now = time.time()
+        data, empty_index_keys, alive_tags, removed = {}, [], set(), 0
+        for index_key, entries in indexes.items():
+            alive = [entry for entry in entries if entry[1] is None or entry[1] > now]
+            removed += len(entries) - len(alive)
+            if not alive:
+                empty_index_keys.append(index_key)
+                continue
+            alive_tags.add(index_keys[index_key])
+            if len(alive) < len(entries):
+                data[index_key] = alive
+        for shard_key, tags in swept.items():
+            swept_tags = set(tags)
+            # Swept tags are moved to the end of the shard for round robin.
+            data[shard_key] = [tag for tag in registry[shard_key] if tag not in swept_tags] + \
+                [tag for tag in tags if tag in alive_tags]
+        cache.set_many(data, self.INDEX_TIMEOUT, version)
+        if empty_index_keys:
+            cache.delete_many(empty_index_keys, version=version)
+        return removed
+
+    def _register(self, cache, tags, version):
+        """Returns shards of registry with the new tags."""
+        shard_tags = {}
+        for tag in tags:
+            shard_tags.setdefault(self.make_shard_key(self._get_shard(tag)), set()).add(tag)
+        registry = cache.get_many(list(shard_tags), version=version)
+        max_shard_tags = max(self.max_tags // self.registry_shards, 1)
+        data = {}
+        for shard_key, new_tags in shard_tags.items():
+            shard = registry.get(shard_key, [])
+            new_tags -= set(shard)
+            if new_tags:
+                data[shard_key] = (shard + sorted(new_tags))[-max_shard_tags:]
+        return data
+
+    def _get_shard(self, tag):
+        return int(hashlib.md5(str(tag).encode('utf-8')).hexdigest()[:8], 16) % self.registry_shards
+
+    @staticmethod
+    def make_key(tag):
+        return 'tagindex_{0}'.format(utils.make_tag_key(tag))
+
+    @classmethod
+    def make_shard_key(cls, shard):
+        return '{0}_{1}'.format(cls.REGISTRY_KEY, shard)
+
+
+class DummyTagIndex(interfaces.ITagIndex):
+    """Using pattern Special Case"""
+
+    def add(self, cache, key, tags, version=None, timeout=None):
+        pass
+
+    def invalidate(self, cache, tags, version=None):
+        pass
+
+    def compact(self, cache, limit=None, version=None):
+        return 0
@@ -0,0 +1,654 @@
+import re
+import time
+import threading
+from cache_dependencies import interfaces
+from cache_dependencies.utils import Undef
+
+try:
+    str = unicode  # Python 2.* compatible
+except NameError:
+    pass
+
+# Upper bounds of latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+READ_OPERATIONS = frozenset(('get', 'get_many', 'has_key'))
+WRITE_OPERATIONS = frozenset(('add', 'set', 'set_many', 'set_tagged'))
+
+
+def classify(operation, key):
+    """Returns call site of the library by operation and key prefix.
+
+    :type operation: str
+    :type key: str
+    :rtype: str
+    """
+    if key.startswith('tag_'):
+        if operation in READ_OPERATIONS:
+            return 'tag_version'
+        elif operation in WRITE_OPERATIONS:
+            return 'tag_creation'
+        return 'invalidation'
+    elif key.startswith(('acquired_', 'released_')):
+        if operation in READ_OPERATIONS:
+            return 'lock_state'
+        return 'lock'
+    return 'value'
+
+
+def get_size(value):
+    """Returns size of bytes and text values, other values are not measured.
+
+    :rtype: int
+    """
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 0
+
+
+class OperationStats(object):
+    """Counters and latency histogram of one operation at one call site."""
+
+    def __init__(self):
+        self.calls = 0
+        self.keys = 0
+        self.bytes = 0
+        self.time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, keys, size, duration):
+        """
+        :type keys: int
+        :type size: int
+        :type duration: float
+        """
+        self.calls += 1
+        self.keys += keys
+        self.bytes += size
+        self.time += duration
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def copy(self):
+        c = OperationStats()
+        c.calls, c.keys, c.bytes, c.time, c.buckets = self.calls, self.keys, self.bytes, self.time, self.buckets[:]
+        return c
+
+
+class CacheStats(object):
+    """Stats of backend calls by operation and call site."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def add(self, operation, site, keys, size, duration):
+        """
+        :type operation: str
+        :type site: str
+        :type keys: int
+        :type size: int
+        :type duration: float
+        """
+        with self._lock:
+            stats = self._stats.get((operation, site))
+            if stats is None:
+                stats = self._stats[(operation, site)] = OperationStats()
+            stats.add(keys, size, duration)
+
+    def items(self):
+        """Returns snapshot of stats sorted by operation and site.
+
+        :rtype: list[((str, str), cache_dependencies.instrumentation.OperationStats)]
+        """
+        with self._lock:
+            return sorted((key, stats.copy()) for key, stats in self._stats.items())
+
+    def summary(self):
+        """
+        :rtype: dict
+        """
+        return {
+            '{0}.{1}'.format(operation, site): {
+                'calls': stats.calls, 'keys': stats.keys, 'bytes': stats.bytes, 'time': stats.time,
+            } for (operation, site), stats in self.items()
+        }
+
+    @property
+    def calls(self):
+        return sum(stats.calls for key, stats in self.items())
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class StatsRegistry(CacheStats):
+    """Process-wide stats, which also collects stats of the current request of each thread."""
+
+    def __init__(self):
+        super(StatsRegistry, self).__init__()
+        self._local = threading.local()
+
+    def begin_request(self):
+        """Starts collecting of stats of the current request in this thread.
+
+        :rtype: cache_dependencies.instrumentation.CacheStats
+        """
+        self._local.request_stats = CacheStats()
+        return self._local.request_stats
+
+    def end_request(self):
+        """Stops collecting of stats of the current request and returns them.
+
+        :rtype: cache_dependencies.instrumentation.CacheStats or None
+        """
+        request_stats = getattr(self._local, 'request_stats', None)
+        self._local.request_stats = None
+        return request_stats
+
+    def add(self, operation, site, keys, size, duration):
+        super(StatsRegistry, self).add(operation, site, keys, size, duration)
+        request_stats = getattr(self._local, 'request_stats', None)
+        if request_stats is not None:
+            request_stats.add(operation, site, keys, size, duration)
+
+    def to_prometheus(self, prefix='cache_dependencies_backend'):
+        """Returns stats in Prometheus text exposition format.
+
+        :type prefix: str
+        :rtype: str
+        """
+        items = self.items()
+        lines = []
+        for name, attr in (('calls_total', 'calls'), ('keys_total', 'keys'), ('bytes_total', 'bytes')):
+            lines.append('# TYPE {0}_{1} counter'.format(prefix, name))
+            for (operation, site), stats in items:
+                lines.append('{0}_{1}{{operation="{2}",site="{3}"}} {4}'.format(
+                    prefix, name, operation, site, getattr(stats, attr)
+                ))
+        lines.append('# TYPE {0}_duration_seconds histogram'.format(prefix))
+        for (operation, site), stats in items:
+            labels = 'operation="{0}",site="{1}"'.format(operation, site)
+            count = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+                count += bucket
+                lines.append('{0}_duration_seconds_bucket{{{1},le="{2}"}} {3}'.format(prefix, labels, bound, count))
+            lines.append('{0}_duration_seconds_sum{{{1}}} {2}'.format(prefix, labels, stats.time))
+            lines.append('{0}_duration_seconds_count{{{1}}} {2}'.format(prefix, labels, stats.calls))
+        return '\n'.join(lines) + '\n'
+
+    def to_statsd(self, prefix='cache_dependencies.backend'):
+        """Returns stats as StatsD gauge lines, because the counters are cumulative.
+
+        :type prefix: str
+        :rtype: list[str]
+        """
+        lines = []
+        for (operation, site), stats in self.items():
+            name = '{0}.{1}.{2}'.format(prefix, operation, site)
+            lines.append('{0}.calls:{1}|g'.format(name, stats.calls))
+            lines.append('{0}.keys:{1}|g'.format(name, stats.keys))
+            lines.append('{0}.bytes:{1}|g'.format(name, stats.bytes))
+            lines.append('{0}.time_ms:{1:.3f}|g'.format(name, stats.time * 1000))
+        return lines
+
+registry = StatsRegistry()
+
+
+class InstrumentedCacheDecorator(interfaces.ICache):
+    """Counts calls, keys, bytes and latency of backend calls by operation and call site."""
+
+    def __init__(self, cache, stats=None):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type stats: cache_dependencies.instrumentation.CacheStats or None
+        """
+        self._cache = cache
+        self._stats = registry if stats is None else stats
+
+    def _call(self, operation, keys, func, *args, **kwargs):
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.time() - start
+            self._add(operation, keys, duration)
+
+    def _add(self, operation, keys, duration, size=0):
+        sites = {}
+        for key in keys:
+            site = classify(operation, key)
+            sites[site] = sites.get(site, 0) + 1
+        # Aggregated call of several sites is one round-trip, so, it's counted once.
+        site = '+'.join(sorted(sites)) or 'value'
+        self._stats.add(operation, site, len(keys), size, duration)
+
+    def _timed(self, func, *args, **kwargs):
+        start = time.time()
+        result = func(*args, **kwargs)
+        return result, time.time() - start
+
+    def add(self, key, value, timeout=None, version=None):
+        result, duration = self._timed(self._cache.add, key, value, timeout, version)
+        self._add('add', (key,), duration, get_size(value))
+        return result
+
+    def get(self, key, default=None, version=None):
+        result, duration = self._timed(self._cache.get, key, default, version)
+        self._add('get', (key,), duration, get_size(result))
+        return result
+
+    def set(self, key, value, timeout=None, version=None):
+        result, duration = self._timed(self._cache.set, key, value, timeout, version)
+        self._add('set', (key,), duration, get_size(value))
+        return result
+
+    def delete(self, key, version=None):
+        return self._call('delete', (key,), self._cache.delete, key, version)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        result, duration = self._timed(self._cache.get_many, keys, version)
+        self._add('get_many', keys, duration, sum(map(get_size, result.values())))
+        return result
+
+    def has_key(self, key, version=None):
+        return self._call('has_key', (key,), self._cache.has_key, key, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._call('incr', (key,), self._cache.incr, key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._call('decr', (key,), self._cache.decr, key, delta, version)
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def set_many(self, data, timeout=None, version=None):
+        result, duration = self._timed(self._cache.set_many, data, timeout, version)
+        self._add('set_many', list(data), duration, sum(map(get_size, data.values())))
+        return result
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        return self._call('delete_many', keys, self._cache.delete_many, keys, version)
+
+    def clear(self):
+        return self._call('clear', (), self._cache.clear)
+
+    def incr_version(self, key, delta=1, version=None):
+        return self._call('incr_version', (key,), self._cache.incr_version, key, delta, version)
+
+    def decr_version(self, key, delta=1, version=None):
+        return self._call('decr_version', (key,), self._cache.decr_version, key, delta, version)
+
+    def close(self, **kwargs):
+        return self._cache.close(**kwargs)
+
+    def __getattr__(self, name):
+        """Delegate for all native methods."""
+        return getattr(self._cache, name)
+
+
+class InstrumentedTaggedCacheDecorator(InstrumentedCacheDecorator, interfaces.ITaggedCache):
+
+    def set_tagged(self, key, value, tags, timeout=None, version=None):
+        result, duration = self._timed(self._cache.set_tagged, key, value, tags, timeout, version)
+        self._add('set_tagged', (key,), duration, get_size(value))
+        return result
+
+
+def instrument(cache, stats=None):
+    """Returns instrumented cache, which keeps the tagged interface of cache.
+
+    :type cache: cache_dependencies.interfaces.ICache
+    :type stats: cache_dependencies.instrumentation.CacheStats or None
+    :rtype: cache_dependencies.instrumentation.InstrumentedCacheDecorator
+    """
+    if isinstance(cache, interfaces.ITaggedCache):
+        return InstrumentedTaggedCacheDecorator(cache, stats)
+    return InstrumentedCacheDecorator(cache, stats)
+
+
+HIT, MISS, INVALID, LOCKED, ABORTED = 'hit', 'miss', 'invalid', 'locked', 'aborted'
+OUTCOMES = (HIT, MISS, INVALID, LOCKED, ABORTED)
+
+# Label of namespaces and tags beyond the cardinality limit.
+OTHER = '__other__'
+
+
+def default_namespace_func(key):
+    """Returns key prefix up to the first separator.
+
+    :type key: str
+    :rtype: str
+    """
+    return re.split(r'[:.]', key, 1)[0]
+
+
+class DummyOutcomeMetrics(interfaces.IOutcomeMetrics):
+    """Using pattern Special Case"""
+
+    def add(self, outcome, key, tags=()):
+        pass
+
+
+class OutcomeMetrics(interfaces.IOutcomeMetrics):
+    """Counts outcomes per key namespace and per tag.
+
+    Cardinality is bounded, namespaces and tags beyond the limits are counted as OTHER.
+    """
+
+    def __init__(self, max_namespaces=100, max_tags=1000, namespace_func=default_namespace_func):
+        """
+        :type max_namespaces: int
+        :type max_tags: int
+        :type namespace_func: collections.Callable
+        """
+        self.max_namespaces = max_namespaces
+        self.max_tags = max_tags
+        self.namespace_func = namespace_func
+        self._namespaces = {}
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def add(self, outcome, key, tags=()):
+        with self._lock:
+            self._increment(self._namespaces, self.max_namespaces, self.namespace_func(key), outcome)
+            for tag in tags:
+                self._increment(self._tags, self.max_tags, tag, outcome)
+
+    @staticmethod
+    def _increment(counters, limit, name, outcome):
+        outcome_counters = counters.get(name)
+        if outcome_counters is None:
+            if len(counters) >= limit:
+                name = OTHER
+            outcome_counters = counters.setdefault(name, {})
+        outcome_counters[outcome] = outcome_counters.get(outcome, 0) + 1
+
+    def by_namespace(self):
+        """
+        :rtype: dict[str, dict[str, int]]
+        """
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._namespaces.items()}
+
+    def by_tag(self):
+        """
+        :rtype: dict[str, dict[str, int]]
+        """
+        with self._lock:
+            return {tag: dict(counters) for tag, counters in self._tags.items()}
+
+    def top_tags(self, outcome=INVALID, limit=10):
+        """Returns tags, which cause the most of given outcome.
+
+        :type outcome: str
+        :type limit: int
+        :rtype: list[(str, int)]
+        """
+        counts = [(tag, counters[outcome]) for tag, counters in self.by_tag().items() if counters.get(outcome)]
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        return counts[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+            self._tags.clear()
+
+    def to_prometheus(self, prefix='cache_dependencies'):
+        """Returns counters in Prometheus text exposition format.
+
+        :type prefix: str
+        :rtype: str
+        """
+        lines = []
+        for name, label, counters in (('namespace', 'namespace', self.by_namespace()),
+                                      ('tag', 'tag', self.by_tag())):
+            lines.append('# TYPE {0}_outcomes_by_{1}_total counter'.format(prefix, name))
+            for value, outcome_counters in sorted(counters.items()):
+                for outcome, count in sorted(outcome_counters.items()):
+                    lines.append('{0}_outcomes_by_{1}_total{{{2}="{3}",outcome="{4}"}} {5}'.format(
+                        prefix, name, label, _escape_label(value), outcome, count
+                    ))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class DummySpan(interfaces.ISpan):
+    """Using pattern Special Case"""
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_dummy_span = DummySpan()
+
+
+class DummyTracer(interfaces.ITracer):
+    """Using pattern Special Case"""
+
+    def span(self, operation, keys=(), **attributes):
+        return _dummy_span
+
+
+class TraceSpan(interfaces.ISpan):
+    """Operation of cache recorded by RequestTracer."""
+
+    def __init__(self, tracer, operation, keys, attributes, parent):
+        """
+        :type tracer: cache_dependencies.instrumentation.RequestTracer
+        :type operation: str
+        :type keys: collections.Iterable[str]
+        :type attributes: dict
+        :type parent: str or None
+        :param parent: key of the fragment, which is built at the moment
+        """
+        self._tracer = tracer
+        self.operation = operation
+        self.keys = tuple(keys)
+        self.attributes = attributes
+        self.parent = parent
+        self.start = self.end = None
+        self.round_trips = None
+        self._calls = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._calls = self._tracer.get_calls()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.time()
+        if self._calls is not None:
+            self.round_trips = self._tracer.get_calls() - self._calls
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        return False
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        data = {
+            'operation': self.operation,
+            'keys': list(self.keys),
+            'parent': self.parent,
+            'start_ms': (self.start - self._tracer.start) * 1000,
+            'duration_ms': self.duration * 1000,
+            'round_trips': self.round_trips,
+        }
+        data.update((name, sorted(value) if isinstance(value, (set, frozenset)) else value)
+                    for name, value in self.attributes.items())
+        return data
+
+
+class TraceNode(object):
+    """Fragment of cache, which is built while its descendants are read or built."""
+
+    def __init__(self, key, start):
+        self.key = key
+        self.start = start
+        self.end = None
+        self.children = []
+        self.attributes = {}
+
+    def to_dict(self, origin):
+        data = {
+            'key': self.key,
+            'start_ms': (self.start - origin) * 1000,
+            'duration_ms': ((self.end or time.time()) - self.start) * 1000,
+            'children': [child.to_dict(origin) for child in self.children],
+        }
+        data.update(self.attributes)
+        return data
+
+
+class RequestTracer(interfaces.ITracer):
+    """Records timeline of cache operations and the tree of fragments of one request."""
+
+    def __init__(self, stats=None):
+        """
+        :type stats: cache_dependencies.instrumentation.CacheStats or None
+        :param stats: stats of instrumented backend (of the current request), used to count round-trips
+        """
+        self.stats = stats
+        self.start = time.time()
+        self.spans = []
+        self.roots = []
+        self._nodes = {}
+        self._installed = None
+        self._relation_manager = None
+
+    def get_calls(self):
+        """
+        :rtype: int or None
+        """
+        return None if self.stats is None else self.stats.calls
+
+    def span(self, operation, keys=(), **attributes):
+        span = TraceSpan(self, operation, keys, attributes, self._current_key())
+        self.spans.append(span)
+        if operation == 'set':
+            for key in span.keys:
+                if key in self._nodes:
+                    self._nodes[key].attributes['rebuilt'] = True
+        return span
+
+    def enter(self, key, parent_key=None):
+        """Starts fragment node.
+
+        :type key: str
+        :type parent_key: str or None
+        """
+        if key in self._nodes:
+            return
+        node = self._nodes[key] = TraceNode(key, time.time())
+        parent = self._nodes.get(parent_key)
+        (parent.children if parent is not None else self.roots).append(node)
+
+    def leave(self, key):
+        """Finishes fragment node.
+
+        :type key: str
+        """
+        node = self._nodes.pop(key, None)
+        if node is not None:
+            node.end = time.time()
+
+    def install(self, cache):
+        """Starts tracing of CacheWrapper instance.
+
+        :type cache: cache_dependencies.cache.CacheWrapper
+        """
+        self._installed = (cache, cache.tracer, cache.relation_manager)
+        self._relation_manager = TracingRelationManagerDecorator(cache.relation_manager, self)
+        cache.tracer = self
+        cache.relation_manager = self._relation_manager
+
+    def uninstall(self):
+        """Stops tracing of CacheWrapper instance."""
+        if self._installed is not None:
+            cache, cache.tracer, cache.relation_manager = self._installed
+            self._installed = self._relation_manager = None
+
+    def _current_key(self):
+        if self._relation_manager is None:
+            return None
+        node = self._relation_manager.current()
+        return node.key() if node else None
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {
+            'duration_ms': (time.time() - self.start) * 1000,
+            'spans': [span.to_dict() for span in self.spans],
+            'fragments': [node.to_dict(self.start) for node in self.roots],
+        }
+
+    def server_timing(self):
+        """Returns value of Server-Timing header with total time of each operation.
+
+        :rtype: str
+        """
+        totals = {}
+        for span in self.spans:
+            count, duration, round_trips = totals.get(span.operation, (0, 0.0, 0))
+            totals[span.operation] = (count + 1, duration + span.duration, round_trips + (span.round_trips or 0))
+        metrics = []
+        for operation, (count, duration, round_trips) in sorted(totals.items()):
+            desc = '{0} calls'.format(count)
+            if self.stats is not None:
+                desc += ', {0} round-trips'.format(round_trips)
+            metrics.append('cache-{0};dur={1:.3f};desc="{2}"'.format(
+                operation.replace('_', '-'), duration * 1000, desc
+            ))
+        return ', '.join(metrics)
+
+
+class TracingRelationManagerDecorator(interfaces.IRelationManager):
+    """Reports begin and finish of fragments to RequestTracer."""
+
+    def __init__(self, delegate, tracer):
+        """
+        :type delegate: cache_dependencies.interfaces.IRelationManager
+        :type tracer: cache_dependencies.instrumentation.RequestTracer
+        """
+        self._delegate = delegate
+        self._tracer = tracer
+
+    def get(self, key):
+        return self._delegate.get(key)
+
+    def current(self, key_or_node=Undef):
+        if key_or_node is not Undef and not isinstance(key_or_node, interfaces.ICacheNode):
+            parent = self._delegate.current()
+            self._tracer.enter(key_or_node, parent.key() if parent else None)
+        return self._delegate.current(key_or_node)
+
+    def pop(self, key):
+        self._tracer.leave(key)
+        return self._delegate.pop(key)
+
+    def clear(self):
+        return self._delegate.clear()
@@ -5,8 +5,10 @@ class IDependency(object):
 
     def evaluate(self, cache, transaction, version):
         """
+        Lock state is not checked if transaction is None.
+
         :type cache: cache_dependencies.interfaces.ICache
-        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type transaction: cache_dependencies.interfaces.ITransaction or None
         :type version: int or None
         """
         raise NotImplementedError
@@ -57,6 +59,13 @@ class IDependency(object):
         raise NotImplementedError
 
 
+class ILocalDependency(IDependency):
+    """Dependency which is validated locally, without access to cache.
+
+    So, validate() returns the deferred, which does not execute any query.
+    """
+
+
 class IDeferred(object):  # Queue?
     """
     :type queue: list[collections.Callable, tuple, dict]
@@ -283,6 +292,151 @@ class ITransactionManager(object):
         raise NotImplementedError
 
 
+class ITagIndex(object):
+    """Reverse index of tag to cache keys.
+
+    Used for eager deletion of invalidated cache records.
+    """
+
+    def add(self, cache, key, tags, version=None, timeout=None):
+        """
+        :type cache: cache_dependencies.interfaces.ICache
+        :type key: str
+        :type tags: collections.Iterable[str]
+        :type version: int or None
+        :type timeout: int or None
+        """
+        raise NotImplementedError
+
+    def invalidate(self, cache, tags, version=None):
+        """Deletes all indexed cache records of given tags.
+
+        :type cache: cache_dependencies.interfaces.ICache
+        :type tags: collections.Iterable[str]
+        :type version: int or None
+        """
+        raise NotImplementedError
+
+    def compact(self, cache, limit=None, version=None):
+        """Removes keys of expired cache records from index.
+
+        :type cache: cache_dependencies.interfaces.ICache
+        :type limit: int or None
+        :type version: int or None
+        """
+        raise NotImplementedError
+
+
+class IWriter(object):
+    """Executes cache writes, possibly out of the request thread."""
+
+    def submit(self, func, args=(), barrier=False):
+        """Schedules func(cache, *args).
+
+        Barrier task is executed only after all previously submitted tasks,
+        and before all subsequently submitted tasks.
+
+        :type func: collections.Callable
+        :type args: tuple
+        :type barrier: bool
+        """
+        raise NotImplementedError
+
+    def flush(self, timeout=None):
+        """Waits for all submitted tasks.
+
+        :type timeout: float or None
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Flushes submitted tasks and stops writing."""
+        raise NotImplementedError
+
+
+class ICompressor(object):
+    """Compresses bytes.
+
+    The name is used as the HTTP content-coding as well,
+    and the codec_id and dictionary_id (0 without dictionary) are stored in envelope of compressed cache value.
+    """
+    name = None
+    codec_id = None
+    dictionary_id = 0
+
+    def compress(self, data):
+        """
+        :type data: bytes
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def decompress(self, data):
+        """
+        :type data: bytes
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+
+class ISerializer(object):
+    """Serializes cache values to bytes. The serializer_id is stored in envelope of cache value."""
+    serializer_id = None
+
+    def dumps(self, value):
+        """
+        :type value: object
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def loads(self, data):
+        """
+        :type data: bytes
+        :rtype: object
+        """
+        raise NotImplementedError
+
+
+class IOutcomeMetrics(object):
+    """Counts outcomes of reads and writes of cache: hit, miss, invalid, locked and aborted."""
+
+    def add(self, outcome, key, tags=()):
+        """
+        :type outcome: str
+        :type key: str
+        :type tags: collections.Iterable[str]
+        :param tags: tags, which caused invalid or locked outcome
+        """
+        raise NotImplementedError
+
+
+class ISpan(object):
+    """Context manager of traced operation."""
+
+    def set(self, **attributes):
+        """Sets attributes known during the operation, like outcome."""
+        raise NotImplementedError
+
+    def __enter__(self):
+        raise NotImplementedError
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        raise NotImplementedError
+
+
+class ITracer(object):
+
+    def span(self, operation, keys=(), **attributes):
+        """
+        :type operation: str
+        :type keys: collections.Iterable[str]
+        :rtype: cache_dependencies.interfaces.ISpan
+        """
+        raise NotImplementedError
+
+
 class ICache(object):
     """Historically used Django API interface."""
     def add(self, key, value, timeout=None, version=None):
@@ -392,3 +546,23 @@ class ICache(object):
     def close(self, **kwargs):
         """Close the cache connection"""
         raise NotImplementedError
+
+
+class ITaggedCache(ICache):
+    """Cache backend which keeps tag to key index natively.
+
+    Deleting a tag key with delete() or delete_many() also deletes all
+    cache records, which were saved with this tag by set_tagged().
+    So, tag versions are not needed to validate such records.
+    """
+    def set_tagged(self, key, value, tags, timeout=None, version=None):
+        """
+        Set a value in the cache and bind it to the given tags.
+
+        :type key: str
+        :type value: object
+        :type tags: collections.Iterable[str]
+        :type timeout: int or None
+        :type version: int or None
+        """
+        raise NotImplementedError
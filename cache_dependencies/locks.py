@@ -4,6 +4,8 @@ from cache_dependencies import interfaces
 
 class DependencyLock(interfaces.IDependencyLock):
 
+    isolation_level = None
+
     def __init__(self, thread_safe_cache_accessor, delay=0):
         """
         :type thread_safe_cache_accessor: () -> cache_dependencies.interfaces.ICache
@@ -42,6 +44,18 @@ class DependencyLock(interfaces.IDependencyLock):
 
 class ReadUncommittedDependencyLock(DependencyLock):
     """Tag Lock for Read Uncommitted transaction isolation level."""
+    isolation_level = 'READ UNCOMMITTED'
+
+    def evaluate(self, dependency, transaction, version):
+        """
+        :type dependency: cache_dependencies.interfaces.IDependency
+        :type transaction: cache_dependencies.interfaces.ITransaction
+        :type version: int or None
+        """
+        # Lock states are never saved for this isolation level (even with delay,
+        # which just postpones the invalidation), so, only tag versions are fetched.
+        dependency.evaluate(self._cache(), None, version)
+
     def acquire(self, dependency, transaction, version):
         """
         :type dependency: cache_dependencies.interfaces.IDependency
@@ -67,6 +81,8 @@ class ReadUncommittedDependencyLock(DependencyLock):
 
 class ReadCommittedDependencyLock(ReadUncommittedDependencyLock):
     """Tag Lock for Read Committed transaction isolation level."""
+    isolation_level = 'READ COMMITTED'
+
     def release(self, dependency, transaction, version):
         """
         :type dependency: cache_dependencies.interfaces.IDependency
@@ -79,6 +95,8 @@ class ReadCommittedDependencyLock(ReadUncommittedDependencyLock):
 
 class RepeatableReadDependencyLock(DependencyLock):
     """Tag Lock for Repeatable Reads transaction isolation level."""
+    isolation_level = 'REPEATABLE READ'
+
     def acquire(self, dependency, transaction, version):
         """
         :type dependency: cache_dependencies.interfaces.IDependency
@@ -98,3 +116,4 @@ class RepeatableReadDependencyLock(DependencyLock):
 
 class SerializableDependencyLock(RepeatableReadDependencyLock):
     """Tag Lock for Serializable transaction isolation level."""
+    isolation_level = 'SERIALIZABLE'
@@ -2,6 +2,8 @@
 from __future__ import absolute_import, unicode_literals
 import re
 import base64
+import threading
+import collections
 
 try:
     import cPickle as pickle
@@ -22,13 +24,41 @@ except NameError:
     integer_types = (int,)
 
 
+class NoCacheLocals(dict):
+    """Local namespace of nocache block, which unpickles the data of block on demand.
+
+    Data of block overrides data of handle(), and both override globals and builtins.
+    """
+
+    def __init__(self, unpickle, pickled, defaults):
+        super(NoCacheLocals, self).__init__()
+        self._unpickle = unpickle
+        self._pickled = pickled
+        self._data = {}
+        self._defaults = defaults
+
+    def __missing__(self, key):
+        if self._pickled is not None:
+            self._data, self._pickled = self._unpickle(self._pickled), None
+        # Data of block overrides data of handle().
+        if key in self._data:
+            value = self._data[key]
+        elif key in self._defaults:
+            value = self._defaults[key]
+        else:
+            raise KeyError(key)  # eval() falls back to globals and builtins
+        self[key] = value
+        return value
+
+
 class NoCache(object):
     """No cache class"""
 
-    def __init__(self, secret, tag_name='nocache:py'):
+    def __init__(self, secret, tag_name='nocache:py', max_compiled=256):
         """constructor"""
         self.secret = secret
         self.tag_name = tag_name
+        self.max_compiled = max_compiled
         # nocache.nocache can be used for nested cache handling.
         # Similar like Django {% openblock %} for "{%".
         self._start = '<{0} secret="{1}" data="{{0}}">'.format(
@@ -42,6 +72,13 @@ class NoCache(object):
             self._end
         )
         self.nocache_re = re.compile(self.nocache_pattern, re.U|re.S)
+        self._start_prefix = self._start.split('{0}')[0]
+        self._empty_data = self.pickle({})
+        self._globals = dict(globals())
+        self._globals['echo'] = self._echo
+        self._local = threading.local()
+        self._compiled = collections.OrderedDict()
+        self._compiled_lock = threading.Lock()
 
     def start(self, **data):
         return self._start.format(self.pickle(data))
@@ -59,44 +96,138 @@ class NoCache(object):
 
     def handle(self, tpl, **data):
         """eval nocache"""
-
-        def repl(match):
-            lines = match.group(2).split('\n')
-            lines = [l.rstrip() for l in lines]
-            lines_stripped = []
-            start = None
-            result = ''
-            for l in lines:
-                if not l:
-                    continue
-                if start is None:
-                    start = len(l) - len(l.lstrip())
-                lines_stripped.append(l[start:])
-            lines_stripped.append('')
-            stdout = StringIO()
-
-            def echo(*args):
-                for arg in args:
-                    stdout.write(str(arg))
-
-            _globals = {}
-            _globals.update(globals())
-            _globals['echo'] = echo
-
-            _locals = {}
-            _locals.update(data)
-            _locals.update(self.unpickle(match.group(1)))
-
-            code = compile("\n".join(lines_stripped), '<string>', 'exec')
-            eval(code, _globals, _locals)
-            result = stdout.getvalue()
-            stdout.close()
-            # After eval() nocache.start() will be converted to "<nocache:py ..."
-            # and nocache.end() - to "</nocache>"
-            # So, check again.
-            if self._end in result:
-                result = self.handle(result, **data)
-            return result
-
-        result = self.nocache_re.sub(repl, tpl)
+        result = []
+        pos = 0
+        while True:
+            start = tpl.find(self._start_prefix, pos)
+            if start == -1:
+                break
+            data_start = start + len(self._start_prefix)
+            data_end = tpl.find('">', data_start)
+            if data_end == -1:
+                break
+            code_start = data_end + 2
+            # Nested nocache is created by code of block, so, the first end tag closes the block.
+            end = tpl.find(self._end, code_start + 1)
+            if end == -1:
+                break
+            result.append(tpl[pos:start])
+            result.append(self._execute(tpl[code_start:end], tpl[data_start:data_end], data))
+            pos = end + len(self._end)
+
+        if not pos:
+            return tpl
+        result.append(tpl[pos:])
+        return ''.join(result)
+
+    def iter_handle(self, chunks, encoding='utf-8', **data):
+        """Generator version of handle(), which accepts template as iterable of chunks.
+
+        Spans without nocache blocks are yielded as is, only incomplete block
+        on the boundary of chunks is buffered.
+        Chunks can be bytes as well, then blocks are decoded and encoded by encoding.
+        """
+        buf = None
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if buf is None:
+                binary = isinstance(chunk, bytes)
+                if binary:
+                    start_prefix, data_sep, end_tag = (
+                        i.encode(encoding) for i in (self._start_prefix, '">', self._end)
+                    )
+                else:
+                    start_prefix, data_sep, end_tag = self._start_prefix, '">', self._end
+            buf = buf + chunk if buf else chunk
+            pos = 0
+            while True:
+                start = buf.find(start_prefix, pos)
+                if start == -1:
+                    # Keeps the tail, which can be the beginning of the start tag.
+                    tail = buf.rfind(start_prefix[:1], max(pos, len(buf) - len(start_prefix) + 1))
+                    if tail != -1 and start_prefix.startswith(buf[tail:]):
+                        end = tail
+                    else:
+                        end = len(buf)
+                    if end > pos:
+                        yield buf[pos:end] if pos or end < len(buf) else buf
+                    pos = end
+                    break
+                if start > pos:
+                    yield buf[pos:start]
+                pos = start
+                data_start = start + len(start_prefix)
+                data_end = buf.find(data_sep, data_start)
+                if data_end == -1:
+                    break
+                code_start = data_end + len(data_sep)
+                end = buf.find(end_tag, code_start + 1)
+                if end == -1:
+                    break
+                source, pickled = buf[code_start:end], buf[data_start:data_end]
+                if binary:
+                    source, pickled = source.decode(encoding), pickled.decode('ascii')
+                result = self._execute(source, pickled, data)
+                if result:
+                    yield result.encode(encoding) if binary else result
+                pos = end + len(end_tag)
+            buf = buf[pos:]
+        if buf:
+            yield buf
+
+    def _execute(self, source, pickled, data):
+        if pickled == self._empty_data:
+            pickled = None
+        # Globals are copied, so, "global" statement of block does not leak to other blocks.
+        _globals = dict(self._globals)
+        _locals = NoCacheLocals(self.unpickle, pickled, data)
+        stdout = StringIO()
+        if not hasattr(self._local, 'stdout'):
+            self._local.stdout = []
+        self._local.stdout.append(stdout)
+        try:
+            eval(self._compile(source), _globals, _locals)
+        finally:
+            self._local.stdout.pop()
+        result = stdout.getvalue()
+        stdout.close()
+        # After eval() nocache.start() will be converted to "<nocache:py ..."
+        # and nocache.end() - to "</nocache>"
+        # So, check again.
+        if self._end in result:
+            result = self.handle(result, **data)
         return result
+
+    def _echo(self, *args):
+        stdout = self._local.stdout[-1]
+        for arg in args:
+            stdout.write(str(arg))
+
+    def _compile(self, source):
+        """Returns code of block, memoized by source in bounded LRU."""
+        with self._compiled_lock:
+            code = self._compiled.pop(source, None)
+            if code is not None:
+                self._compiled[source] = code
+                return code
+        code = compile(self._dedent(source), '<string>', 'exec')
+        with self._compiled_lock:
+            self._compiled[source] = code
+            while len(self._compiled) > self.max_compiled:
+                self._compiled.popitem(last=False)
+        return code
+
+    @staticmethod
+    def _dedent(source):
+        lines = [l.rstrip() for l in source.split('\n')]
+        lines_stripped = []
+        start = None
+        for l in lines:
+            if not l:
+                continue
+            if start is None:
+                start = len(l) - len(l.lstrip())
+            lines_stripped.append(l[start:])
+        lines_stripped.append('')
+        return "\n".join(lines_stripped)
@@ -0,0 +1,76 @@
+import random
+import hashlib
+
+
+class PrefetchLearner(object):
+    """Learns keys and tags read by a view, so, the next request to the view can prefetch them.
+
+    The model is stored in cache as a mapping of (version, kind, key) to score.
+    Score is an exponentially weighted frequency of reads: for each learned request
+    it is multiplied by decay, and (1 - decay) is added if the request reads the item.
+    Items with score lower than threshold are not prefetched, and they are forgotten
+    when score falls below the half of threshold. So, with decay=0.8 and threshold=0.3
+    a key read by single request (like a key built from URL arguments) is never prefetched,
+    and a key is prefetched after two consecutive learned requests read it.
+
+    Only a sample_rate fraction of requests is learned (and all requests, while the model is empty),
+    other requests only read the model.
+    """
+    MODEL_TIMEOUT = 24 * 3600
+
+    def __init__(self, decay=0.8, threshold=0.3, max_items=500, sample_rate=0.1):
+        """
+        :type decay: float
+        :type threshold: float
+        :type max_items: int
+        :type sample_rate: float
+        """
+        self.decay = decay
+        self.threshold = threshold
+        self.max_items = max_items
+        self.sample_rate = sample_rate
+
+    def prefetch(self, cache, name):
+        """Prefetches the learned items and starts recording of reads, if the request is sampled.
+
+        :type cache: cache_dependencies.cache.CacheWrapper
+        :type name: str
+        :rtype: dict or None
+        :return: the model, which should be passed to learn(), or None if the request is not sampled
+        """
+        model = cache.cache.get(self.make_key(name)) or {}
+        hints = {}
+        for (version, kind, key), score in model.items():
+            if score >= self.threshold:
+                hints.setdefault(version, {'key': [], 'tag': []})[kind].append(key)
+        for version, version_hints in hints.items():
+            cache.prefetch(version_hints['key'], version_hints['tag'], version)
+        if model and random.random() >= self.sample_rate:
+            return None
+        cache.start_recording()
+        return model
+
+    def learn(self, cache, name, model):
+        """Updates the model by reads recorded since prefetch().
+
+        :type cache: cache_dependencies.cache.CacheWrapper
+        :type name: str
+        :type model: dict or None
+        """
+        if model is None:
+            return
+        reads = cache.stop_recording()
+        new_model = {item: score * self.decay for item, score in model.items()}
+        for item in reads:
+            new_model[item] = new_model.get(item, 0.0) + 1 - self.decay
+        items = sorted(
+            (item for item, score in new_model.items() if score >= self.threshold / 2),
+            key=new_model.get, reverse=True
+        )[:self.max_items]
+        new_model = {item: new_model[item] for item in items}
+        if new_model != model:
+            cache.cache.set(self.make_key(name), new_model, self.MODEL_TIMEOUT)
+
+    @staticmethod
+    def make_key(name):
+        return 'prefetch_{0}'.format(hashlib.md5(name.encode('utf8')).hexdigest())
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import json
+import base64
+import struct
+from cache_dependencies import interfaces, dependencies, compression
+from cache_dependencies.utils import Undef
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    str = unicode  # Python 2.* compatible
+    string_types = (basestring,)
+    integer_types = (int, long)
+except NameError:
+    string_types = (str,)
+    integer_types = (int,)
+
+
+class PickleSerializer(interfaces.ISerializer):
+    name = 'pickle'
+    serializer_id = 2
+
+    def dumps(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class MsgpackSerializer(interfaces.ISerializer):
+    """Requires msgpack package. Supports only plain data: dicts, lists, strings, numbers."""
+    name = 'msgpack'
+    serializer_id = 3
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, value):
+        return self._msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, raw=False)
+
+
+SERIALIZERS = {
+    PickleSerializer.serializer_id: PickleSerializer,
+    MsgpackSerializer.serializer_id: MsgpackSerializer,
+}
+
+
+def get_serializer(name):
+    """Returns serializer by name, or None if its package is not installed.
+
+    :type name: str
+    :rtype: cache_dependencies.interfaces.ISerializer or None
+    :raises KeyError: if serializer is unknown.
+    """
+    for serializer in SERIALIZERS.values():
+        if serializer.name == name:
+            try:
+                return serializer()
+            except ImportError:
+                return None
+    raise KeyError(name)
+
+
+class DependencySerializer(object):
+    """Converts dependencies to plain data, so, reading of records does not unpickle dependencies.
+
+    Dependencies of unknown types are pickled only if pickle_unknown is True,
+    otherwise they can't be saved. Records with unknown or pickled (if it's not allowed)
+    dependencies are read as expired.
+    """
+    TAGS_DEPENDENCIES = {
+        'T': dependencies.TagsDependency,
+        'H': dependencies.HierarchicalTagsDependency,
+        'I': dependencies.InlineStateTagsDependency,
+        'M': dependencies.ModelVersionDependency,
+    }
+
+    def __init__(self, pickle_unknown=False):
+        """
+        :type pickle_unknown: bool
+        """
+        self.pickle_unknown = pickle_unknown
+        self._tags_dependency_codes = {cls: code for code, cls in self.TAGS_DEPENDENCIES.items()}
+
+    def dumps(self, dependency):
+        """
+        :type dependency: cache_dependencies.interfaces.IDependency
+        :rtype: bytes
+        """
+        return json.dumps(self._to_data(dependency), separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        """
+        :type data: bytes
+        :rtype: cache_dependencies.interfaces.IDependency
+        """
+        return self._from_data(json.loads(data.decode('utf-8')))
+
+    def _to_data(self, dependency):
+        dependency_type = type(dependency)
+        if dependency_type in self._tags_dependency_codes:
+            return [self._tags_dependency_codes[dependency_type], sorted(dependency.tags), dependency.tag_versions]
+        elif dependency_type is dependencies.CompositeDependency:
+            return ['C', [self._to_data(delegate) for delegate in dependency.delegates]]
+        elif dependency_type is dependencies.ExpiresAtDependency:
+            return ['E', dependency.expires_at]
+        elif dependency_type is dependencies.DummyDependency:
+            return ['D']
+        elif not self.pickle_unknown:
+            raise TypeError("Dependency of type {0} can't be serialized without pickle".format(dependency_type))
+        return ['P', base64.standard_b64encode(pickle.dumps(dependency, pickle.HIGHEST_PROTOCOL)).decode('ascii')]
+
+    def _from_data(self, data):
+        code = data[0]
+        if code in self.TAGS_DEPENDENCIES:
+            cls = self.TAGS_DEPENDENCIES[code]
+            dependency = cls.__new__(cls)
+            dependency.tags = set(data[1])
+            dependency.tag_versions = data[2]
+            return dependency
+        elif code == 'C':
+            return dependencies.CompositeDependency(*map(self._from_data, data[1]))
+        elif code == 'E':
+            return dependencies.ExpiresAtDependency(data[1])
+        elif code == 'D':
+            return dependencies.DummyDependency()
+        elif code == 'P' and self.pickle_unknown:
+            return pickle.loads(base64.standard_b64decode(data[1].encode('ascii')))
+        return dependencies.ExpiresAtDependency(0)  # Unknown dependency, record is read as expired.
+
+
+class LazyValue(object):
+    """Value of cache record, which is decoded by the first get()."""
+
+    def __init__(self, load, *args):
+        """
+        :type load: collections.Callable
+        """
+        self._load = load
+        self._args = args
+        self._value = Undef
+
+    def get(self):
+        if self._value is Undef:
+            self._value = self._load(*self._args)
+            self._load = self._args = None
+        return self._value
+
+
+class RecordSerializer(object):
+    """Serializes value and dependency of cache record to bytes.
+
+    Layout: magic, type of value (bytes, text or serializer_id), codec_id of compressor or 0,
+    dictionary_id of compressor, length of dependency, dependency, value.
+    Bytes and text values are not serialized, other values are serialized by serializer.
+    Values of compress_threshold bytes or more are compressed by compressor, if it's given.
+    """
+    MAGIC = b'\x00CDR'
+    BYTES = 0
+    TEXT = 1
+    _head = struct.Struct('!4sBBII')
+
+    def __init__(self, serializer=None, compressor=None, compress_threshold=1024, pickle_dependencies=False):
+        """
+        :type serializer: cache_dependencies.interfaces.ISerializer or None
+        :type compressor: cache_dependencies.interfaces.ICompressor or None
+        :type compress_threshold: int
+        :type pickle_dependencies: bool
+        """
+        self.serializer = serializer or PickleSerializer()
+        self.compressor = compressor
+        self.compress_threshold = compress_threshold
+        self.dependency_serializer = DependencySerializer(pickle_dependencies)
+
+    def dumps(self, value, dependency):
+        """
+        :type value: object
+        :type dependency: cache_dependencies.interfaces.IDependency
+        :rtype: bytes
+        """
+        if isinstance(value, bytes):
+            value_type, data = self.BYTES, value
+        elif isinstance(value, str):
+            value_type, data = self.TEXT, value.encode('utf-8')
+        else:
+            value_type, data = self.serializer.serializer_id, self.serializer.dumps(value)
+        codec_id = dictionary_id = 0
+        if self.compressor is not None and len(data) >= self.compress_threshold:
+            data, codec_id = self.compressor.compress(data), self.compressor.codec_id
+            dictionary_id = self.compressor.dictionary_id
+        dependency_data = self.dependency_serializer.dumps(dependency)
+        return b''.join((
+            self._head.pack(self.MAGIC, value_type, codec_id, dictionary_id, len(dependency_data)),
+            dependency_data,
+            data
+        ))
+
+    def loads(self, data):
+        """Returns value and dependency.
+
+        Value is None (missed), if compressor or serializer of value is not installed,
+        or if the value is compressed with another dictionary or can't be decompressed.
+
+        :type data: bytes
+        :rtype: (object, cache_dependencies.interfaces.IDependency)
+        """
+        value, dependency = self.loads_lazy(data)
+        return value.get(), dependency
+
+    def loads_lazy(self, data):
+        """Returns lazy value and dependency.
+
+        Only the dependency is decoded, the payload of value is not even copied
+        until value.get() is called, so, invalid records cost almost nothing.
+
+        :type data: bytes
+        :rtype: (cache_dependencies.serializers.LazyValue, cache_dependencies.interfaces.IDependency)
+        """
+        magic, value_type, codec_id, dictionary_id, dependency_length = self._head.unpack_from(data)
+        offset = self._head.size
+        dependency = self.dependency_serializer.loads(data[offset:offset + dependency_length])
+        return LazyValue(
+            self._load_value, data, offset + dependency_length, value_type, codec_id, dictionary_id
+        ), dependency
+
+    def is_record(self, data):
+        return isinstance(data, bytes) and data[:len(self.MAGIC)] == self.MAGIC
+
+    def _load_value(self, data, offset, value_type, codec_id, dictionary_id):
+        data = data[offset:]
+        if codec_id:
+            if self.compressor is not None and self.compressor.codec_id == codec_id:
+                compressor = self.compressor
+            else:
+                compressor = compression.get_compressor_by_id(codec_id)
+            if compressor is None or compressor.dictionary_id != dictionary_id:
+                return None
+            try:
+                data = compressor.decompress(data)
+            except Exception:  # Each codec has own error type, corrupted value is a miss.
+                return None
+        if value_type == self.BYTES:
+            return data
+        elif value_type == self.TEXT:
+            return data.decode('utf-8')
+        if value_type == self.serializer.serializer_id:
+            serializer = self.serializer
+        else:
+            try:
+                serializer = SERIALIZERS[value_type]()
+            except (KeyError, ImportError):
+                return None
+        return serializer.loads(data)
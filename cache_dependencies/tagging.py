@@ -6,9 +6,13 @@ from cache_dependencies.cache import CacheWrapper
 
 class CacheTagging(object):  # Backward compatibility
 
-    def __init__(self, cache, relation_manager, transaction):
+    dependency_factory = dependencies.TagsDependency
+
+    def __init__(self, cache, relation_manager, transaction, dependency_factory=None, **kwargs):
         """Constructor of cache instance."""
-        self.cache = CacheWrapper(cache, relation_manager, transaction)
+        self.cache = CacheWrapper(cache, relation_manager, transaction, **kwargs)
+        if dependency_factory is not None:
+            self.dependency_factory = dependency_factory
 
     def get_or_set_callback(self, key, callback, tags=(), timeout=None,
                             version=None, args=None, kwargs=None):
@@ -34,7 +38,7 @@ class CacheTagging(object):  # Backward compatibility
         if isinstance(tags, interfaces.IDependency):
             dependency = tags
         elif tags:
-            dependency = dependencies.TagsDependency(tags)
+            dependency = self.dependency_factory(tags)
         else:
             dependency = dependencies.DummyDependency()
         self.cache.set(key, value, dependency, timeout, version)
@@ -44,9 +48,9 @@ class CacheTagging(object):  # Backward compatibility
         if len(tags) == 1 and isinstance(tags[0], interfaces.IDependency):
             dependency = tags[0]
         elif len(tags) == 1 and isinstance(tags[0], (list, tuple, set, frozenset)):
-            dependency = dependencies.TagsDependency(tags[0])
+            dependency = self.dependency_factory(tags[0])
         elif tags:
-            dependency = dependencies.TagsDependency(tags)
+            dependency = self.dependency_factory(tags)
         else:
             dependency = dependencies.DummyDependency()
         version = kwargs.get('version', None)
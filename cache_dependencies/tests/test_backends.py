@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from cache_dependencies import backends, cache, dependencies, locks, relations, transaction, utils
+
+
+class SqliteCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.cache = backends.SqliteCache(os.path.join(self.dirname, 'cache.sqlite3'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dirname)
+
+    def test_set_get(self):
+        self.cache.set('key1', {'a': 1})
+        self.assertEqual(self.cache.get('key1'), {'a': 1})
+        self.assertIsNone(self.cache.get('key2'))
+        self.assertEqual(self.cache.get('key2', 5), 5)
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('key1', 'value1'))
+        self.assertFalse(self.cache.add('key1', 'value2'))
+        self.assertEqual(self.cache.get('key1'), 'value1')
+
+    def test_expiration(self):
+        self.cache.set('key1', 'value1', 1)
+        time.sleep(1.1)
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertFalse(self.cache.has_key('key1'))
+        self.assertTrue(self.cache.add('key1', 'value2'))
+        self.assertEqual(self.cache.get('key1'), 'value2')
+
+    def test_get_many(self):
+        self.cache.set_many({'key1': 'value1', 'key2': 'value2'})
+        self.assertDictEqual(self.cache.get_many(['key1', 'key2', 'key3']), {'key1': 'value1', 'key2': 'value2'})
+
+    def test_version(self):
+        self.cache.set('key1', 'value1', version=2)
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertEqual(self.cache.get('key1', version=2), 'value1')
+
+    def test_persistence(self):
+        self.cache.set('key1', 'value1')
+        other = backends.SqliteCache(self.cache.path)
+        self.assertEqual(other.get('key1'), 'value1')
+        other.close()
+
+    def test_delete_tagged(self):
+        self.cache.set_tagged('key1', 'value1', ('tag1', 'tag2'))
+        self.cache.set_tagged('key2', 'value2', ('tag2',))
+        self.cache.set_tagged('key3', 'value3', ('tag3',))
+        self.cache.delete_many([utils.make_tag_key('tag2')])
+        self.assertDictEqual(self.cache.get_many(['key1', 'key2', 'key3']), {'key3': 'value3'})
+
+    def test_retag(self):
+        self.cache.set_tagged('key1', 'value1', ('tag1',))
+        self.cache.set_tagged('key1', 'value1', ('tag2',))
+        self.cache.delete(utils.make_tag_key('tag1'))
+        self.assertEqual(self.cache.get('key1'), 'value1')
+        self.cache.delete(utils.make_tag_key('tag2'))
+        self.assertIsNone(self.cache.get('key1'))
+
+
+class SqliteCacheWrapperTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.backend = backends.SqliteCache(os.path.join(self.dirname, 'cache.sqlite3'))
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(lock)
+        )
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.dirname)
+
+    def test_invalidate(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1', 'tag2'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag3'))
+        self.assertEqual(self.cache.get('name1'), 'value1')
+        self.assertDictEqual(self.cache.get_many(['name1', 'name2']), {'name1': 'value1', 'name2': 'value2'})
+
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag2'))
+        self.assertIsNone(self.backend.get('name1'))
+        self.assertIsNone(self.cache.get('name1'))
+        self.assertEqual(self.cache.get('name2'), 'value2')
+
+    def test_descendants(self):
+        self.assertIsNone(self.cache.get('name1'))
+        self.assertIsNone(self.cache.get('name2'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'))
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag2'))
+        self.assertIsNone(self.cache.get('name2'))
+        self.assertIsNone(self.cache.get('name1'))
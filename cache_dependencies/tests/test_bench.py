@@ -0,0 +1,38 @@
+import json
+import unittest
+from cache_dependencies import bench
+
+
+class BenchTestCase(unittest.TestCase):
+
+    def test_run(self):
+        report = bench.run(['get_valid', 'nocache'], 'stub', repeat=5)
+        self.assertListEqual([result['name'] for result in report['results']], ['get_valid', 'nocache_render'])
+        for result in report['results']:
+            self.assertLessEqual(result['min_us'], result['p50_us'])
+            self.assertLessEqual(result['p50_us'], result['p99_us'])
+            self.assertLessEqual(result['p99_us'], result['max_us'])
+        json.dumps(report)
+        self.assertIn('get_valid', bench.format_report(report))
+
+    @unittest.skipIf(bench.django is None, 'Django is not installed')
+    def test_template_render(self):
+        report = bench.run(['template_render'], 'stub', repeat=5)
+        for result in report['results']:
+            self.assertNotIn('error', result)
+
+    def test_compare(self):
+        baseline = {'results': [{'name': 'a', 'p50_us': 10.0}, {'name': 'b', 'p50_us': 10.0}]}
+        report = {'results': [
+            {'name': 'a', 'p50_us': 10.5},
+            {'name': 'b', 'p50_us': 12.0},
+            {'name': 'c', 'p50_us': 100.0},
+        ]}
+        self.assertListEqual(bench.compare(report, baseline, 10), [('b', 10.0, 12.0)])
+        report['results'][0] = {'name': 'a', 'error': 'Error'}
+        self.assertListEqual([name for name, base, current in bench.compare(report, baseline, 50)], ['a'])
+
+    def test_percentile(self):
+        self.assertEqual(bench.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 50), 3.0)
+        self.assertEqual(bench.percentile([1.0, 2.0], 50), 1.5)
+        self.assertEqual(bench.percentile([1.0, 2.0], 100), 2.0)
@@ -0,0 +1,231 @@
+import time
+import unittest
+from cache_dependencies import cache, compression, dependencies, locks, relations, serializers, transaction
+from cache_dependencies.tests import helpers
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class CacheWrapperWriteBehindTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('REPEATABLE READ', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(lock), write_behind=True
+        )
+
+    def test_set_is_buffered(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.assertIsNone(self.backend.get('name1'))
+        self.cache.close()
+        self.assertEqual(self.cache.get('name1'), 'value1')
+
+    def test_last_set_wins(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'), 100)
+        self.cache.set('name1', 'value2', dependencies.TagsDependency('tag1'), 200)
+        self.cache.close()
+        self.assertEqual(self.cache.get('name1'), 'value2')
+
+    def test_round_trips(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'), 100)
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'), 100)
+        self.cache.set('name3', 'value3', dependencies.TagsDependency('tag1', 'tag3'), 200)
+        self.cache.set('name4', 'value4', dependencies.TagsDependency('tag4'), 200)
+        with mock.patch.object(self.backend, 'get_many', wraps=self.backend.get_many) as get_many, \
+                mock.patch.object(self.backend, 'set_many', wraps=self.backend.set_many) as set_many:
+            self.cache.close()
+        self.assertEqual(get_many.call_count, 0)
+        timeouts = sorted(args[1] for args, kwargs in set_many.call_args_list if 'name1' in args[0] or
+                          'name3' in args[0])
+        self.assertListEqual(timeouts, [100, 200])
+        self.assertDictEqual(self.cache.get_many(['name1', 'name2', 'name3', 'name4']),
+                             {'name1': 'value1', 'name2': 'value2', 'name3': 'value3', 'name4': 'value4'})
+
+    def test_locked_record_is_skipped(self):
+        concurrent_transaction = mock.Mock(get_session_id=lambda: 'concurrent', get_start_time=time.time)
+        dependencies.TagsDependency('tag1').acquire(self.backend, concurrent_transaction, None)
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'))
+        self.cache.close()
+        self.assertIsNone(self.backend.get('name1'))
+        self.assertEqual(self.cache.get('name2'), 'value2')
+
+    def test_concurrent_invalidation(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        dependencies.TagsDependency('tag1').invalidate(self.backend, None)
+        self.cache.close()
+        self.assertIsNotNone(self.backend.get('name1'))
+        self.assertIsNone(self.cache.get('name1'))
+
+    def test_invalidation_drops_buffered_records(self):
+        self.cache.transaction.begin()
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'))
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.cache.transaction.finish()
+        self.cache.close()
+        self.assertIsNone(self.backend.get('name1'))
+        self.assertEqual(self.cache.get('name2'), 'value2')
+
+
+class CacheWrapperPrefetchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(self.backend, relations.RelationManager(), transaction.TransactionManager(lock))
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag1', 'tag2'))
+
+    def test_prefetch_keys(self):
+        with mock.patch.object(self.backend, 'get_many', wraps=self.backend.get_many) as get_many:
+            self.cache.prefetch(['name1', 'name2', 'name3'])
+            self.assertEqual(get_many.call_count, 2)  # Tags of records are not hinted
+            self.assertEqual(self.cache.get('name1'), 'value1')
+            self.assertIsNone(self.cache.get('name3'))
+            self.assertDictEqual(self.cache.get_many(['name1', 'name2']), {'name1': 'value1', 'name2': 'value2'})
+        self.assertEqual(get_many.call_count, 2)
+
+    def test_prefetch_tags(self):
+        with mock.patch.object(self.backend, 'get_many', wraps=self.backend.get_many) as get_many:
+            self.cache.prefetch(['name1', 'name2'], ['tag1', 'tag2'])
+            self.assertEqual(self.cache.get('name2'), 'value2')
+        self.assertEqual(get_many.call_count, 1)
+
+    def test_invalidate(self):
+        self.cache.prefetch(['name1', 'name2'], ['tag1', 'tag2'])
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag2'))
+        self.assertEqual(self.cache.get('name1'), 'value1')
+        self.assertIsNone(self.cache.get('name2'))
+
+    def test_set(self):
+        self.cache.prefetch(['name1', 'name3'], ['tag1'])
+        self.cache.set('name3', 'value3', dependencies.TagsDependency('tag1'))
+        self.assertEqual(self.cache.get('name3'), 'value3')
+        self.cache.close()
+        self.assertDictEqual(self.cache._prefetched, {})
+
+
+class CacheWrapperCompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.compressor = compression.ZlibCompressor(dictionary=b'<div class="fragment">')
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(lock),
+            compressor=self.compressor, compress_threshold=100
+        )
+
+    def test_compress(self):
+        value = '<div class="fragment">value</div>' * 10
+        self.cache.set('name1', value, dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag1'))
+        data = self.backend.get('name1')
+        self.assertEqual(data[5], compression.ZlibCompressor.codec_id)
+        self.assertLess(len(data), len(value))
+        self.assertEqual(self.backend.get('name2')[5], 0)
+        self.assertEqual(self.cache.get('name1'), value)
+        self.assertDictEqual(self.cache.get_many(['name1', 'name2']), {'name1': value, 'name2': 'value2'})
+
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.assertIsNone(self.cache.get('name1'))
+
+    def test_unavailable_compressor(self):
+        self.cache.set('name1', 'value' * 100, dependencies.TagsDependency('tag1'))
+        self.cache.record_serializer.compressor = None
+        with mock.patch.object(compression, 'get_compressor_by_id', return_value=None):
+            self.assertIsNone(self.cache.get('name1'))
+
+    def test_another_dictionary(self):
+        self.cache.set('name1', 'value' * 100, dependencies.TagsDependency('tag1'))
+        self.cache.record_serializer.compressor = compression.ZlibCompressor(dictionary=b'<p class="other">')
+        self.assertIsNone(self.cache.get('name1'))
+        self.cache.record_serializer.compressor = None
+        self.assertIsNone(self.cache.get('name1'))
+
+    def test_corrupted_value(self):
+        self.cache.set('name1', 'value' * 100, dependencies.TagsDependency('tag1'))
+        data = self.backend.get('name1')
+        compressed = self.compressor.compress(('value' * 100).encode('utf-8'))
+        self.backend.set('name1', data[:-len(compressed)] + b'not deflate')
+        self.assertIsNone(self.cache.get('name1'))
+        self.assertDictEqual(self.cache.get_many(['name1']), {})
+
+
+class CustomDependency(dependencies.DummyDependency):
+    pass
+
+
+class CacheWrapperSerializationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(self.backend, relations.RelationManager(), transaction.TransactionManager(lock))
+
+    def test_values(self):
+        values = {
+            'bytes': b'value',
+            'text': 'юникод',
+            'object': {'key': [1, 2.5, None]},
+        }
+        for key, value in values.items():
+            self.cache.set(key, value, dependencies.TagsDependency('tag1'))
+            self.assertIsInstance(self.backend.get(key), bytes)
+        self.assertDictEqual(self.cache.get_many(list(values.keys())), values)
+
+    def test_dependencies(self):
+        dependency = dependencies.CompositeDependency(
+            dependencies.TagsDependency('tag1'),
+            dependencies.HierarchicalTagsDependency('blog.entry'),
+            dependencies.ExpiresAtDependency(time.time() + 100),
+        )
+        self.cache.set('name1', 'value1', dependency)
+        data = self.backend.get('name1')
+        with mock.patch.object(serializers.pickle, 'loads') as loads:
+            value, restored = self.cache._unpack_data(data)
+        self.assertFalse(loads.called)
+        self.assertEqual(value, 'value1')
+        self.assertTrue(set(map(type, dependency.delegates)) <= set(map(type, restored.delegates)))
+        self.assertEqual(self.cache.get('name1'), 'value1')
+        self.cache.invalidate_dependency(dependencies.TagsDependency('blog'))
+        self.assertIsNone(self.cache.get('name1'))
+
+    def test_custom_dependency(self):
+        with self.assertRaises(TypeError):
+            self.cache.set('name1', 'value1', CustomDependency())
+
+        pickling_cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), self.cache.transaction, pickle_dependencies=True
+        )
+        pickling_cache.set('name1', 'value1', CustomDependency())
+        self.assertEqual(pickling_cache.get('name1'), 'value1')
+        self.assertIsNone(self.cache.get('name1'))
+
+    def test_get_serializer(self):
+        self.assertIsInstance(serializers.get_serializer('pickle'), serializers.PickleSerializer)
+        with self.assertRaises(KeyError):
+            serializers.get_serializer('unknown')
+        with mock.patch.dict('sys.modules', {'msgpack': None}):
+            self.assertIsNone(serializers.get_serializer('msgpack'))
+
+    def test_legacy_record(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        value, dependency = self.cache._unpack_data(self.backend.get('name1'))
+        self.backend.set('name1', {'__value': value, '__dependency': dependency})
+        self.assertEqual(self.cache.get('name1'), 'value1')
+
+    def test_lazy_value(self):
+        self.cache.set('name1', {'key': 'value1'}, dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', {'key': 'value2'}, dependencies.TagsDependency('tag2'))
+        serializer = self.cache.record_serializer.serializer
+        with mock.patch.object(serializer, 'loads', wraps=serializer.loads) as loads:
+            self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+            self.assertIsNone(self.cache.get('name1'))
+            self.assertDictEqual(self.cache.get_many(['name1', 'name2']), {'name2': {'key': 'value2'}})
+        self.assertEqual(loads.call_count, 1)
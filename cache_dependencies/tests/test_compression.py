@@ -0,0 +1,33 @@
+import unittest
+from cache_dependencies import compression
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class CompressionTestCase(unittest.TestCase):
+
+    def test_gzip(self):
+        compressor = compression.get_compressor('gzip')
+        data = b'value' * 100
+        compressed = compressor.compress(data)
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(compressor.decompress(compressed), data)
+
+    def test_unavailable(self):
+        with mock.patch.dict('sys.modules', {'brotli': None, 'zstandard': None}):
+            self.assertIsNone(compression.get_compressor('br'))
+            self.assertIsNone(compression.get_compressor('zstd'))
+            self.assertListEqual(
+                [i.name for i in compression.get_available_compressors(('br', 'zstd', 'gzip'))],
+                ['gzip']
+            )
+
+    def test_parse_accept_encoding(self):
+        self.assertSetEqual(
+            compression.parse_accept_encoding('gzip, deflate;q=0.5, BR;q=1.0, zstd;q=0, *;q=0.1'),
+            {'gzip', 'deflate', 'br', '*'}
+        )
+        self.assertSetEqual(compression.parse_accept_encoding(''), set())
@@ -1,6 +1,6 @@
 import time
 import unittest
-from cache_dependencies import dependencies, exceptions, interfaces, utils
+from cache_dependencies import defer, dependencies, exceptions, interfaces, utils
 from cache_dependencies.tests import helpers
 
 try:
@@ -16,6 +16,7 @@ class AbstractTagsDependencyTestCase(unittest.TestCase):
     """
 
     delay = 0
+    dependency_factory = dependencies.TagsDependency
 
     def setUp(self):
 
@@ -35,7 +36,7 @@ class AbstractTagsDependencyTestCase(unittest.TestCase):
         self.transaction.get_end_time.return_value = self.end_time
         self.transaction.get_session_id.return_value = 'ivan-X555LF.21920.140481146955584'
 
-        self.dependency = dependencies.TagsDependency(*self.tag_versions.keys())
+        self.dependency = self.dependency_factory(*self.tag_versions.keys())
         self.dependency.tag_versions = self.tag_versions
 
         self.concurrent_transaction = mock.Mock(interfaces.ITransaction)
@@ -43,7 +44,7 @@ class AbstractTagsDependencyTestCase(unittest.TestCase):
         self.concurrent_transaction.get_end_time.return_value = self.end_time
         self.concurrent_transaction.get_session_id.return_value = 'ivan-X555LF.21920.140481146955584' + '1'
 
-        self.concurrent_dependency = dependencies.TagsDependency(*self.tag_versions.keys())
+        self.concurrent_dependency = self.dependency_factory(*self.tag_versions.keys())
         self.concurrent_dependency.tag_versions = self.tag_versions
 
     def _set_tag_versions(self):
@@ -74,6 +75,14 @@ class TagsDependencyTestCase(AbstractTagsDependencyTestCase):
         for k, v in self.dependency.tag_versions.items():
             self.assertNotEqual(v, self.tag_versions[k])
 
+    def test_evaluate_without_transaction(self):
+        self.dependency.acquire(self.cache, self.transaction, None)
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many:
+            self.concurrent_dependency.evaluate(self.cache, None, None)
+        self.assertEqual(get_many.call_count, 1)
+        self.assertLessEqual(len(get_many.call_args[0][0]), len(self.tag_versions))
+        self.assertDictEqual(self.concurrent_dependency.tag_versions, self.tag_versions)
+
     def test_acquire(self):
         tags = set(self.tag_versions.keys())
         self.dependency.acquire(self.cache, self.transaction, None)
@@ -241,6 +250,261 @@ class TagsDependencyTestCase(AbstractTagsDependencyTestCase):
         self.assertDictEqual(tag_versions_in_later_concurrent_transaction, self.tag_versions)
 
 
+class TagStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.transaction = mock.Mock(interfaces.ITransaction)
+        self.transaction.get_start_time.return_value = 100.5
+        self.transaction.get_end_time.return_value = 102.5
+        self.transaction.get_session_id.return_value = 'host.1.2'
+
+    def test_dumps(self):
+        acquired = dependencies.AcquiredTagState(self.transaction)
+        released = dependencies.ReleasedTagState(self.transaction, 3)
+        for state in (acquired, released):
+            data = state.dumps()
+            self.assertIsInstance(data, bytes)
+            restored = dependencies.AbstractTagState.loads(data)
+            self.assertIs(type(restored), type(state))
+            self.assertDictEqual(restored.__dict__, state.__dict__)
+        self.assertIs(dependencies.AbstractTagState.loads(acquired), acquired)
+
+
+class InlineStateTagsDependencyTestCase(TagsDependencyTestCase):
+    dependency_factory = dependencies.InlineStateTagsDependency
+
+    def test_evaluate_keys(self):
+        self.dependency.acquire(self.cache, self.transaction, None)
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many:
+            self.dependency.evaluate(self.cache, self.transaction, None)
+        get_many.assert_called_once_with(mock.ANY, None)
+        self.assertSetEqual(set(get_many.call_args[0][0]), set(
+            key for tag in self.tag_versions for key in (
+                utils.make_tag_key(tag),
+                dependencies.AcquiredTagState.make_key(tag),
+                dependencies.ReleasedTagState.make_key(tag),
+            )
+        ))
+        self.assertDictEqual(self.dependency.tag_versions, self.tag_versions)
+
+    def test_writes(self):
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many, \
+                mock.patch.object(self.cache, 'set_many', wraps=self.cache.set_many) as set_many, \
+                mock.patch.object(self.cache, 'delete_many', wraps=self.cache.delete_many) as delete_many:
+            self.dependency.acquire(self.cache, self.transaction, None)
+            self.dependency.invalidate(self.cache, None)
+            self.dependency.release(self.cache, self.transaction, 1, None)
+        self.assertFalse(get_many.called)
+        self.assertEqual(set_many.call_count, 2)
+        self.assertEqual(delete_many.call_count, 1)
+
+    def test_invalidate_keeps_state(self):
+        self.dependency.acquire(self.cache, self.transaction, None)
+        self.dependency.invalidate(self.cache, None)
+        with self.assertRaises(exceptions.TagsLocked):
+            self.concurrent_dependency.evaluate(self.cache, self.concurrent_transaction, None)
+        self.dependency.evaluate(self.cache, self.transaction, None)
+        for k, v in self.dependency.tag_versions.items():
+            self.assertNotEqual(v, self.tag_versions[k])
+
+    def test_acquire_between_read_and_creation(self):
+        dependency = self.dependency_factory('tag4')
+        get_many = self.cache.get_many
+
+        def interleaved_get_many(*args, **kwargs):
+            result = get_many(*args, **kwargs)
+            self.cache.get_many = get_many
+            self.concurrent_dependency.__class__('tag4').acquire(self.cache, self.concurrent_transaction, None)
+            return result
+
+        self.cache.get_many = interleaved_get_many
+        dependency.evaluate(self.cache, self.transaction, None)
+        self.assertIn('tag4', dependency.tag_versions)
+        with self.assertRaises(exceptions.TagsLocked):
+            self.dependency_factory('tag4').evaluate(self.cache, self.transaction, None)
+
+    def test_legacy_record(self):
+        self.cache.set_many({
+            utils.make_tag_key(tag): (tag_version, None, None) for tag, tag_version in self.tag_versions.items()
+        }, 3600)
+        self.dependency.evaluate(self.cache, self.transaction, None)
+        self.assertDictEqual(self.dependency.tag_versions, self.tag_versions)
+        self.dependency.validate(self.cache, None).get()
+
+
+class HierarchicalTagsDependencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = helpers.CacheStub()
+        self.transaction = mock.Mock(interfaces.ITransaction)
+        self.transaction.get_start_time.return_value = time.time() - 2
+        self.transaction.get_session_id.return_value = 'ivan-X555LF.21920.140481146955584'
+
+    def test_get_validated_tags(self):
+        dependency = dependencies.HierarchicalTagsDependency('a.b.c', 'a.d')
+        self.assertSetEqual(dependency.get_validated_tags(), {'a', 'a.b', 'a.b.c', 'a.d'})
+
+    def test_invalidate_subtree(self):
+        dependency1 = dependencies.HierarchicalTagsDependency('categories.category.pk:15.blog.type.pk:3')
+        dependency2 = dependencies.HierarchicalTagsDependency('categories.category.pk:16.blog.type.pk:3')
+        dependency1.evaluate(self.cache, self.transaction, None)
+        dependency2.evaluate(self.cache, self.transaction, None)
+        self.assertEqual(len(dependency1.tag_versions), 6)
+        dependency1.validate(self.cache, None).get()
+        dependency2.validate(self.cache, None).get()
+
+        dependencies.TagsDependency('categories.category.pk:15').invalidate(self.cache, None)
+        with self.assertRaises(exceptions.TagsInvalid) as cm:
+            dependency1.validate(self.cache, None).get()
+        self.assertSetEqual(set(cm.exception.errors), {'categories.category.pk:15'})
+        dependency2.validate(self.cache, None).get()
+
+    def test_invalidate_leaf(self):
+        dependency1 = dependencies.HierarchicalTagsDependency('a.b.c')
+        dependency2 = dependencies.HierarchicalTagsDependency('a.b')
+        dependency1.evaluate(self.cache, self.transaction, None)
+        dependency2.evaluate(self.cache, self.transaction, None)
+        dependency1.invalidate(self.cache, None)
+        with self.assertRaises(exceptions.TagsInvalid):
+            dependency1.validate(self.cache, None).get()
+        dependency2.validate(self.cache, None).get()
+
+    def test_locked_ancestor(self):
+        dependencies.TagsDependency('a').acquire(self.cache, self.transaction, None)
+        concurrent_transaction = mock.Mock(interfaces.ITransaction)
+        concurrent_transaction.get_start_time.return_value = time.time()
+        concurrent_transaction.get_session_id.return_value = 'concurrent'
+        with self.assertRaises(exceptions.TagsLocked) as cm:
+            dependencies.HierarchicalTagsDependency('a.b').evaluate(self.cache, concurrent_transaction, None)
+        self.assertSetEqual(set(cm.exception.items), {'a'})
+
+    def test_extend(self):
+        dependency = dependencies.HierarchicalTagsDependency('a.b')
+        self.assertFalse(dependency.extend(dependencies.TagsDependency('c')))
+        self.assertFalse(dependencies.TagsDependency('c').extend(dependency))
+        self.assertTrue(dependency.extend(dependencies.HierarchicalTagsDependency('d')))
+        self.assertSetEqual(dependency.tags, {'a.b', 'd'})
+
+
+class ModelVersionDependencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = helpers.CacheStub()
+        self.transaction = mock.Mock(interfaces.ITransaction)
+        self.transaction.get_start_time.return_value = time.time() - 2
+        self.transaction.get_session_id.return_value = 'ivan-X555LF.21920.140481146955584'
+
+    def test_invalidate(self):
+        dependency = dependencies.ModelVersionDependency('blog.post', 'blog.category')
+        dependency.evaluate(self.cache, self.transaction, None)
+        dependency.validate(self.cache, None).get()
+        tag = dependencies.ModelVersionDependency.make_tag('blog.post')
+        counter = self.cache.get(utils.make_tag_key(tag))
+        self.assertEqual(dependency.tag_versions[tag], counter)
+
+        dependencies.ModelVersionDependency('blog.post').invalidate(self.cache, None)
+        self.assertEqual(self.cache.get(utils.make_tag_key(tag)), counter + 1)
+        with self.assertRaises(exceptions.TagsInvalid) as cm:
+            dependency.validate(self.cache, None).get()
+        self.assertSetEqual(set(cm.exception.errors), {tag})
+
+    def test_invalidate_nonexistent(self):
+        dependencies.ModelVersionDependency('blog.post').invalidate(self.cache, None)
+        self.assertIsNone(self.cache.get(utils.make_tag_key(dependencies.ModelVersionDependency.make_tag('blog.post'))))
+
+    def test_tags_namespace(self):
+        dependency = dependencies.ModelVersionDependency('blog.post')
+        dependency.evaluate(self.cache, self.transaction, None)
+        dependencies.TagsDependency('blog.post').invalidate(self.cache, None)
+        dependency.validate(self.cache, None).get()
+
+
+class ExpiresAtDependencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = mock.Mock(wraps=helpers.CacheStub())
+
+    def test_validate(self):
+        dependencies.ExpiresAtDependency(time.time() + 10).validate(self.cache, None).get()
+        with self.assertRaises(exceptions.ExpiresAtInvalid):
+            dependencies.ExpiresAtDependency(time.time() - 1).validate(self.cache, None).get()
+        self.cache.get_many.assert_not_called()
+
+    def test_extend(self):
+        now = time.time()
+        dependency = dependencies.ExpiresAtDependency(now + 10)
+        self.assertTrue(dependency.extend(dependencies.ExpiresAtDependency(now + 5)))
+        self.assertTrue(dependency.extend(dependencies.ExpiresAtDependency(now + 20)))
+        self.assertEqual(dependency.expires_at, now + 5)
+        self.assertFalse(dependency.extend(dependencies.DummyDependency()))
+
+    def test_composite_short_circuit(self):
+        dependency = dependencies.CompositeDependency()
+        dependency.extend(dependencies.TagsDependency('tag1', 'tag2'))
+        dependency.extend(dependencies.ExpiresAtDependency(time.time() - 1))
+        with self.assertRaises(exceptions.CompositeDependencyInvalid) as cm:
+            dependency.validate(self.cache, None).get()
+        self.assertIsInstance(list(cm.exception)[0], exceptions.ExpiresAtInvalid)
+        self.cache.get_many.assert_not_called()
+
+    def test_composite_valid(self):
+        tags_dependency = dependencies.TagsDependency('tag1')
+        tags_dependency.tag_versions = {'tag1': 'version1'}
+        self.cache.set(utils.make_tag_key('tag1'), 'version1')
+        dependency = dependencies.CompositeDependency(
+            dependencies.ExpiresAtDependency(time.time() + 10), dependencies.DummyDependency(), tags_dependency
+        )
+        dependency.validate(self.cache, None).get()
+        self.assertEqual(self.cache.get_many.call_count, 1)
+
+
+class CompositeDependencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = helpers.CacheStub()
+        self.executor1 = mock.Mock(return_value={})
+        self.executor2 = mock.Mock(return_value={})
+        self.dependency = dependencies.CompositeDependency(
+            self._make_dependency(self.executor1), self._make_dependency(self.executor2)
+        )
+
+    def test_validate(self):
+        with self.assertRaises(exceptions.CompositeDependencyInvalid) as cm:
+            self.dependency.validate(self.cache, None).get()
+        self.assertEqual(len(list(cm.exception)), 2)
+        self.assertEqual(self.executor1.call_count, 1)
+        self.assertEqual(self.executor2.call_count, 1)
+
+    def test_evaluate_aggregated(self):
+        dependency1 = dependencies.TagsDependency('tag1')
+        dependency2 = dependencies.TagsDependency('tag1', 'tag2')
+        dependency = dependencies.CompositeDependency(
+            dependencies.CompositeDependency(dependency1), dependencies.CompositeDependency(dependency2)
+        )
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many:
+            dependency.evaluate(self.cache, None, None)
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(dependency1.tag_versions['tag1'], dependency2.tag_versions['tag1'])
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many:
+            dependency.validate(self.cache, None).get()
+        self.assertEqual(get_many.call_count, 1)
+
+    @staticmethod
+    def _make_dependency(executor):
+        dependency = mock.Mock(spec=interfaces.IDependency)
+
+        def validate(cache, version):
+            def callback(node, caches, keys):
+                raise exceptions.TagsInvalid(dependency, keys)
+
+            deferred = defer.Deferred(executor, defer.GetManyDeferredIterator)
+            deferred.add_callback(callback, ('key',))
+            return deferred
+
+        dependency.validate.side_effect = validate
+        return dependency
+
+
 class CompositeDependencyInvalidTestCase(unittest.TestCase):
     def test_invalid(self):
         errors1 = ('err1', 'err2')
@@ -0,0 +1,79 @@
+import time
+import unittest
+from cache_dependencies import cache, dependencies, index, locks, relations, transaction
+from cache_dependencies.tests import helpers
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class TagIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = helpers.CacheStub()
+        self.tag_index = index.TagIndex(max_keys=2)
+
+    def test_invalidate(self):
+        self.cache.set_many({'key1': 'value1', 'key2': 'value2', 'key3': 'value3'})
+        self.tag_index.add(self.cache, 'key1', ('tag1', 'tag2'))
+        self.tag_index.add(self.cache, 'key2', ('tag2',))
+        self.tag_index.add(self.cache, 'key3', ('tag3',))
+        self.tag_index.invalidate(self.cache, ('tag2',))
+        self.assertDictEqual(self.cache.get_many(['key1', 'key2', 'key3']), {'key3': 'value3'})
+        self.assertIsNone(self.cache.get(self.tag_index.make_key('tag2')))
+
+    def test_bounded(self):
+        for key in ('key1', 'key2', 'key3', 'key2'):
+            self.tag_index.add(self.cache, key, ('tag1',))
+        entries = self.cache.get(self.tag_index.make_key('tag1'))
+        self.assertListEqual([entry[0] for entry in entries], ['key3', 'key2'])
+
+    def test_registry(self):
+        self.tag_index.add(self.cache, 'key1', ('tag1', 'tag2'))
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many, \
+                mock.patch.object(self.cache, 'set_many', wraps=self.cache.set_many) as set_many:
+            self.tag_index.add(self.cache, 'key2', ('tag1',))
+        self.assertEqual(get_many.call_count, 1)
+        self.assertListEqual(list(set_many.call_args[0][0]), [self.tag_index.make_key('tag1')])
+        registered = set()
+        for shard in range(self.tag_index.registry_shards):
+            registered.update(self.cache.get(self.tag_index.make_shard_key(shard), []))
+        self.assertSetEqual(registered, {'tag1', 'tag2'})
+
+    def test_compact(self):
+        self.tag_index.add(self.cache, 'key1', ('tag1', 'tag2'), timeout=1)
+        self.tag_index.add(self.cache, 'key2', ('tag2',))
+        self.tag_index.add(self.cache, 'key3', ('tag3',), timeout=100)
+        now = time.time()
+        with mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many, \
+                mock.patch.object(index.time, 'time', return_value=now + 2):
+            self.assertEqual(self.tag_index.compact(self.cache), 2)
+        for args, kwargs in get_many.call_args_list:  # Records are not read
+            self.assertTrue(all(key.startswith('tagindex_') for key in args[0]))
+        self.assertIsNone(self.cache.get(self.tag_index.make_key('tag1')))
+        self.assertListEqual([entry[0] for entry in self.cache.get(self.tag_index.make_key('tag2'))], ['key2'])
+        self.assertEqual(len(self.cache.get(self.tag_index.make_key('tag3'))), 1)
+        shard_key = self.tag_index.make_shard_key(self.tag_index._get_shard('tag1'))
+        self.assertNotIn('tag1', self.cache.get(shard_key, []))
+        self.assertEqual(self.tag_index.compact(self.cache, limit=1), 0)
+
+
+class CacheWrapperTagIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(lock),
+            tag_index=index.TagIndex()
+        )
+
+    def test_invalidate(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'))
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.assertIsNone(self.backend.get('name1'))
+        self.assertIsNotNone(self.backend.get('name2'))
+        self.assertEqual(self.cache.get('name2'), 'value2')
@@ -0,0 +1,156 @@
+import unittest
+from cache_dependencies import (
+    cache, dependencies, exceptions, instrumentation, interfaces, locks, relations, transaction
+)
+from cache_dependencies.tests import helpers
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class InstrumentedCacheDecoratorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = instrumentation.StatsRegistry()
+        self.backend = instrumentation.instrument(helpers.CacheStub(), self.stats)
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(self.backend, relations.RelationManager(), transaction.TransactionManager(lock))
+
+    def test_classify(self):
+        self.assertEqual(instrumentation.classify('get', 'name1'), 'value')
+        self.assertEqual(instrumentation.classify('get_many', 'tag_1_abc'), 'tag_version')
+        self.assertEqual(instrumentation.classify('set_many', 'tag_1_abc'), 'tag_creation')
+        self.assertEqual(instrumentation.classify('delete_many', 'tag_1_abc'), 'invalidation')
+        self.assertEqual(instrumentation.classify('get_many', 'acquired_tag_1_abc'), 'lock_state')
+        self.assertEqual(instrumentation.classify('set', 'released_tag_1_abc'), 'lock')
+
+    def test_round_trips(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.stats.clear()
+        self.assertEqual(self.cache.get('name1'), 'value1')
+        summary = self.stats.summary()
+        self.assertEqual(summary['get.value']['calls'], 1)
+        self.assertEqual(summary['get_many.tag_version']['calls'], 1)
+        self.assertEqual(summary['get_many.tag_version']['keys'], 1)
+        self.assertEqual(self.stats.calls, 2)
+
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.assertIn('delete_many.invalidation', self.stats.summary())
+
+    def test_tagged_interface(self):
+        tagged = type(str('TaggedStub'), (helpers.CacheStub, interfaces.ITaggedCache), {})
+        self.assertIsInstance(instrumentation.instrument(tagged()), interfaces.ITaggedCache)
+        self.assertNotIsInstance(self.backend, interfaces.ITaggedCache)
+
+    def test_request_stats(self):
+        request_stats = self.stats.begin_request()
+        self.backend.set('name1', b'value1')
+        self.backend.get_many(['name1', 'tag_1_abc'])
+        self.assertIs(self.stats.end_request(), request_stats)
+        self.backend.get('name1')
+        summary = request_stats.summary()
+        self.assertEqual(summary['set.value']['bytes'], 6)
+        self.assertEqual(summary['get_many.tag_version+value']['keys'], 2)
+        self.assertNotIn('get.value', summary)
+        self.assertIn('get.value', self.stats.summary())
+
+    def test_export(self):
+        self.backend.get('name1')
+        text = self.stats.to_prometheus()
+        self.assertIn('cache_dependencies_backend_calls_total{operation="get",site="value"} 1', text)
+        self.assertIn(
+            'cache_dependencies_backend_duration_seconds_bucket{operation="get",site="value",le="+Inf"} 1', text
+        )
+        self.assertIn('cache_dependencies.backend.get.value.calls:1|g', self.stats.to_statsd())
+
+
+class OutcomeMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = instrumentation.OutcomeMetrics(max_namespaces=2, max_tags=2)
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(lock), metrics=self.metrics
+        )
+
+    def test_outcomes(self):
+        self.cache.set('page:1', 'value1', dependencies.TagsDependency('tag1', 'tag2'))
+        self.cache.set('page:2', 'value2', dependencies.TagsDependency('tag2'))
+        self.assertEqual(self.cache.get('page:1'), 'value1')
+        self.assertIsNone(self.cache.get('page:3'))
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.assertIsNone(self.cache.get('page:1'))
+        self.assertDictEqual(self.cache.get_many(['page:1', 'page:2', 'page:4']), {'page:2': 'value2'})
+        self.assertDictEqual(self.metrics.by_namespace(), {'page': {'hit': 2, 'miss': 2, 'invalid': 2}})
+        self.assertDictEqual(self.metrics.by_tag(), {'tag1': {'invalid': 2}})
+        self.assertListEqual(self.metrics.top_tags(), [('tag1', 2)])
+
+    def test_locked(self):
+        with mock.patch.object(self.cache.transaction, 'current') as current:
+            current.return_value.evaluate.side_effect = exceptions.TagsLocked(None, ('tag1',))
+            self.cache.set('page:1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.abort('page:2')
+        self.assertDictEqual(self.metrics.by_namespace(), {'page': {'locked': 1, 'aborted': 1}})
+        self.assertDictEqual(self.metrics.by_tag(), {'tag1': {'locked': 1}})
+
+    def test_cardinality(self):
+        for key in ('a:1', 'b:1', 'c:1', 'd:1'):
+            self.metrics.add(instrumentation.INVALID, key, (key,))
+        self.assertDictEqual(self.metrics.by_namespace(), {'a': {'invalid': 1}, 'b': {'invalid': 1},
+                                                           instrumentation.OTHER: {'invalid': 2}})
+        self.assertEqual(len(self.metrics.by_tag()), 3)
+        self.assertIn('cache_dependencies_outcomes_by_tag_total{tag="a:1",outcome="invalid"} 1',
+                      self.metrics.to_prometheus())
+
+
+class RequestTracerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = instrumentation.StatsRegistry()
+        self.backend = instrumentation.instrument(helpers.CacheStub(), self.stats)
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.relation_manager = relations.RelationManager()
+        self.cache = cache.CacheWrapper(self.backend, self.relation_manager, transaction.TransactionManager(lock))
+        self.tracer = instrumentation.RequestTracer(self.stats.begin_request())
+        self.tracer.install(self.cache)
+
+    def tearDown(self):
+        self.tracer.uninstall()
+        self.stats.end_request()
+
+    def test_timeline(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.assertIsNone(self.cache.get('outer'))
+        self.assertEqual(self.cache.get('name1'), 'value1')
+        self.assertIsNone(self.cache.get('inner'))
+        self.cache.set('inner', 'inner', dependencies.TagsDependency('tag2'))
+        self.cache.set('outer', 'outer')
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+
+        data = self.tracer.to_dict()
+        self.assertListEqual(
+            [(span['operation'], span['parent'], span.get('outcome')) for span in data['spans']],
+            [('set', None, None), ('get', None, 'miss'), ('get', 'outer', 'hit'), ('get', 'outer', 'miss'),
+             ('set', 'inner', None), ('set', 'outer', None), ('invalidate_dependency', None, None)]
+        )
+        self.assertListEqual(data['spans'][4]['tags'], ['tag2'])
+        self.assertListEqual(data['spans'][5]['tags'], ['tag1', 'tag2'])
+        self.assertEqual(data['spans'][2]['round_trips'], 2)
+        self.assertEqual(len(data['fragments']), 1)
+        outer = data['fragments'][0]
+        self.assertEqual(outer['key'], 'outer')
+        self.assertTrue(outer['rebuilt'])
+        self.assertListEqual([(child['key'], child.get('rebuilt', False)) for child in outer['children']],
+                             [('name1', False), ('inner', True)])
+        self.assertIn('cache-get;dur=', self.tracer.server_timing())
+        self.assertIn('desc="3 calls, ', self.tracer.server_timing())
+
+    def test_uninstall(self):
+        self.tracer.uninstall()
+        self.assertIs(self.cache.relation_manager, self.relation_manager)
+        self.assertIsInstance(self.cache.tracer, instrumentation.DummyTracer)
+        self.cache.get('name1')
+        self.assertListEqual(self.tracer.spans, [])
@@ -55,6 +55,10 @@ class AbstractDependencyLockTestCase(unittest.TestCase):
 class ReadUncommittedDependencyLockTestCase(AbstractDependencyLockTestCase):
     lock_factory = locks.ReadUncommittedDependencyLock
 
+    def test_evaluate(self):
+        self.lock.evaluate(self.dependency, self.transaction, 1)
+        self.dependency.evaluate.assert_called_once_with(self.cache, None, 1)
+
     def test_acquire(self):
         self.lock.acquire(self.dependency, self.transaction, 1)
         self.dependency.acquire.assert_not_called()
@@ -76,6 +80,10 @@ class ReadUncommittedDependencyLockDelayedTestCase(ReadUncommittedDependencyLock
 class ReadCommittedDependencyLockTestCase(AbstractDependencyLockTestCase):
     lock_factory = locks.ReadCommittedDependencyLock
 
+    def test_evaluate(self):
+        self.lock.evaluate(self.dependency, self.transaction, 1)
+        self.dependency.evaluate.assert_called_once_with(self.cache, None, 1)
+
     def test_acquire(self):
         self.lock.acquire(self.dependency, self.transaction, 1)
         self.dependency.acquire.assert_not_called()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import unittest
+from cache_dependencies import nocache
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class NoCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.nocache = nocache.NoCache('secret')
+
+    def _block(self, code, **data):
+        return '{0}{1}{2}'.format(self.nocache.start(**data), code, self.nocache.end())
+
+    def test_handle(self):
+        tpl = 'a {0} b {1} c'.format(
+            self._block('\n    echo(name, " ", var)\n', name='block'),
+            self._block('\n    echo(var)\n'),
+        )
+        self.assertEqual(self.nocache.handle(tpl, var='handle'), 'a block handle b handle c')
+
+    def test_handle_block_data_priority(self):
+        tpl = self._block('echo(var)', var='block')
+        self.assertEqual(self.nocache.handle(tpl, var='handle'), 'block')
+
+    def test_handle_echo_in_function(self):
+        tpl = self._block('\n    def f(value):\n        echo(value)\n    f(var)\n')
+        self.assertEqual(self.nocache.handle(tpl, var='value'), 'value')
+
+    def test_handle_nested(self):
+        tpl = self._block('echo(nocache.start(), "echo(var)", nocache.end())')
+        self.assertEqual(self.nocache.handle(tpl, nocache=self.nocache, var='nested'), 'nested')
+
+    def test_handle_without_blocks(self):
+        tpl = 'a <nocache:py secret="other" data="">echo(1)</nocache:py> b'
+        self.assertIs(self.nocache.handle(tpl), tpl)
+
+    def test_lazy_unpickle(self):
+        tpl = self._block('echo(1)')
+        with mock.patch.object(self.nocache, 'unpickle', wraps=self.nocache.unpickle) as unpickle:
+            self.assertEqual(self.nocache.handle(tpl), '1')
+            self.assertFalse(unpickle.called)
+            tpl = self._block('echo(var, var)', var=2)
+            self.assertEqual(self.nocache.handle(tpl), '22')
+        self.assertEqual(unpickle.call_count, 1)
+
+    def test_data_overrides_builtins(self):
+        tpl = self._block('echo(id, "|", object, "|", len(str(1)))', id=5)
+        self.assertEqual(self.nocache.handle(tpl, object='entry'), '5|entry|1')
+
+    def test_globals_isolation(self):
+        self.assertEqual(self.nocache.handle(self._block('global leaked\nleaked = 1\necho(leaked)')), '1')
+        self.assertEqual(self.nocache.handle(self._block('echo("leaked" in globals())')), 'False')
+
+    def test_compiled(self):
+        self.nocache.max_compiled = 2
+        with mock.patch.object(nocache, 'compile', create=True, side_effect=compile) as compile_mock:
+            for i in (1, 1, 2, 3, 1):
+                self.assertEqual(self.nocache.handle(self._block('echo({0})'.format(i))), str(i))
+        self.assertEqual(compile_mock.call_count, 4)
+        self.assertEqual(len(self.nocache._compiled), 2)
+
+    def test_iter_handle(self):
+        tpl = 'a {0} b {1} c <nocache'.format(
+            self._block('echo(name, " ", var)', name='block'),
+            self._block('echo(var)'),
+        )
+        expected = self.nocache.handle(tpl, var='handle')
+        for size in (1, 7, 64, len(tpl)):
+            chunks = [tpl[i:i + size] for i in range(0, len(tpl), size)]
+            self.assertEqual(''.join(self.nocache.iter_handle(chunks, var='handle')), expected)
+            chunks = [chunk.encode('utf-8') for chunk in chunks]
+            self.assertEqual(
+                b''.join(self.nocache.iter_handle(chunks, var='handle')),
+                expected.encode('utf-8')
+            )
+
+    def test_iter_handle_without_blocks(self):
+        chunks = ['a' * 10, 'b' * 10]
+        result = list(self.nocache.iter_handle(chunks))
+        self.assertIs(result[0], chunks[0])
+        self.assertIs(result[1], chunks[1])
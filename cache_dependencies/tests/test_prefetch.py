@@ -0,0 +1,75 @@
+import unittest
+from cache_dependencies import cache, dependencies, locks, prefetch, relations, transaction
+from cache_dependencies.tests import helpers
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class PrefetchLearnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.cache = cache.CacheWrapper(self.backend, relations.RelationManager(), transaction.TransactionManager(lock))
+        self.learner = prefetch.PrefetchLearner(decay=0.5, threshold=0.3, sample_rate=1)
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'))
+
+    def _request(self, keys):
+        model = self.learner.prefetch(self.cache, 'view')
+        for key in keys:
+            self.cache.get(key)
+        self.learner.learn(self.cache, 'view', model)
+        self.cache.close()
+
+    def test_prefetch(self):
+        self._request(['name1', 'name2', 'name3'])
+        with mock.patch.object(self.backend, 'get_many', wraps=self.backend.get_many) as get_many:
+            model = self.learner.prefetch(self.cache, 'view')
+            self.assertEqual(get_many.call_count, 1)
+            self.assertEqual(self.cache.get('name1'), 'value1')
+            self.assertEqual(self.cache.get('name2'), 'value2')
+            self.assertIsNone(self.cache.get('name3'))
+        self.assertEqual(get_many.call_count, 1)
+        self.learner.learn(self.cache, 'view', model)
+
+    def test_decay(self):
+        self._request(['name1', 'name2'])
+        self._request(['name1'])
+        model = self.backend.get(self.learner.make_key('view'))
+        self.assertEqual(model[(None, 'key', 'name1')], 0.75)
+        self.assertEqual(model[(None, 'tag', 'tag1')], 0.75)
+        self.assertEqual(model[(None, 'key', 'name2')], 0.25)
+        self._request(['name1'])
+        model = self.backend.get(self.learner.make_key('view'))
+        self.assertNotIn((None, 'key', 'name2'), model)
+
+    def test_threshold(self):
+        self.learner = prefetch.PrefetchLearner(sample_rate=1)
+        self._request(['name1', 'name2'])
+        model = self.learner.prefetch(self.cache, 'view')
+        self.assertNotIn('name2', self.cache._prefetched.get(None, {}))
+        self.cache.get('name1')
+        self.learner.learn(self.cache, 'view', model)
+        self.cache.close()
+        with mock.patch.object(self.backend, 'get_many', wraps=self.backend.get_many) as get_many:
+            self.learner.prefetch(self.cache, 'view')
+        self.assertIn('name1', get_many.call_args[0][0])
+        self.assertNotIn('name2', get_many.call_args[0][0])
+
+    def test_sample_rate(self):
+        self._request(['name1'])
+        self.learner.sample_rate = 0
+        with mock.patch.object(self.backend, 'set', wraps=self.backend.set) as set_:
+            self._request(['name1', 'name2'])
+        self.assertFalse(set_.called)
+        model = self.backend.get(self.learner.make_key('view'))
+        self.assertNotIn((None, 'key', 'name2'), model)
+
+    def test_unchanged_model(self):
+        with mock.patch.object(self.backend, 'set', wraps=self.backend.set) as set_:
+            self._request([])
+        self.assertFalse(set_.called)
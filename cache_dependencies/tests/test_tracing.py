@@ -0,0 +1,72 @@
+import unittest
+from cache_dependencies import cache, dependencies, exceptions, instrumentation, locks, relations, tracing, transaction
+from cache_dependencies.tests import helpers
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class InstrumentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        self.lock = locks.DependencyLock.make('REPEATABLE READ', lambda: self.backend, 0)
+        self.recorder = instrumentation.RequestTracer()
+        self.tracer = tracing.instrument(self.recorder)
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(self.lock), tracer=self.tracer
+        )
+
+    def tearDown(self):
+        tracing.uninstrument()
+
+    def test_spans(self):
+        self.assertIs(tracing.instrument(), self.tracer)
+        self.assertIs(tracing.instrument(self.recorder), self.tracer)
+        with self.assertRaises(RuntimeError):
+            tracing.instrument(instrumentation.RequestTracer())
+        self.cache.transaction.begin()
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1', 'tag2'))
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.cache.transaction.finish()
+        self.assertListEqual(
+            [(span.operation, span.attributes.get('outcome')) for span in self.recorder.spans],
+            [('set', None), ('CompositeDependency.evaluate', 'ok'), ('invalidate_dependency', None),
+             ('TagsDependency.invalidate', 'ok'), ('RepeatableReadDependencyLock.release', 'ok')]
+        )
+        self.assertEqual(self.recorder.spans[-1].attributes['isolation_level'], 'REPEATABLE READ')
+        self.assertSetEqual(self.recorder.spans[1].attributes['tags'], {'tag1', 'tag2'})
+        self.assertSetEqual(self.recorder.spans[-1].attributes['tags'], {'tag1'})
+
+    def test_locked(self):
+        with mock.patch.object(dependencies.TagsDependency, '_evaluate',
+                               side_effect=exceptions.TagsLocked(None, ('tag1',))):
+            with self.assertRaises(exceptions.TagsLocked):
+                dependencies.TagsDependency('tag1').evaluate(self.backend, None, None)
+        self.assertEqual(self.recorder.spans[-1].attributes['outcome'], 'locked')
+
+    def test_uninstrument(self):
+        evaluate = dependencies.TagsDependency.evaluate
+        tracing.uninstrument()
+        self.assertFalse(tracing.is_instrumented())
+        self.assertIsNot(dependencies.TagsDependency.evaluate, evaluate)
+        self.assertNotIn('release', locks.SerializableDependencyLock.__dict__)
+        dependencies.TagsDependency('tag1').invalidate(self.backend, None)
+        self.assertListEqual(self.recorder.spans, [])
+
+
+class OpenTelemetryTracerTestCase(unittest.TestCase):
+
+    def test_span(self):
+        otel_tracer = mock.MagicMock()
+        otel_span = otel_tracer.start_as_current_span.return_value.__enter__.return_value
+        tracer = tracing.OpenTelemetryTracer(otel_tracer)
+        with tracer.span('get_many', ['name1', 'name2'], tags={'tag1'}) as span:
+            span.set(hits=1, outcome='hit')
+        otel_tracer.start_as_current_span.assert_called_once_with(
+            'cache_dependencies.get_many', attributes={'cache.key_count': 2, 'cache.tag_count': 1}
+        )
+        otel_span.set_attribute.assert_any_call('cache.hits', 1)
+        otel_span.set_attribute.assert_any_call('cache.outcome', 'hit')
@@ -0,0 +1,109 @@
+import time
+import threading
+import unittest
+from cache_dependencies import cache, dependencies, locks, relations, transaction, writers
+from cache_dependencies.tests import helpers
+
+
+class BackgroundWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = helpers.CacheStub()
+        self.log = []
+        self.lock = threading.Lock()
+
+    def _task(self, cache, name, delay=0):
+        time.sleep(delay)
+        with self.lock:
+            self.log.append(name)
+
+    def test_submit(self):
+        writer = writers.BackgroundWriter(lambda: self.cache)
+        writer.submit(lambda cache, key: cache.set(key, 'value'), ('key1',))
+        self.assertTrue(writer.flush(5))
+        self.assertEqual(self.cache.get('key1'), 'value')
+        writer.close()
+
+    def test_fifo(self):
+        writer = writers.BackgroundWriter(lambda: self.cache)
+        for i in range(10):
+            writer.submit(self._task, (i, 0.001 * (10 - i)))
+        writer.close()
+        self.assertListEqual(self.log, list(range(10)))
+
+    def test_barrier(self):
+        writer = writers.BackgroundWriter(lambda: self.cache, workers=3)
+        writer.submit(self._task, ('set1', 0.1))
+        writer.submit(self._task, ('set2', 0.05))
+        writer.submit(self._task, ('invalidate', 0), barrier=True)
+        writer.submit(self._task, ('set3', 0))
+        writer.close()
+        self.assertSetEqual(set(self.log[:2]), {'set1', 'set2'})
+        self.assertListEqual(self.log[2:], ['invalidate', 'set3'])
+
+    def test_backpressure(self):
+        event = threading.Event()
+        writer = writers.BackgroundWriter(lambda: self.cache, max_size=1)
+        writer.submit(lambda cache: event.wait(5))
+        writer.submit(self._task, ('queued',))
+        submitter = threading.Thread(target=writer.submit, args=(self._task, ('blocked',)))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+        event.set()
+        submitter.join(5)
+        writer.close()
+        self.assertListEqual(self.log, ['queued', 'blocked'])
+
+    def test_error(self):
+        writer = writers.BackgroundWriter(lambda: self.cache)
+        writer.submit(lambda cache: 1 / 0)
+        writer.submit(self._task, ('next',))
+        writer.close()
+        self.assertListEqual(self.log, ['next'])
+
+
+class CacheWrapperBackgroundWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = helpers.CacheStub()
+        lock = locks.DependencyLock.make('READ COMMITTED', lambda: self.backend, 0)
+        self.writer = writers.BackgroundWriter(lambda: self.backend)
+        self.cache = cache.CacheWrapper(
+            self.backend, relations.RelationManager(), transaction.TransactionManager(lock),
+            write_behind=True, writer=self.writer
+        )
+
+    def tearDown(self):
+        self.writer.close()
+
+    def test_set_and_invalidate(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.set('name2', 'value2', dependencies.TagsDependency('tag2'))
+        self.cache.close()
+        self.writer.flush()
+        self.assertDictEqual(self.cache.get_many(['name1', 'name2']), {'name1': 'value1', 'name2': 'value2'})
+
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.assertIsNone(self.cache.get('name1'))
+        self.assertEqual(self.cache.get('name2'), 'value2')
+
+    def test_async_invalidation(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.close()
+        self.writer.flush()
+        self.cache.async_invalidation = True
+        event = threading.Event()
+        self.writer.submit(lambda cache: event.wait(5))
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.assertEqual(self.cache.get('name1'), 'value1')
+        event.set()
+        self.writer.flush()
+        self.assertIsNone(self.cache.get('name1'))
+
+    def test_invalidate_drops_pending(self):
+        self.cache.set('name1', 'value1', dependencies.TagsDependency('tag1'))
+        self.cache.invalidate_dependency(dependencies.TagsDependency('tag1'))
+        self.cache.close()
+        self.writer.flush()
+        self.assertIsNone(self.backend.get('name1'))
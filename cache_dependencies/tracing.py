@@ -0,0 +1,167 @@
+"""OpenTelemetry instrumentation.
+
+Package opentelemetry-api is imported only by OpenTelemetryTracer, and methods of dependencies
+and locks are wrapped only by instrument(), so, disabled instrumentation costs nothing.
+"""
+import functools
+import threading
+from cache_dependencies import cache, dependencies, exceptions, interfaces, locks
+
+try:
+    str = unicode  # Python 2.* compatible
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+ATTRIBUTE_PREFIX = 'cache.'
+
+# Methods wrapped by instrument(), if they are defined by the class itself.
+TRACED_METHODS = (
+    (dependencies.CompositeDependency, ('evaluate', 'validate', 'invalidate')),
+    (dependencies.TagsDependency, ('evaluate', 'validate', 'invalidate')),
+    (dependencies.HierarchicalTagsDependency, ('evaluate', 'validate', 'invalidate')),
+    (dependencies.InlineStateTagsDependency, ('evaluate', 'validate', 'invalidate')),
+    (dependencies.ModelVersionDependency, ('evaluate', 'validate', 'invalidate')),
+    (locks.ReadUncommittedDependencyLock, ('release',)),
+    (locks.ReadCommittedDependencyLock, ('release',)),
+    (locks.RepeatableReadDependencyLock, ('release',)),
+    (locks.SerializableDependencyLock, ('release',)),
+)
+
+
+def make_attributes(keys, attributes):
+    """Converts attributes of span to OpenTelemetry attributes, which accept only primitive values.
+
+    :type keys: collections.Iterable[str]
+    :type attributes: dict
+    :rtype: dict
+    """
+    result = {}
+    if keys and hasattr(keys, '__len__'):
+        result[ATTRIBUTE_PREFIX + 'key_count'] = len(keys)
+    for name, value in attributes.items():
+        if name == 'tags':
+            result[ATTRIBUTE_PREFIX + 'tag_count'] = len(value)
+        elif isinstance(value, (bool, int, float) + string_types):
+            result[ATTRIBUTE_PREFIX + name] = value
+    return result
+
+
+class OpenTelemetrySpan(interfaces.ISpan):
+
+    def __init__(self, tracer, name, keys, attributes):
+        self._tracer = tracer
+        self._name = name
+        self._attributes = make_attributes(keys, attributes)
+        self._context_manager = None
+        self._span = None
+
+    def set(self, **attributes):
+        for name, value in make_attributes((), attributes).items():
+            self._span.set_attribute(name, value)
+
+    def __enter__(self):
+        self._context_manager = self._tracer.start_as_current_span(self._name, attributes=self._attributes)
+        self._span = self._context_manager.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._context_manager.__exit__(exc_type, exc_value, traceback)
+
+
+class OpenTelemetryTracer(interfaces.ITracer):
+    """Requires opentelemetry-api package."""
+
+    def __init__(self, tracer=None, tracer_provider=None):
+        """
+        :type tracer: opentelemetry.trace.Tracer or None
+        :type tracer_provider: opentelemetry.trace.TracerProvider or None
+        """
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer('cache_dependencies', tracer_provider=tracer_provider)
+        self._tracer = tracer
+
+    def span(self, operation, keys=(), **attributes):
+        return OpenTelemetrySpan(self._tracer, 'cache_dependencies.' + operation, keys, attributes)
+
+
+def _get_attributes(instance, args, kwargs):
+    if isinstance(instance, locks.DependencyLock):
+        dependency = args[0] if args else kwargs['dependency']
+        return {'tags': cache.CacheWrapper._get_tags(dependency), 'isolation_level': instance.isolation_level}
+    return {'tags': cache.CacheWrapper._get_tags(instance)}
+
+
+def _wrap(tracer, cls, method_name, method):
+    operation = '{0}.{1}'.format(cls.__name__, method_name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        error = None
+        with tracer.span(operation, **_get_attributes(self, args, kwargs)) as span:
+            try:
+                result = method(self, *args, **kwargs)
+            except exceptions.DependencyLocked as e:  # Expected outcomes are not errors of span.
+                span.set(outcome='locked')
+                error = e
+            except exceptions.DependencyInvalid as e:
+                span.set(outcome='invalid')
+                error = e
+            else:
+                span.set(outcome='deferred' if method_name == 'validate' else 'ok')
+        if error is not None:
+            raise error
+        return result
+    return wrapper
+
+
+_originals = {}
+_lock = threading.Lock()
+_tracer = None
+
+
+def instrument(tracer=None):
+    """Wraps methods of dependencies and locks by spans, and returns the tracer for CacheWrapper.
+
+    Methods are patched process-wide, so, dependencies of all caches are traced by the same tracer.
+    Repeated call returns the current tracer, another tracer can be used only after uninstrument().
+    Validation of dependency is deferred, so, span of validate() covers only building of the query,
+    and outcome of validation is an attribute of span of CacheWrapper.get() or get_many().
+
+    :type tracer: cache_dependencies.interfaces.ITracer or None
+    :rtype: cache_dependencies.interfaces.ITracer
+    :raises RuntimeError: if methods are already wrapped for another tracer.
+    """
+    global _tracer
+    with _lock:
+        if _tracer is not None:
+            if tracer is not None and tracer is not _tracer:
+                raise RuntimeError("Already instrumented by another tracer, call uninstrument() first")
+            return _tracer
+        tracer = tracer or OpenTelemetryTracer()
+        for cls, method_names in TRACED_METHODS:
+            for method_name in method_names:
+                if method_name in cls.__dict__:
+                    method = cls.__dict__[method_name]
+                    _originals[(cls, method_name)] = method
+                    setattr(cls, method_name, _wrap(tracer, cls, method_name, method))
+        _tracer = tracer
+        return tracer
+
+
+def uninstrument():
+    """Restores original methods of dependencies and locks."""
+    global _tracer
+    with _lock:
+        for (cls, method_name), method in _originals.items():
+            setattr(cls, method_name, method)
+        _originals.clear()
+        _tracer = None
+
+
+def is_instrumented():
+    """
+    :rtype: bool
+    """
+    return _tracer is not None
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import time
+import atexit
+import logging
+import threading
+import collections
+from cache_dependencies import interfaces
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter(interfaces.IWriter):
+    """Executes cache writes by pool of daemon threads.
+
+    The queue is bounded, so, submit() blocks while writers lag behind (backpressure).
+    Single worker executes tasks in FIFO order. Several workers execute tasks concurrently,
+    but if ordered is True, barrier tasks (invalidations) are never reordered with other tasks.
+    Submitted tasks are flushed at interpreter exit.
+    """
+
+    def __init__(self, cache_accessor, workers=1, max_size=1000, ordered=True):
+        """
+        :type cache_accessor: () -> cache_dependencies.interfaces.ICache
+        :type workers: int
+        :type max_size: int
+        :type ordered: bool
+        """
+        self._cache = cache_accessor
+        self.max_size = max_size
+        self.ordered = ordered
+        self._queue = collections.deque()
+        self._running = 0
+        self._running_barrier = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name='cache-writer-{0}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def submit(self, func, args=(), barrier=False):
+        """
+        :type func: collections.Callable
+        :type args: tuple
+        :type barrier: bool
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Writer is closed")
+            while len(self._queue) >= self.max_size:
+                self._condition.wait()
+            self._queue.append((func, args, barrier and self.ordered))
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        :type timeout: float or None
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._queue or self._running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._can_start():
+                    if self._closed and not self._queue:
+                        return
+                    self._condition.wait()
+                func, args, barrier = self._queue.popleft()
+                self._running += 1
+                self._running_barrier = barrier
+                self._condition.notify_all()
+            try:
+                func(self._cache(), *args)
+            except Exception:
+                logger.exception("Background cache write failed")
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    if barrier:
+                        self._running_barrier = False
+                    self._condition.notify_all()
+
+    def _can_start(self):
+        if not self._queue or self._running_barrier:
+            return False
+        if self._queue[0][2]:
+            # Barrier waits for all previously started tasks.
+            return self._running == 0
+        return True
+
+
+class DummyWriter(interfaces.IWriter):
+    """Using pattern Special Case. Writes synchronously."""
+
+    def __init__(self, cache_accessor):
+        """
+        :type cache_accessor: () -> cache_dependencies.interfaces.ICache
+        """
+        self._cache = cache_accessor
+
+    def submit(self, func, args=(), barrier=False):
+        func(self._cache(), *args)
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
@@ -1,12 +1,13 @@
 from __future__ import absolute_import, unicode_literals
 import sys
 import hashlib
-from threading import local
+from threading import local, Lock
 
 import django.core.cache
 from django.conf import settings
 from django.core import signals as core_signals
 from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.exceptions import ImproperlyConfigured
 from django.db.models import signals as model_signals
 from django.utils.functional import curry
 
@@ -15,6 +16,13 @@ from cache_dependencies.relations import RelationManager, ThreadSafeRelationMana
 from cache_dependencies.locks import DependencyLock
 from cache_dependencies.transaction import TransactionManager, ThreadSafeTransactionManagerDecorator
 from cache_dependencies.nocache import NoCache
+from cache_dependencies.index import TagIndex
+from cache_dependencies.writers import BackgroundWriter
+from cache_dependencies.compression import get_compressor
+from cache_dependencies.serializers import get_serializer
+from cache_dependencies.instrumentation import instrument, OutcomeMetrics
+from cache_dependencies import tracing
+from cache_dependencies.dependencies import TagsDependency, InlineStateTagsDependency
 
 try:
     str = unicode  # Python 2.* compatible
@@ -39,8 +47,18 @@ class CacheCollection(object):
     For correct transaction handling we should to return
     the same instance by cache alias.
     """
+    _writers = {}
+    _writers_lock = Lock()
+    _metrics = {}
+    _metrics_lock = Lock()
+
     def __init__(self):
         self.ctx = local()
+        # Methods of dependencies and locks are patched process-wide, so, only once.
+        if any(options.get('OPENTELEMETRY') for options in getattr(settings, 'CACHE_TAGGING', {}).values()):
+            self.tracer = tracing.instrument()
+        else:
+            self.tracer = None
 
     def __call__(self, backend=None, *args, **kwargs):
         """Returns instance of CacheTagging class."""
@@ -56,20 +74,126 @@ class CacheCollection(object):
                 cache = django.core.cache.caches[django_backend]
             else:
                 cache = django.core.cache.get_cache(django_backend, *args, **kwargs)
+            if options.get('INSTRUMENT'):
+                cache = instrument(cache)
 
             def thread_safe_cache_accessor():
                 return self(backend, *args, **kwargs).cache
             tags_lock = DependencyLock.make(isolation_level, thread_safe_cache_accessor, delay)
             transaction = ThreadSafeTransactionManagerDecorator(TransactionManager(tags_lock))
             relation_manager = ThreadSafeRelationManagerDecorator(RelationManager())
+            tag_index_options = options.get('TAG_INDEX')
+            tag_index = None
+            if tag_index_options:
+                if not isinstance(tag_index_options, dict):
+                    tag_index_options = {}
+                tag_index = TagIndex(
+                    max_keys=tag_index_options.get('MAX_KEYS', 1000),
+                    max_tags=tag_index_options.get('MAX_TAGS', 10000),
+                    registry_shards=tag_index_options.get('REGISTRY_SHARDS', 16),
+                )
+            if options.get('INLINE_TAG_STATE'):
+                dependency_factory = InlineStateTagsDependency
+            else:
+                dependency_factory = TagsDependency
             self._caches[key] = CacheTagging(
-                cache, relation_manager, transaction
+                cache, relation_manager, transaction,
+                dependency_factory=dependency_factory, tag_index=tag_index,
+                write_behind=options.get('WRITE_BEHIND', False),
+                writer=self._get_writer(
+                    backend, django_backend, options.get('BACKGROUND_WRITER'), options.get('INSTRUMENT')
+                ),
+                async_invalidation=self._is_async_invalidation(options.get('BACKGROUND_WRITER')),
+                serializer=self._get_serializer(options.get('SERIALIZER', 'pickle')),
+                pickle_dependencies=options.get('PICKLE_DEPENDENCIES', False),
+                metrics=self.get_metrics(backend),
+                tracer=self.tracer if options.get('OPENTELEMETRY') else None,
+                **self._get_compression(options.get('COMPRESSION'))
             )
         return self._caches[key]
 
     def __getitem__(self, alias):
         return self(alias)
 
+    @staticmethod
+    def _get_serializer(name):
+        try:
+            serializer = get_serializer(name)
+        except KeyError:
+            raise ImproperlyConfigured("Unknown serializer {0}".format(name))
+        if serializer is None:
+            raise ImproperlyConfigured("Package of serializer {0} is not installed".format(name))
+        return serializer
+
+    @staticmethod
+    def _get_compression(compression_options):
+        """Returns compression kwargs of CacheWrapper."""
+        if not compression_options:
+            return {}
+        if not isinstance(compression_options, dict):
+            compression_options = {}
+        compressor_kwargs = {}
+        if 'LEVEL' in compression_options:
+            compressor_kwargs['level'] = compression_options['LEVEL']
+        if compression_options.get('DICTIONARY'):
+            # Path of file with preset (or trained) dictionary.
+            with open(compression_options['DICTIONARY'], 'rb') as f:
+                compressor_kwargs['dictionary'] = f.read()
+        compressor = get_compressor(compression_options.get('CODEC', 'deflate'), **compressor_kwargs)
+        if compressor is None:
+            raise ImproperlyConfigured(
+                "Package of compressor {0} is not installed".format(compression_options.get('CODEC'))
+            )
+        return {
+            'compressor': compressor,
+            'compress_threshold': compression_options.get('THRESHOLD', 1024),
+        }
+
+    @staticmethod
+    def _is_async_invalidation(writer_options):
+        """Invalidation is executed by background writer only by explicit option."""
+        return isinstance(writer_options, dict) and bool(writer_options.get('ASYNC_INVALIDATION'))
+
+    def _get_writer(self, backend, django_backend, writer_options, instrumented=False):
+        """Returns background writer shared by all threads."""
+        if not writer_options:
+            return None
+        if not isinstance(writer_options, dict):
+            writer_options = {}
+
+        def cache_accessor():  # Django cache instance is thread local
+            if hasattr(django.core.cache, 'caches'):
+                cache = django.core.cache.caches[django_backend]
+            else:
+                cache = django.core.cache.get_cache(django_backend)
+            return instrument(cache) if instrumented else cache
+
+        with self._writers_lock:
+            if backend not in self._writers:
+                self._writers[backend] = BackgroundWriter(
+                    cache_accessor,
+                    workers=writer_options.get('WORKERS', 1),
+                    max_size=writer_options.get('MAX_SIZE', 1000),
+                    ordered=writer_options.get('ORDERED', True),
+                )
+            return self._writers[backend]
+
+    def get_metrics(self, backend=None):
+        """Returns outcome metrics shared by all threads, if they are enabled by METRICS option."""
+        backend = backend or DEFAULT_CACHE_ALIAS
+        metrics_options = getattr(settings, 'CACHE_TAGGING', {}).get(backend, {}).get('METRICS')
+        if not metrics_options:
+            return None
+        if not isinstance(metrics_options, dict):
+            metrics_options = {}
+        with self._metrics_lock:
+            if backend not in self._metrics:
+                self._metrics[backend] = OutcomeMetrics(
+                    max_namespaces=metrics_options.get('MAX_NAMESPACES', 100),
+                    max_tags=metrics_options.get('MAX_TAGS', 1000),
+                )
+            return self._metrics[backend]
+
     def all(self):
         return self._caches.values()
 
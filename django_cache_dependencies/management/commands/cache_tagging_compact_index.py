@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django_cache_dependencies import caches
+
+
+class Command(BaseCommand):
+
+    help = "Removes keys of expired cache records from the tag index (see CACHE_TAGGING['TAG_INDEX'])."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'alias',
+            nargs='?',
+            default='default',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help="Count of tags to sweep per run"
+        )
+
+    def handle(self, *args, **options):
+        cache = caches[options['alias']]
+        removed = cache.tag_index.compact(cache.cache.cache, limit=options['limit'])
+        self.stdout.write("Removed keys: {0}".format(removed), ending="\n")
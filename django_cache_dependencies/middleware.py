@@ -49,11 +49,25 @@ More details about how the caching works:
 
 """
 import collections
+import logging
 from django.conf import settings
-from django.utils.cache import get_cache_key, get_max_age
+from django.http import StreamingHttpResponse, JsonResponse
+from django.utils.cache import get_max_age
 
-from . import caches, DEFAULT_CACHE_ALIAS
-from .utils import patch_response_headers, learn_cache_key
+from cache_dependencies.compression import get_available_compressors, parse_accept_encoding
+from cache_dependencies.instrumentation import registry, RequestTracer
+from cache_dependencies.prefetch import PrefetchLearner
+
+from . import caches, nocache, DEFAULT_CACHE_ALIAS
+from .utils import patch_response_headers, learn_cache_key, get_cached_page, dump_response, load_response
+
+logger = logging.getLogger(__name__)
+
+
+def _get_compressor():
+    """Returns the first installed compressor of CACHE_MIDDLEWARE_COMPRESS setting."""
+    compressors = get_available_compressors(getattr(settings, 'CACHE_MIDDLEWARE_COMPRESS', ()))
+    return compressors[0] if compressors else None
 
 
 class MiddlewareMixin(object):
@@ -102,6 +116,95 @@ class TransactionMiddleware(MiddlewareMixin):
         return response
 
 
+class PrefetchMiddleware(MiddlewareMixin):
+    """
+    Learns keys and tags read by each view, and prefetches them
+    by the next request to the same view with one query.
+    Options are read from CACHE_TAGGING[alias]['PREFETCH'].
+    """
+    def __init__(self, get_response=None, cache_alias=None):
+        self.get_response = get_response
+        self.cache_alias = cache_alias or DEFAULT_CACHE_ALIAS
+        options = getattr(settings, 'CACHE_TAGGING', {}).get(self.cache_alias, {}).get('PREFETCH') or {}
+        if not isinstance(options, dict):
+            options = {}
+        self.learner = PrefetchLearner(
+            decay=options.get('DECAY', 0.8),
+            threshold=options.get('THRESHOLD', 0.3),
+            max_items=options.get('MAX_ITEMS', 500),
+            sample_rate=options.get('SAMPLE_RATE', 0.1),
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is not None and resolver_match.view_name:
+            name = resolver_match.view_name
+        else:
+            name = '{0}.{1}'.format(view_func.__module__, getattr(view_func, '__name__', view_func.__class__.__name__))
+        cache = caches[self.cache_alias].cache
+        request._cache_prefetch = (name, self.learner.prefetch(cache, name))
+        return None
+
+    def process_response(self, request, response):
+        if hasattr(request, '_cache_prefetch'):
+            name, model = request._cache_prefetch
+            del request._cache_prefetch
+            self.learner.learn(caches[self.cache_alias].cache, name, model)
+        return response
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """
+    Collects stats of backend calls of instrumented caches
+    (CACHE_TAGGING[alias]['INSTRUMENT']) made by the current request.
+    Used as the first middleware in settings.MIDDLEWARE.
+    """
+    def process_request(self, request):
+        request.cache_stats = registry.begin_request()
+
+    def process_response(self, request, response):
+        request_stats = registry.end_request()
+        if request_stats is not None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Cache round-trips of %s: %r", request.path, request_stats.summary())
+        return response
+
+
+class TimelineMiddleware(InstrumentationMiddleware):
+    """
+    Records timeline of cache operations and the tree of fragments of the request,
+    and exposes total time of each operation by Server-Timing header.
+    With DEBUG the whole timeline is returned as JSON, if the request has
+    query parameter CACHE_MIDDLEWARE_TIMELINE_PARAM ("cache_timeline" by default).
+    Used as the first middleware in settings.MIDDLEWARE instead of InstrumentationMiddleware.
+    """
+    def __init__(self, get_response=None, cache_alias=None):
+        super(TimelineMiddleware, self).__init__(get_response)
+        self.cache_alias = cache_alias or DEFAULT_CACHE_ALIAS
+        self.param = getattr(settings, 'CACHE_MIDDLEWARE_TIMELINE_PARAM', 'cache_timeline')
+
+    def process_request(self, request):
+        super(TimelineMiddleware, self).process_request(request)
+        request.cache_timeline = RequestTracer(request.cache_stats)
+        request.cache_timeline.install(caches[self.cache_alias].cache)
+
+    def process_response(self, request, response):
+        response = super(TimelineMiddleware, self).process_response(request, response)
+        tracer = getattr(request, 'cache_timeline', None)
+        if tracer is None:
+            return response
+        tracer.uninstall()
+        if settings.DEBUG and self.param in request.GET:
+            return JsonResponse(tracer.to_dict())
+        server_timing = tracer.server_timing()
+        if server_timing:
+            if response.has_header('Server-Timing'):
+                server_timing = '{0}, {1}'.format(response['Server-Timing'], server_timing)
+            response['Server-Timing'] = server_timing
+        return response
+
+
 class UpdateCacheMiddleware(MiddlewareMixin):
     """
     Response-phase cache middleware that updates the cache if the response is
@@ -116,6 +219,7 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         self.key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
         self.cache_anonymous_only = getattr(settings, 'CACHE_MIDDLEWARE_ANONYMOUS_ONLY', False)
         self.cache_alias = settings.CACHE_MIDDLEWARE_ALIAS
+        self.compressor = _get_compressor()
         self.get_response = get_response
 
     # patch start
@@ -175,10 +279,10 @@ class UpdateCacheMiddleware(MiddlewareMixin):
             cache_key = learn_cache_key(request, response, tags, timeout, self.key_prefix, cache=self.cache)  # patched
             if hasattr(response, 'render') and isinstance(response.render, collections.Callable):
                 response.add_post_render_callback(
-                    lambda r: self.cache.set(cache_key, r, tags, timeout)  # patched
+                    lambda r: self.cache.set(cache_key, dump_response(r, self.compressor), tags, timeout)  # patched
                 )
             else:
-                self.cache.set(cache_key, response, tags, timeout)  # patched
+                self.cache.set(cache_key, dump_response(response, self.compressor), tags, timeout)  # patched
         # patch end
         return response
 
@@ -196,12 +300,30 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
         self.key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
         self.cache_anonymous_only = getattr(settings, 'CACHE_MIDDLEWARE_ANONYMOUS_ONLY', False)
         self.cache_alias = settings.CACHE_MIDDLEWARE_ALIAS
+        self.nocache = getattr(settings, 'CACHE_MIDDLEWARE_NOCACHE', False)
+        self.nocache_chunk_size = getattr(settings, 'CACHE_MIDDLEWARE_NOCACHE_CHUNK_SIZE', 8192)
         self.get_response = get_response
 
     # patch start
     @property
     def cache(self):
         return caches[self.cache_alias]
+
+    def _stream_nocache(self, request, response):
+        """Streams cached page with evaluation of nocache blocks."""
+        if getattr(response, 'streaming', None):
+            return response
+        content = response.content
+        chunks = (content[i:i + self.nocache_chunk_size] for i in range(0, len(content), self.nocache_chunk_size))
+        streaming_response = StreamingHttpResponse(
+            nocache.iter_handle(chunks, encoding=response.charset, request=request),
+            status=response.status_code
+        )
+        for header, value in response.items():
+            if header.lower() != 'content-length':
+                streaming_response[header] = value
+        streaming_response.cookies = response.cookies
+        return streaming_response
     # patch end
 
     def process_request(self, request):
@@ -214,15 +336,11 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
             return None  # Don't bother checking the cache.
 
         # try and get the cached GET response
-        cache_key = get_cache_key(request, self.key_prefix, 'GET', cache=self.cache)
-        if cache_key is None:
-            request._cache_update_cache = True
-            return None  # No cache information available, need to rebuild.
-        response = self.cache.get(cache_key)
         # if it wasn't found and we are looking for a HEAD, try looking just for that
-        if response is None and request.method == 'HEAD':
-            cache_key = get_cache_key(request, self.key_prefix, 'HEAD', cache=self.cache)
-            response = self.cache.get(cache_key)
+        # patch start
+        # Header list and pages are fetched together.
+        response = get_cached_page(request, self.key_prefix, cache=self.cache)
+        # patch end
 
         if response is None:
             request._cache_update_cache = True
@@ -230,6 +348,20 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
 
         # hit, return cached response
         request._cache_update_cache = False
+        # patch start
+        # Pages cached before are pickled responses.
+        if isinstance(response, bytes):
+            if self.nocache:
+                accepted_encodings = None
+            else:
+                accepted_encodings = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            response = load_response(response, accepted_encodings)
+            if response is None:
+                request._cache_update_cache = True
+                return None
+        if self.nocache:
+            response = self._stream_nocache(request, response)
+        # patch end
         return response
 
 
@@ -252,6 +384,8 @@ class CacheMiddleware(UpdateCacheMiddleware, FetchFromCacheMiddleware):
             self.tags = kwargs['tags']
         except KeyError:
             self.tags = lambda request: ()
+        self.nocache = kwargs.get('nocache', getattr(settings, 'CACHE_MIDDLEWARE_NOCACHE', False))
+        self.compressor = _get_compressor()
         # patch end
 
         try:
@@ -2,6 +2,7 @@
 from __future__ import absolute_import, unicode_literals
 import re
 import copy
+from uuid import uuid4
 
 from django.core import urlresolvers
 from django.template.loader import render_to_string
@@ -64,63 +65,74 @@ class CacheNode(Node):
 
     def render(self, context):
         cache_name = self.fragment_name.resolve(context)
-        result = cache.get(cache_name)
+        batch = context.get('cache_tagging_batch')
+        if batch is not None:
+            return batch.add(self, cache_name, context)
 
+        result = cache.get(cache_name)
         if not result:
-            timeout = None
-            if self.timeout_var:
-                try:
-                    timeout = self.timeout_var.resolve(context)
-                except VariableDoesNotExist:
-                    raise TemplateSyntaxError(
-                        '"cache" tag got an unknkown variable: {0}'.format(
-                            self.timeout_var.var
-                        )
+            result = self.render_nodelist(context, cache_name)
+        return self.postprocess(context, result)
+
+    def render_nodelist(self, context, cache_name):
+        timeout = None
+        if self.timeout_var:
+            try:
+                timeout = self.timeout_var.resolve(context)
+            except VariableDoesNotExist:
+                raise TemplateSyntaxError(
+                    '"cache" tag got an unknkown variable: {0}'.format(
+                        self.timeout_var.var
                     )
-                try:
-                    timeout = int(timeout)
-                except (ValueError, TypeError):
-                    raise TemplateSyntaxError(
-                        '"cache" tag got a non-integer timeout value: {0}'.fomat(
-                            timeout
-                        )
+                )
+            try:
+                timeout = int(timeout)
+            except (ValueError, TypeError):
+                raise TemplateSyntaxError(
+                    '"cache" tag got a non-integer timeout value: {0}'.fomat(
+                        timeout
                     )
+                )
+
+        tags = [x.resolve(context) for x in self.vary_on]
+        if 'tags' in self.kwargs:
+            tags += self.kwargs['tags'].resolve(context)
+
+        # We can also add a new tags during nodelist is rendering.
+        # And prevent caching.
+        if not 'cache_tagging_prevent' in context:
+            context['cache_tagging_prevent'] = False
+
+        sub_context = copy.copy(context)
+        sub_context['cache_tagging'] = set(tags)
+        # Allows nested caching
+        sub_context['cache_tagging_prevent'] = False
+        # Nested fragments are rendered immediately
+        sub_context['cache_tagging_batch'] = None
+        result = self.nodelist.render(sub_context)
+        tags = sub_context['cache_tagging']
+
+        # Prevent caching of ancestor
+        if sub_context['cache_tagging_prevent']:
+            context['cache_tagging_prevent'] = True
+        prevent = sub_context['cache_tagging_prevent']
+
+        if 'request' in context:
+            request = context['request']
+            if not hasattr(request, 'cache_tagging'):
+                request.cache_tagging = set()
+            if isinstance(request.cache_tagging, set):
+                request.cache_tagging.update(tags)
+            if context['cache_tagging_prevent']:
+                prevent_cache_page(request)
+
+        if not prevent:
+            cache.set(cache_name, result, tags, timeout)
+        else:
+            cache.abort(cache_name)
+        return result
 
-            tags = [x.resolve(context) for x in self.vary_on]
-            if 'tags' in self.kwargs:
-                tags += self.kwargs['tags'].resolve(context)
-
-            # We can also add a new tags during nodelist is rendering.
-            # And prevent caching.
-            if not 'cache_tagging_prevent' in context:
-                context['cache_tagging_prevent'] = False
-
-            sub_context = copy.copy(context)
-            sub_context['cache_tagging'] = set(tags)
-            # Allows nested caching
-            sub_context['cache_tagging_prevent'] = False
-            result = self.nodelist.render(sub_context)
-            tags = sub_context['cache_tagging']
-
-            # Prevent caching of ancestor
-            if sub_context['cache_tagging_prevent']:
-                context['cache_tagging_prevent'] = True
-            prevent = sub_context['cache_tagging_prevent']
-
-            if 'request' in context:
-                request = context['request']
-                if not hasattr(request, 'cache_tagging'):
-                    request.cache_tagging = set()
-                if isinstance(request.cache_tagging, set):
-                    request.cache_tagging.update(tags)
-                if context['cache_tagging_prevent']:
-                    prevent_cache_page(request)
-
-            if not prevent:
-                cache.set(cache_name, result, tags, timeout)
-            else:
-                cache.abort(cache_name)
-
+    def postprocess(self, context, result):
         if 'nocache' in self.kwargs and self.kwargs['nocache'].resolve(context):
             context_dict = {}
             for d in context.dicts:
@@ -155,6 +167,72 @@ class CacheNode(Node):
         return result
 
 
+class CacheBatch(object):
+    """Collects fragments of {% cache_tagging_batch %} to fetch them by single cache.get_many()."""
+
+    def __init__(self):
+        self.prefix = '\x00cache_tagging_batch:{0}:'.format(uuid4().hex)
+        self.fragments = []
+
+    def add(self, node, cache_name, context):
+        """Returns placeholder of fragment."""
+        # Loop variables are changed in place, so, each dict of context is copied.
+        fragment_context = copy.copy(context)
+        fragment_context.dicts = [self._copy_dict(d) for d in context.dicts]
+        self.fragments.append((node, cache_name, fragment_context))
+        return '{0}{1}\x00'.format(self.prefix, len(self.fragments) - 1)
+
+    @classmethod
+    def _copy_dict(cls, d):
+        d = copy.copy(d)
+        if isinstance(d, dict) and isinstance(d.get('forloop'), dict):
+            # {% for %} changes the same forloop dict (and the dicts of outer loops) on each iteration.
+            d['forloop'] = cls._copy_forloop(d['forloop'])
+        return d
+
+    @classmethod
+    def _copy_forloop(cls, forloop):
+        forloop = dict(forloop)
+        if isinstance(forloop.get('parentloop'), dict):
+            forloop['parentloop'] = cls._copy_forloop(forloop['parentloop'])
+        return forloop
+
+    def resolve(self, context, result):
+        """Substitutes placeholders by cached fragments, and renders the missed ones."""
+        if not self.fragments:
+            return result
+        hits = cache.get_many(list(set(cache_name for node, cache_name, fragment_context in self.fragments)))
+
+        outputs = []
+        for node, cache_name, fragment_context in self.fragments:
+            fragment = hits.get(cache_name)
+            if not fragment:
+                cache.begin(cache_name)
+                fragment = node.render_nodelist(fragment_context, cache_name)
+                if fragment_context['cache_tagging_prevent']:
+                    context['cache_tagging_prevent'] = True
+                else:
+                    hits[cache_name] = fragment
+            outputs.append(node.postprocess(fragment_context, fragment))
+
+        placeholder_re = re.compile('{0}(\\d+)\x00'.format(re.escape(self.prefix)))
+        return placeholder_re.sub(lambda m: outputs[int(m.group(1))], result)
+
+
+class CacheBatchNode(Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        batch = CacheBatch()
+        context.update({'cache_tagging_batch': batch})
+        try:
+            result = self.nodelist.render(context)
+        finally:
+            context.pop()
+        return mark_safe(batch.resolve(context, result))
+
+
 def do_cache(parser, token):
     """
     This will cache the contents of a template fragment for a given amount
@@ -210,6 +288,32 @@ def cache_tagging_prevent(context):
 register.tag('cache_tagging', do_cache)
 
 
+def do_cache_batch(parser, token):
+    """
+    Fetches all {% cache_tagging %} fragments of the body by single query.
+
+    The body is rendered with placeholders instead of fragments,
+    then cached fragments are fetched at once, and only the missed ones are rendered.
+    Fragments should not be placed inside filters which change the output.
+
+    Usage::
+
+        {% load cache_tagging_tags %}
+        {% cache_tagging_batch %}
+            {% for entry in entries %}
+                {% cache_tagging 'entry'|concat:entry.pk 'blog.entry.pk:'|concat:entry.pk %}
+                    .. some expensive processing ..
+                {% end_cache_tagging %}
+            {% endfor %}
+        {% end_cache_tagging_batch %}
+    """
+    nodelist = parser.parse(('end_cache_tagging_batch',))
+    parser.delete_first_token()
+    return CacheBatchNode(nodelist)
+
+register.tag('cache_tagging_batch', do_cache_batch)
+
+
 @register.simple_tag
 def nocache(**kwargs):
     return mark_safe(nocache_handler.start(**kwargs))
@@ -5,12 +5,17 @@ from uuid import uuid4
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.http import HttpResponse
 from django.template import Context, Template
 from django.test import TestCase
 from django.test.client import RequestFactory
 
-from .. import cache, caches, registry
+from cache_dependencies.compression import get_compressor
+
+from .. import cache, caches, nocache, registry
 from ..decorators import cache_transaction_all
+from ..middleware import FetchFromCacheMiddleware
+from ..utils import dump_response, load_response, get_cached_page, learn_cache_key
 
 
 class FirstTestModel(models.Model):
@@ -192,6 +197,66 @@ class CacheTaggingIntegrationTest(TestCase):
         self.assertNotEqual(resp1.content, resp4.content)
         cache.invalidate_tags('tests.firsttestmodel')
 
+    def test_get_cached_page_relations(self):
+        request = RequestFactory().get('/page/')
+        page_key = learn_cache_key(request, HttpResponse('page'), ('tests.page',), 60, cache=cache)
+        cache.close()
+
+        # Page is missed, and the view builds a nested fragment.
+        self.assertIsNone(get_cached_page(request, cache=cache))
+        self.assertIsNone(cache.get('fragment'))
+        cache.set('fragment', 'fragment', ('tests.fragment',))
+        cache.set(page_key, 'page', ('tests.page',), 60)
+        cache.close()
+        self.assertEqual(get_cached_page(request, cache=cache), 'page')
+        cache.close()
+
+        cache.invalidate_tags('tests.fragment')
+        self.assertIsNone(get_cached_page(request, cache=cache))
+        cache.close()
+
+    def test_dump_response(self):
+        response = HttpResponse('юникод', content_type='text/plain; charset=utf-8', status=203)
+        response['X-Header'] = 'value'
+        response.set_cookie('name', 'value', max_age=10)
+        data = dump_response(response)
+        self.assertIsInstance(data, bytes)
+        restored = load_response(data)
+        self.assertEqual(restored.status_code, 203)
+        self.assertEqual(restored.content, response.content)
+        self.assertEqual(restored['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(restored['X-Header'], 'value')
+        self.assertEqual(restored.cookies['name'].value, 'value')
+        self.assertIsNone(load_response(response))
+
+    def test_dump_response_compressed(self):
+        response = HttpResponse('content' * 100, content_type='text/plain; charset=utf-8')
+        response['ETag'] = '"etag"'
+        data = dump_response(response, get_compressor('gzip'))
+        self.assertLess(len(data), len(response.content))
+
+        restored = load_response(data, {'gzip'})
+        self.assertEqual(restored['Content-Encoding'], 'gzip')
+        self.assertEqual(restored['ETag'], 'W/"etag"')
+        self.assertIn('Accept-Encoding', restored['Vary'])
+        self.assertEqual(get_compressor('gzip').decompress(restored.content), response.content)
+
+        restored = load_response(data, {'br'})
+        self.assertFalse(restored.has_header('Content-Encoding'))
+        self.assertEqual(restored.content, response.content)
+
+    def test_stream_nocache(self):
+        response = HttpResponse(
+            'head ' * 10 + nocache.start() + 'echo(request.method)' + nocache.end() + ' tail' * 10,
+            content_type='text/html; charset=utf-8'
+        )
+        middleware = FetchFromCacheMiddleware()
+        middleware.nocache_chunk_size = 16
+        streaming_response = middleware._stream_nocache(RequestFactory().get('/'), response)
+        chunks = list(streaming_response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), b'head ' * 10 + b'GET' + b' tail' * 10)
+
     def test_templatetag_nocache(self):
         cache.invalidate_tags('tag1')
         t = Template("""
@@ -323,6 +388,60 @@ class CacheTaggingIntegrationTest(TestCase):
                               'tests.firsttestmodel',
                               'tests.secondtestmodel.pk:{0}'.format(self.obj2.pk))
 
+    def test_templatetag_batch(self):
+        t = Template("""
+            {% load cache_tagging_tags %}
+            {% cache_tagging_batch %}
+                {% for pk in pks %}
+                    {% cache_tagging 'entry'|concat:pk 'tests.entry.pk:'|concat:pk %}
+                        [{{ pk }}:{{ now }}]
+                    {% end_cache_tagging %}
+                {% endfor %}
+            {% end_cache_tagging_batch %}
+            """)
+        c = Context({
+            'request': RequestFactory().get('/'),
+            'now': uuid4(),
+            'pks': [1, 2, 3],
+        })
+
+        r1 = t.render(c)
+        for pk in (1, 2, 3):
+            self.assertIn('[{0}:{1}]'.format(pk, c['now']), r1)
+        self.assertNotIn('\x00', r1)
+
+        c.update({'now': uuid4(), })
+        r2 = t.render(c)
+        self.assertEqual(r1, r2)
+
+        cache.invalidate_tags('tests.entry.pk:2')
+        c.update({'now': uuid4(), })
+        r3 = t.render(c)
+        self.assertIn('[2:{0}]'.format(c['now']), r3)
+        self.assertNotIn('[1:{0}]'.format(c['now']), r3)
+
+    def test_templatetag_batch_forloop(self):
+        t = Template("""
+            {% load cache_tagging_tags %}
+            {% cache_tagging_batch %}
+                {% for group in groups %}
+                    {% for pk in group %}
+                        {% cache_tagging 'loop_entry'|concat:pk 'tests.entry.pk:'|concat:pk %}
+                            [{{ pk }}:{{ forloop.counter }}:{{ forloop.parentloop.counter }}:{{ forloop.last }}]
+                        {% end_cache_tagging %}
+                    {% endfor %}
+                {% endfor %}
+            {% end_cache_tagging_batch %}
+            """)
+        c = Context({
+            'request': RequestFactory().get('/'),
+            'groups': [[1, 2], [3]],
+        })
+        r = t.render(c)
+        self.assertIn('[1:1:1:False]', r)
+        self.assertIn('[2:2:1:True]', r)
+        self.assertIn('[3:1:2:True]', r)
+
     def test_templatetag_prevent(self):
         t = Template("""
             {% load cache_tagging_tags %}
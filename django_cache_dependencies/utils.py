@@ -1,13 +1,107 @@
 from __future__ import absolute_import, unicode_literals
+import struct
 import hashlib
 from django.conf import settings
+from django.http import HttpResponse
 from django.utils.http import http_date
-from django.utils.cache import cc_delim_re, _generate_cache_key,\
+from django.utils.cache import cc_delim_re, patch_vary_headers, _generate_cache_key,\
     _generate_cache_header_key
+from cache_dependencies import compression
 
 from . import caches
 
 
+RESPONSE_MAGIC = b'CDR1'
+MIN_COMPRESS_LENGTH = 200
+_response_head = struct.Struct('!4sHHH')
+_string_length = struct.Struct('!I')
+
+
+def dump_response(response, compressor=None):
+    """Serializes response for page cache to compact bytes instead of pickling of the object.
+
+    Layout: magic, status, count of headers, count of cookies,
+    length-prefixed UTF-8 strings of content-coding of body, headers (name, value)
+    and cookies, body.
+    Body is compressed by compressor, if it's given and it makes body smaller.
+
+    :type response: django.http.HttpResponse
+    :type compressor: cache_dependencies.interfaces.ICompressor or None
+    :rtype: bytes
+    """
+    body = response.content
+    encoding = ''
+    if (compressor is not None and len(body) >= MIN_COMPRESS_LENGTH and
+            not response.has_header('Content-Encoding')):
+        compressed_body = compressor.compress(body)
+        if len(compressed_body) < len(body):
+            body, encoding = compressed_body, compressor.name
+    headers = [i for pair in response.items() for i in pair]
+    cookies = [morsel.OutputString() for morsel in response.cookies.values()]
+    parts = [_response_head.pack(RESPONSE_MAGIC, response.status_code, len(headers) // 2, len(cookies))]
+    for value in [encoding] + headers + cookies:
+        value = value.encode('utf-8')
+        parts.append(_string_length.pack(len(value)))
+        parts.append(value)
+    parts.append(body)
+    return b''.join(parts)
+
+
+def load_response(data, accepted_encodings=None):
+    """Restores response serialized by dump_response().
+
+    Strings are decoded from memoryview slices, so, only the body is copied.
+    Compressed body is served as is, if its content-coding is in accepted_encodings,
+    otherwise it's decompressed.
+    Returns None if data is not a serialized response,
+    or if the package of its compressor is not installed, or if the body can't be decompressed.
+
+    :type data: bytes
+    :type accepted_encodings: set[str] or None
+    :rtype: django.http.HttpResponse or None
+    """
+    if not isinstance(data, bytes) or data[:len(RESPONSE_MAGIC)] != RESPONSE_MAGIC:
+        return None
+    view = memoryview(data)
+    magic, status, headers_count, cookies_count = _response_head.unpack_from(view)
+    offset = _response_head.size
+    strings = []
+    for i in range(1 + headers_count * 2 + cookies_count):
+        length, = _string_length.unpack_from(view, offset)
+        offset += _string_length.size
+        strings.append(view[offset:offset + length].tobytes().decode('utf-8'))
+        offset += length
+    encoding, headers, cookies = strings[0], strings[1:1 + headers_count * 2], strings[1 + headers_count * 2:]
+    body = view[offset:].tobytes()
+    served_encoding = None
+    if encoding:
+        if accepted_encodings and (encoding in accepted_encodings or '*' in accepted_encodings):
+            served_encoding = encoding
+        else:
+            compressor = compression.get_compressor(encoding)
+            if compressor is None:
+                return None
+            try:
+                body = compressor.decompress(body)
+            except Exception:  # Each codec has own error type, corrupted body is a miss.
+                return None
+    response = HttpResponse(body, status=status)
+    for i in range(0, len(headers), 2):
+        response[headers[i]] = headers[i + 1]
+    for cookie in cookies:
+        response.cookies.load(str(cookie))
+    if encoding:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    if served_encoding:
+        response['Content-Encoding'] = served_encoding
+        response['Content-Length'] = str(len(body))
+        if response.has_header('ETag') and response['ETag'].startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+    elif response.has_header('Content-Length'):
+        response['Content-Length'] = str(len(body))
+    return response
+
+
 def prevent_cache_page(request):
     """Prevent page caching"""
     request._cache_update_cache = False
@@ -49,6 +143,47 @@ def patch_response_headers(response, cache_timeout=None):
     # patch end
 
 
+def get_cached_page(request, key_prefix=None, cache=None):
+    """
+    Returns the cached page for the request or None.
+
+    Unlike get_cache_key() followed by cache.get(), the header list and
+    the pages for GET (and HEAD) are fetched by one get_many() with one
+    validation of tags. The page keys are guessed for the empty header list
+    (response without Vary header), which is the most common case. Otherwise
+    the pages are fetched by the second get_many().
+    """
+    if key_prefix is None:
+        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+    if cache is None:
+        cache = caches[settings.CACHE_MIDDLEWARE_ALIAS]
+    methods = ['GET']
+    if request.method == 'HEAD':
+        methods.append('HEAD')
+
+    def make_keys(headerlist):
+        return [_generate_cache_key(request, method, headerlist, key_prefix) for method in methods]
+
+    header_key = _generate_cache_header_key(key_prefix, request)
+    page_keys = make_keys([])
+    # Relations are not started by get_many(), because it restores the current node,
+    # but the missed entries must be the current nodes like after get(),
+    # so, that tags of nested fragments are added to the page rebuilt by the view.
+    result = cache.get_many([header_key] + page_keys, abort=True)
+    headerlist = result.get(header_key)
+    if headerlist is None:
+        cache.begin(header_key)
+        return None
+    if headerlist:
+        page_keys = make_keys(headerlist)
+        result = cache.get_many(page_keys, abort=True)
+    for page_key in page_keys:
+        if result.get(page_key) is not None:
+            return result[page_key]
+        cache.begin(page_key)
+    return None
+
+
 def learn_cache_key(request, response, tags=(), cache_timeout=None, key_prefix=None, cache=None):  # patched
     """
     Learns what headers to take into account for some request URL from the
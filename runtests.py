@@ -72,13 +72,22 @@ def main():
 
     test_runner = TestRunner(verbosity=1, interactive=False, failfast=False)
     failures = test_runner.run_tests([
+        'cache_dependencies.tests.test_backends',
+        'cache_dependencies.tests.test_bench',
+        'cache_dependencies.tests.test_compression',
         'cache_dependencies.tests.test_cache',
         'cache_dependencies.tests.test_defer',
         'cache_dependencies.tests.test_dependencies',
         'cache_dependencies.tests.test_helpers',
+        'cache_dependencies.tests.test_index',
+        'cache_dependencies.tests.test_instrumentation',
+        'cache_dependencies.tests.test_nocache',
+        'cache_dependencies.tests.test_prefetch',
         'cache_dependencies.tests.test_relations',
         'cache_dependencies.tests.test_locks',
+        'cache_dependencies.tests.test_tracing',
         'cache_dependencies.tests.test_transaction',
+        'cache_dependencies.tests.test_writers',
         'cache_dependencies.tests.test_tagging',
         'django_cache_dependencies.tests',
     ])